@@ -6,35 +6,88 @@ Asset management and versioning for static resources.
 import os
 import json
 import hashlib
+import mmap
 from pathlib import Path
-from typing import Dict, List, Optional, Set
+from typing import Any, Dict, List, Optional, Set, Tuple
 import re
-from concurrent.futures import ThreadPoolExecutor
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from build_logger import setup_logging, BuildError
 
 logger = setup_logging('asset_manager')
 
+# HTML中的资源引用：href="..."、src='...' 或逗号分隔的 data-lazy-scripts="..."
+RE_ASSET_REF = re.compile(r"""\b(href|src|data-lazy-scripts)=(["'])([^"']+)\2""")
+
+# 超过该大小的文件通过mmap计算哈希
+MMAP_THRESHOLD = 1024 * 1024
+
+# 构建时压缩的资源类型
+MINIFIABLE_SUFFIXES = {'.js', '.css'}
+
+# 不作为站点资源处理的目录（测试、覆盖率报告、依赖）
+EXCLUDED_DIRS = {'tests', 'node_modules'}
+
+# 版本化文件名：name.<hash>.ext
+RE_VERSIONED = re.compile(r"^(?P<stem>.+)\.(?P<hash>[0-9a-f]{8})(?P<ext>\.[^.]+)$")
+
+# 默认保留的版本数（含当前版本），供仍缓存旧页面的客户端使用
+DEFAULT_KEEP_GENERATIONS = 3
+
+def load_output_config(root_dir: Path) -> Dict[str, Any]:
+    """读取 build.config.json 中的输出配置"""
+    config_file = root_dir / 'build.config.json'
+    if not config_file.exists():
+        return {}
+    try:
+        return json.loads(config_file.read_text()).get('output', {})
+    except Exception as e:
+        logger.warning(f"Failed to load build config: {e}")
+        return {}
+
 class AssetManager:
     """管理静态资源的版本控制和缓存策略"""
     
-    def __init__(self, root_dir: Path):
+    def __init__(self, root_dir: Path, minify: Optional[bool] = None,
+                 bundle: Optional[bool] = None, keep_generations: Optional[int] = None,
+                 critical_css: Optional[bool] = None):
         self.root_dir = root_dir
         self.docs_dir = root_dir / 'docs'
+        # 旧版本写出的清单文件，首次运行时导入构建状态数据库后删除
         self.manifest_file = self.docs_dir / 'assets' / 'manifest.json'
-        self.manifest: Dict[str, str] = {}
         
-        # 加载现有的manifest
-        if self.manifest_file.exists():
+        # 是否压缩JS/CSS、合并页面脚本，默认读取 build.config.json 的 output 配置
+        output_config = load_output_config(root_dir)
+        self.minify = output_config.get('minification', False) if minify is None else minify
+        self.bundle = output_config.get('bundling', False) if bundle is None else bundle
+        self.critical_css = output_config.get('critical_css', False) if critical_css is None else critical_css
+        if keep_generations is None:
+            keep_generations = output_config.get('asset_generations', DEFAULT_KEEP_GENERATIONS)
+        self.keep_generations = max(1, keep_generations)
+        
+        # 资源相对路径 -> {'hash', 'size', 'mtime'[, 'output_size', 'history']}
+        # history 为之前各版本的哈希，最近的在前；保存在构建状态数据库中
+        from build_state import get_build_state
+        self.state = get_build_state(self.root_dir)
+        self.manifest: Dict[str, Dict[str, Any]] = self.state.load_assets()
+        
+        # 导入旧的manifest文件
+        if not self.manifest and self.manifest_file.exists():
             try:
-                self.manifest = json.loads(self.manifest_file.read_text())
+                manifest = json.loads(self.manifest_file.read_text())
+                # 兼容旧格式：路径 -> 哈希
+                self.manifest = {
+                    rel_path: entry if isinstance(entry, dict) else {'hash': entry}
+                    for rel_path, entry in manifest.items()
+                }
             except Exception as e:
                 logger.warning(f"Failed to load manifest: {e}")
         
         # 资源类型配置
         self.asset_types = {
             'js': {'dir': 'js', 'ext': '.js'},
-            'css': {'dir': 'styles', 'ext': '.css'},
+            'css': {'dir': '.', 'ext': '.css', 'recursive': False},
             'images': {'dir': 'images', 'ext': ('.jpg', '.jpeg', '.png', '.webp')},
             'fonts': {'dir': 'fonts', 'ext': ('.woff2', '.woff', '.ttf')}
         }
@@ -42,23 +95,46 @@ class AssetManager:
     def process_assets(self) -> None:
         """处理所有静态资源"""
         try:
-            # 处理每种类型的资源
+            # 先合并页面脚本，生成的分块随JS资源一起版本化
+            if self.bundle:
+                from bundle_assets import ScriptBundler
+                ScriptBundler(self.docs_dir).bundle()
+            
+            # 收集每种类型的资源
+            files: List[Path] = []
+            versioned_files: List[Path] = []
             for asset_type, config in self.asset_types.items():
                 asset_dir = self.docs_dir / config['dir']
                 if not asset_dir.exists():
                     continue
                 
-                logger.info(f"Processing {asset_type} assets...")
-                
                 # 获取所有匹配的文件
-                files = []
+                matched = []
                 exts = config['ext'] if isinstance(config['ext'], tuple) else (config['ext'],)
+                glob = asset_dir.rglob if config.get('recursive', True) else asset_dir.glob
                 for ext in exts:
-                    files.extend(asset_dir.rglob(f"*{ext}"))
+                    matched.extend(glob(f"*{ext}"))
                 
-                # 并行处理文件
-                with ThreadPoolExecutor() as executor:
-                    executor.map(self._process_file, files)
+                # 跳过测试目录；已生成的版本化副本不再哈希，留待清理
+                matched = [f for f in matched if not EXCLUDED_DIRS.intersection(f.relative_to(asset_dir).parts)]
+                versioned_files.extend(f for f in matched if RE_VERSIONED.match(f.name))
+                matched = [f for f in matched if not RE_VERSIONED.match(f.name)]
+                logger.info(f"Processing {len(matched)} {asset_type} assets...")
+                files.extend(matched)
+            
+            # 并行处理文件，结果统一合并到manifest
+            self._process_files(files)
+            
+            if self.minify:
+                self._log_minification_summary()
+            
+            # 删除超出保留代数的旧版本以及源文件已删除的资源
+            self._prune_versions(versioned_files)
+            
+            # 按当前样式表版本内联关键CSS，随后的引用更新使完整样式表指向同一版本
+            if self.critical_css:
+                from critical_css import CriticalCssInliner
+                CriticalCssInliner(self.docs_dir, self.versioned_names()).inline()
             
             # 保存manifest
             self._save_manifest()
@@ -70,41 +146,155 @@ class AssetManager:
             logger.error(f"Asset processing failed: {e}")
             raise BuildError("Failed to process assets") from e
     
-    def _process_file(self, file_path: Path) -> None:
-        """处理单个文件"""
-        try:
-            # 计算文件哈希
-            file_hash = self._compute_file_hash(file_path)
-            
-            # 生成版本化的文件名
-            versioned_name = self._get_versioned_name(file_path, file_hash)
-            versioned_path = file_path.parent / versioned_name
-            
-            # 如果文件已经存在且哈希匹配，跳过
+    def _process_files(self, files: List[Path]) -> None:
+        """并行处理文件；工作线程只返回结果，由这里统一更新manifest并汇总失败"""
+        failures: List[str] = []
+        with ThreadPoolExecutor() as executor:
+            futures = {executor.submit(self._process_file, f): f for f in files}
+            for future in as_completed(futures):
+                try:
+                    rel_path, entry = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to process {futures[future]}: {e}")
+                    failures.append(str(futures[future]))
+                    continue
+                if entry is not None:
+                    self.manifest[rel_path] = entry
+        
+        if failures:
+            raise BuildError(f"Failed to process {len(failures)} of {len(files)} assets: {', '.join(sorted(failures))}")
+    
+    def _process_file(self, file_path: Path) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """处理单个文件，返回 (相对路径, 新的manifest条目)；未变化时条目为None。只读manifest，可并发运行"""
+        rel_path = str(file_path.relative_to(self.docs_dir))
+        stat = file_path.stat()
+        entry = self.manifest.get(rel_path, {})
+        
+        # 大小和修改时间都未变化时直接复用记录的哈希
+        if entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime_ns:
+            versioned_path = file_path.parent / self._get_versioned_name(file_path, entry['hash'])
             if versioned_path.exists():
-                old_hash = self.manifest.get(str(file_path.relative_to(self.docs_dir)))
-                if old_hash == file_hash:
-                    return
-            
-            # 复制文件到新的版本化路径
-            import shutil
-            shutil.copy2(file_path, versioned_path)
-            
-            # 更新manifest
-            rel_path = str(file_path.relative_to(self.docs_dir))
-            self.manifest[rel_path] = file_hash
-            
+                return rel_path, None
+        
+        # JS/CSS 先压缩，版本号取压缩结果的哈希
+        minified = self._minify(file_path) if file_path.suffix in MINIFIABLE_SUFFIXES else None
+        
+        # 计算文件哈希
+        if minified is not None:
+            file_hash = hashlib.sha1(minified).hexdigest()[:8]
+        else:
+            file_hash = self._compute_file_hash(file_path)
+        
+        # 生成版本化的文件名
+        versioned_name = self._get_versioned_name(file_path, file_hash)
+        versioned_path = file_path.parent / versioned_name
+        
+        # 内容变化时把上一版本记入历史
+        history = list(entry.get('history', []))
+        if entry.get('hash') and entry['hash'] != file_hash:
+            previous = file_path.parent / self._get_versioned_name(file_path, entry['hash'])
+            if previous.exists() and os.path.samefile(previous, file_path):
+                # 硬链接的旧版本随源文件被原地修改，内容已不对应其哈希
+                previous.unlink()
+            else:
+                history.insert(0, entry['hash'])
+        history = [h for h in history if h != file_hash][:self.keep_generations - 1]
+        
+        # 如果版本化文件已经存在且哈希匹配，只更新文件状态
+        if not (versioned_path.exists() and entry.get('hash') == file_hash):
+            if minified is not None:
+                versioned_path.write_bytes(minified)
+            else:
+                self._link_or_copy(file_path, versioned_path)
             logger.info(f"Processed asset: {rel_path}")
-            
+        
+        # 新的manifest条目
+        new_entry = {
+            'hash': file_hash,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns
+        }
+        if minified is not None:
+            new_entry['output_size'] = len(minified)
+        if history:
+            new_entry['history'] = history
+        return rel_path, new_entry
+    
+    def _link_or_copy(self, file_path: Path, versioned_path: Path) -> None:
+        """优先用硬链接生成版本化文件，文件系统不支持时复制"""
+        versioned_path.unlink(missing_ok=True)
+        try:
+            os.link(file_path, versioned_path)
+        except OSError:
+            shutil.copy2(file_path, versioned_path)
+    
+    def _prune_versions(self, versioned_files: List[Path]) -> None:
+        """删除不在保留代数内的版本化文件，并移除源文件已删除的清单条目"""
+        deleted_sources = {
+            rel_path for rel_path in self.manifest
+            if not (self.docs_dir / rel_path).exists()
+        }
+        
+        removed = 0
+        freed_bytes = 0
+        for path in versioned_files:
+            match = RE_VERSIONED.match(path.name)
+            rel_path = str(path.parent.relative_to(self.docs_dir) / (match['stem'] + match['ext']))
+            entry = self.manifest.get(rel_path)
+            # 不是由清单管理的文件不删除；已在处理时删除的文件跳过
+            if entry is None or not path.exists():
+                continue
+            if rel_path not in deleted_sources and (
+                match['hash'] == entry['hash'] or match['hash'] in entry.get('history', [])
+            ):
+                continue
+            try:
+                freed_bytes += path.stat().st_size
+                path.unlink()
+                removed += 1
+            except OSError as e:
+                logger.warning(f"Failed to remove old version {path}: {e}")
+        
+        for rel_path in deleted_sources:
+            del self.manifest[rel_path]
+        
+        if removed or deleted_sources:
+            logger.info(
+                f"Pruned {removed} old asset versions ({freed_bytes} bytes), "
+                f"dropped {len(deleted_sources)} deleted assets from manifest"
+            )
+    
+    def _minify(self, file_path: Path) -> Optional[bytes]:
+        """压缩JS/CSS文件；未启用压缩或压缩失败时返回None（使用原文件）"""
+        if not self.minify:
+            return None
+        try:
+            from minify import minify_file
+            return minify_file(file_path).encode('utf-8')
         except Exception as e:
-            logger.error(f"Failed to process {file_path}: {e}")
+            logger.warning(f"Failed to minify {file_path}, using original: {e}")
+            return None
+    
+    def _log_minification_summary(self) -> None:
+        """输出压缩前后的总大小"""
+        minified = [e for e in self.manifest.values() if 'output_size' in e]
+        if not minified:
+            return
+        before = sum(e['size'] for e in minified)
+        after = sum(e['output_size'] for e in minified)
+        saved = 100 - after * 100 // max(before, 1)
+        logger.info(f"Minified {len(minified)} assets: {before} -> {after} bytes ({saved}% smaller)")
     
     def _compute_file_hash(self, file_path: Path) -> str:
-        """计算文件的哈希值"""
+        """计算文件的哈希值（大文件使用mmap，避免分块读取的开销）"""
         hasher = hashlib.sha1()
         with file_path.open('rb') as f:
-            for chunk in iter(lambda: f.read(4096), b''):
-                hasher.update(chunk)
+            size = os.fstat(f.fileno()).st_size
+            if size >= MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    hasher.update(mapped)
+            else:
+                hasher.update(f.read())
         return hasher.hexdigest()[:8]
     
     def _get_versioned_name(self, file_path: Path, file_hash: str) -> str:
@@ -114,50 +304,81 @@ class AssetManager:
     def _save_manifest(self) -> None:
         """保存资源清单"""
         try:
-            self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
-            self.manifest_file.write_text(
-                json.dumps(self.manifest, indent=2, sort_keys=True)
-            )
+            self.state.replace_assets(self.manifest)
+            self.manifest_file.unlink(missing_ok=True)
         except Exception as e:
             logger.error(f"Failed to save manifest: {e}")
             raise
     
     def _update_html_references(self) -> None:
-        """更新HTML文件中的资源引用"""
+        """更新HTML文件中的资源引用（每个文件只扫描一遍，内容未变化时不写回）"""
         try:
-            html_files = list(self.docs_dir.rglob('*.html'))
+            versioned_names = self.versioned_names()
+            if not versioned_names:
+                return
             
-            for html_file in html_files:
+            for html_file in self.docs_dir.rglob('*.html'):
+                # 与资源收集一致，跳过测试报告等目录中的页面
+                if EXCLUDED_DIRS.intersection(html_file.relative_to(self.docs_dir).parts):
+                    continue
                 content = html_file.read_text()
+                base_dir = html_file.parent.relative_to(self.docs_dir)
                 
-                # 更新资源引用
-                for rel_path, file_hash in self.manifest.items():
-                    # 构建正则表达式
-                    path_pattern = re.escape(rel_path)
-                    pattern = f'(href|src)=(["\']){path_pattern}(["\'])'
-                    
-                    # 构建替换字符串
-                    versioned_path = str(Path(rel_path).parent / 
-                                      self._get_versioned_name(Path(rel_path), file_hash))
-                    replacement = f'\\1=\\2{versioned_path}\\3'
-                    
-                    # 替换引用
-                    content = re.sub(pattern, replacement, content)
+                def replace(match: re.Match) -> str:
+                    refs = match.group(3).split(',') if match.group(1) == 'data-lazy-scripts' else [match.group(3)]
+                    new_refs = [self._rewrite_reference(ref, base_dir, versioned_names) for ref in refs]
+                    if not any(new_refs):
+                        return match.group(0)
+                    value = ','.join(new or ref for new, ref in zip(new_refs, refs))
+                    return f'{match.group(1)}={match.group(2)}{value}{match.group(2)}'
                 
-                # 保存更新后的文件
-                html_file.write_text(content)
-                logger.info(f"Updated asset references in {html_file}")
+                updated = RE_ASSET_REF.sub(replace, content)
+                if updated != content:
+                    html_file.write_text(updated)
+                    logger.info(f"Updated asset references in {html_file}")
                 
         except Exception as e:
             logger.error(f"Failed to update HTML references: {e}")
             raise
     
+    def _rewrite_reference(self, ref: str, base_dir: Path,
+                           versioned_names: Dict[str, str]) -> Optional[str]:
+        """返回引用的版本化形式；不是受管理的资源或已是最新版本时返回None"""
+        # 跳过外部链接、协议相对链接和页内锚点
+        if '://' in ref or ref.startswith(('//', '#', 'data:', 'mailto:')):
+            return None
+        
+        path, sep, suffix = ref.partition('?')
+        if not sep:
+            path, sep, suffix = ref.partition('#')
+        
+        ref_dir, _, name = path.rpartition('/')
+        
+        # 已经版本化的引用按原始文件名查找，以便更新到最新版本
+        match = RE_VERSIONED.match(name)
+        original_name = match['stem'] + match['ext'] if match else name
+        
+        rel_path = os.path.normpath(os.path.join(base_dir, ref_dir, original_name))
+        versioned_name = versioned_names.get(Path(rel_path).as_posix())
+        if not versioned_name or versioned_name == name:
+            return None
+        
+        new_path = f"{ref_dir}/{versioned_name}" if '/' in path else versioned_name
+        return new_path + sep + suffix
+    
+    def versioned_names(self) -> Dict[str, str]:
+        """资源相对路径 -> 版本化文件名"""
+        return {
+            Path(rel_path).as_posix(): self._get_versioned_name(Path(rel_path), entry['hash'])
+            for rel_path, entry in self.manifest.items()
+        }
+    
     def get_versioned_path(self, rel_path: str) -> Optional[str]:
         """获取资源的版本化路径"""
-        file_hash = self.manifest.get(rel_path)
-        if file_hash:
+        entry = self.manifest.get(rel_path)
+        if entry:
             path = Path(rel_path)
-            return str(path.parent / self._get_versioned_name(path, file_hash))
+            return str(path.parent / self._get_versioned_name(path, entry['hash']))
         return None
 
 def main():
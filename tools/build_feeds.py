@@ -8,9 +8,12 @@ import json
 import os
 from pathlib import Path
 import re
-import yaml
 import html
 
+from build_logger import setup_logging, BuildError
+
+logger = setup_logging('build_feeds')
+
 SITE_URL = "https://xianyu564.github.io/tobacco-notes"
 SITE_TITLE = "Tobacco Notes｜烟草笔记"
 SITE_DESCRIPTION = "轻量、开放的烟草品鉴笔记；一键一句话投稿；浏览最新/全部笔记。"
@@ -25,6 +28,7 @@ def parse_frontmatter(content):
         return {}, content
     
     try:
+        import yaml
         meta = yaml.safe_load(content[4:end])
         body = content[end + 4:].strip()
         return meta or {}, body
@@ -101,69 +105,74 @@ def format_datetime(dt):
     """Format datetime in RFC 3339 format."""
     return dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
 
+FEED_CATEGORIES = ['cigars', 'cigarettes', 'pipe', 'ryo', 'snus', 'ecig']
+
+def parse_feed_date(filename):
+    """Return the publication date from a note filename, or None."""
+    if filename.startswith('TEMPLATE'):
+        return None
+    date_match = re.match(r'(\d{4}-\d{2}-\d{2})', filename)
+    if not date_match:
+        return None
+    try:
+        return datetime.strptime(date_match.group(1), '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+def build_feed_item(category, filename, date, meta, body):
+    """Build one feed item from a parsed note."""
+    # Extract enhanced metadata
+    enhanced_meta = enhanced_extract_metadata(meta, body)
+    
+    # Generate proper web URL
+    web_url = get_note_web_url(SITE_URL, category, filename)
+    
+    return {
+        'id': web_url,
+        'url': web_url,
+        'title': enhanced_meta['enhanced_title'] or Path(filename).stem,
+        'content_html': markdown_to_html(body),
+        'content_text': body,
+        'summary': extract_description(body),
+        'date_published': format_datetime(date),
+        'date_modified': format_datetime(date),
+        'author': {
+            'name': meta.get('author', 'Anonymous')
+        },
+        'tags': enhanced_meta['tags'],
+        '_category': category,
+        '_rating': meta.get('rating', ''),
+        '_rating_numeric': enhanced_meta['rating_numeric'],
+        '_product': enhanced_meta['product'],
+        '_vitola': enhanced_meta['vitola'],
+        '_origin': enhanced_meta['origin'],
+        '_price': enhanced_meta['price'],
+        '_pairing': enhanced_meta['pairing'],
+        'external_url': web_url,
+        # Add image if available (assuming convention)
+        'image': f"{SITE_URL}/assets/og-image.png"  # Default fallback
+    }
+
 def build_feed_items(notes_dir):
     """Build feed items from notes directory with enhanced SEO metadata."""
     items = []
     
-    for category in ['cigars', 'cigarettes', 'pipe', 'ryo', 'snus', 'ecig']:
+    for category in FEED_CATEGORIES:
         cat_dir = notes_dir / category
         if not cat_dir.exists():
             continue
             
-        for note_file in cat_dir.glob('*.md'):
-            if note_file.name.startswith('TEMPLATE'):
-                continue
-                
+        for note_file in sorted(cat_dir.glob('*.md')):
             # Parse date from filename
-            date_match = re.match(r'(\d{4}-\d{2}-\d{2})', note_file.name)
-            if not date_match:
-                continue
-                
-            date_str = date_match.group(1)
-            try:
-                date = datetime.strptime(date_str, '%Y-%m-%d').replace(tzinfo=timezone.utc)
-            except:
+            date = parse_feed_date(note_file.name)
+            if date is None:
                 continue
             
             # Read and parse note
             try:
                 content = note_file.read_text(encoding='utf-8')
                 meta, body = parse_frontmatter(content)
-                
-                # Extract enhanced metadata
-                enhanced_meta = enhanced_extract_metadata(meta, body)
-                
-                # Generate proper web URL
-                web_url = get_note_web_url(SITE_URL, category, note_file.name)
-                
-                # Build enhanced item
-                item = {
-                    'id': web_url,
-                    'url': web_url,
-                    'title': enhanced_meta['enhanced_title'] or note_file.stem,
-                    'content_html': markdown_to_html(body),
-                    'content_text': body,
-                    'summary': extract_description(body),
-                    'date_published': format_datetime(date),
-                    'date_modified': format_datetime(date),
-                    'author': {
-                        'name': meta.get('author', 'Anonymous')
-                    },
-                    'tags': enhanced_meta['tags'],
-                    '_category': category,
-                    '_rating': meta.get('rating', ''),
-                    '_rating_numeric': enhanced_meta['rating_numeric'],
-                    '_product': enhanced_meta['product'],
-                    '_vitola': enhanced_meta['vitola'],
-                    '_origin': enhanced_meta['origin'],
-                    '_price': enhanced_meta['price'],
-                    '_pairing': enhanced_meta['pairing'],
-                    'external_url': web_url,
-                    # Add image if available (assuming convention)
-                    'image': f"{SITE_URL}/assets/og-image.png"  # Default fallback
-                }
-                
-                items.append(item)
+                items.append(build_feed_item(category, note_file.name, date, meta, body))
             except Exception as e:
                 print(f"Error processing {note_file}: {e}")
                 continue
@@ -172,6 +181,31 @@ def build_feed_items(notes_dir):
     items.sort(key=lambda x: x['date_published'], reverse=True)
     return items
 
+def build_feed_items_from_notes(entries):
+    """
+    Build feed items from notes the build has already parsed (objects
+    with category, path, meta and body, such as build_index.NoteEntry).
+    """
+    from build_tags import parse_tag_list
+    
+    items = []
+    # Same order as a scan of the notes directory before the date sort
+    ordered = sorted(
+        (entry for entry in entries if entry.category in FEED_CATEGORIES),
+        key=lambda entry: (FEED_CATEGORIES.index(entry.category), Path(entry.path).name)
+    )
+    for entry in ordered:
+        filename = Path(entry.path).name
+        date = parse_feed_date(filename)
+        if date is None:
+            continue
+        # Inline tag lists ("[a, b]") are kept as strings by the front matter parser
+        meta = dict(entry.meta, tags=parse_tag_list(entry.meta.get('tags', [])))
+        items.append(build_feed_item(entry.category, filename, date, meta, entry.body))
+    
+    items.sort(key=lambda x: x['date_published'], reverse=True)
+    return items
+
 def build_rss(items):
     """Build RSS 2.0 feed with enhanced SEO elements."""
     rss = [
@@ -343,9 +377,8 @@ def build_json_feed(items):
     
     return json.dumps(feed, ensure_ascii=False, indent=2)
 
-def main():
-    from build_logger import setup_logging, BuildError
-    logger = setup_logging('build_feeds')
+def main(entries=None):
+    """Write the feeds, from already parsed notes when entries are given."""
     
     try:
         repo_root = Path(__file__).resolve().parents[1]
@@ -357,7 +390,10 @@ def main():
         
         # Build feed items
         logger.info("Building feed items...")
-        items = build_feed_items(notes_dir)
+        if entries is None:
+            items = build_feed_items(notes_dir)
+        else:
+            items = build_feed_items_from_notes(entries)
         if not items:
             logger.warning("No feed items found")
             return
@@ -12,12 +12,15 @@ from __future__ import annotations
 import json
 import re
 import shutil
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Optional, Tuple, List, Any
 
-from process_images import process_image
+from build_logger import setup_logging
+
+logger = setup_logging('build_index')
 
 CATEGORIES = ["cigars", "cigarettes", "pipe", "ryo", "snus", "ecig"]
 
@@ -31,10 +34,27 @@ class NoteEntry:
     path: Path
     title: str
     images: List[Dict[str, str]]
+    # 解析后的 front matter，写索引和标签数据时复用，不再重新读取文件
+    meta: Dict[str, Any] = field(default_factory=dict)
+    # front matter 之后的正文（构建 feeds 和搜索索引时使用）
+    body: str = ""
 
 
 def read_front_matter(filepath: Path) -> Dict[str, Any]:
-    content = filepath.read_text(encoding="utf-8", errors="ignore")
+    return parse_front_matter(filepath.read_text(encoding="utf-8", errors="ignore"))
+
+
+def note_body(content: str) -> str:
+    """front matter 之后的正文；没有 front matter 时为全文"""
+    if not content.startswith("---\n"):
+        return content
+    end = content.find("\n---", 4)
+    if end == -1:
+        return content
+    return content[end + 4:].strip()
+
+
+def parse_front_matter(content: str) -> Dict[str, Any]:
     if not content.startswith("---\n"):
         return {}
     end = content.find("\n---", 4)
@@ -111,54 +131,105 @@ def parse_date_from_filename(name: str) -> Optional[str]:
     return None
 
 
-def process_note_images(root: Path, meta: Dict[str, Any], force_rebuild: bool = False) -> List[Dict[str, str]]:
-    """处理笔记中的图片，返回处理后的图片信息"""
-    from image_processor import ImageProcessor
-    
-    processed_images = []
+_image_processors: Dict[Path, Any] = {}
+
+
+def get_image_processor(root: Path):
+    """返回该仓库共享的图片处理器（首次使用时创建）"""
+    if root not in _image_processors:
+        from image_processor import ImageProcessor
+
+        static_img_dir = root / "docs" / "images"
+        _image_processors[root] = ImageProcessor(
+            output_dir=static_img_dir,
+            cache_dir=static_img_dir / '.cache',
+            root_dir=root
+        )
+    return _image_processors[root]
+
+
+def _image_entry(root: Path, img_path: Path, caption: str, info: Dict[str, str]) -> Dict[str, str]:
+    return {
+        "path": str(img_path.relative_to(root)),
+        "thumb": info["thumbnail"],
+        "caption": caption,
+        "url": info["optimized"],
+        "webp": info["webp"]
+    }
+
+
+def plan_note_images(root: Path, meta: Dict[str, Any], image_jobs: List[Path]) -> List[Dict[str, str]]:
+    """预测笔记图片的输出路径，并把需要处理的图片加入 image_jobs，不进行编码"""
+    planned_images = []
     if "images" not in meta:
-        return processed_images
-    
-    # 设置图片处理器
-    static_img_dir = root / "docs" / "images"
-    processor = ImageProcessor(
-        output_dir=static_img_dir,
-        cache_dir=static_img_dir / '.cache'
-    )
-    
-    # 收集需要处理的图片
-    images_to_process = []
+        return planned_images
+
+    processor = get_image_processor(root)
     for img in meta["images"]:
         if not isinstance(img, dict) or "path" not in img:
             continue
-            
+
         img_path = root / img["path"]
         if not img_path.exists():
             continue
-            
-        images_to_process.append((img_path, img.get("caption", "")))
-    
-    # 批量处理图片
-    for img_path, caption in images_to_process:
-        try:
-            result = processor.process_image(img_path)
-            
-            # 添加处理结果
-            processed_images.append({
-                "path": str(img_path.relative_to(root)),
-                "thumb": result["thumbnail"],
-                "caption": caption,
-                "url": result["optimized"],
-                "webp": result["webp"]
-            })
-        except Exception as e:
-            logger.error(f"Failed to process image {img_path}: {e}")
-            continue
-    
+
+        info = processor.predict_outputs(img_path)
+        planned_images.append(_image_entry(root, img_path, img.get("caption", ""), info))
+        image_jobs.append(img_path)
+
+    return planned_images
+
+
+def process_image_jobs(root: Path, image_jobs: List[Path]) -> Dict[str, Dict[str, str]]:
+    """用共享的图片处理器并行处理收集到的图片任务"""
+    if not image_jobs:
+        return {}
+    unique_jobs = list(dict.fromkeys(image_jobs))
+    return get_image_processor(root).process_batch(unique_jobs)
+
+
+def reconcile_images(root: Path, entries: list[NoteEntry], results: Dict[str, Dict[str, str]]) -> bool:
+    """用实际处理结果修正预测的图片路径，返回是否有条目被修改
+
+    处理失败或没有结果的图片与同步处理时一样从条目中移除，
+    避免索引引用不存在的输出文件。
+    """
+    changed = False
+    for e in entries:
+        images = []
+        for image in e.images:
+            img_path = root / image["path"]
+            info = results.get(str(img_path))
+            if not info:
+                logger.warning(f"Failed to process image {image['path']}")
+                changed = True
+                continue
+            actual = _image_entry(root, img_path, image["caption"], info)
+            if actual != image:
+                changed = True
+            images.append(actual)
+        e.images = images
+    return changed
+
+
+def process_note_images(root: Path, meta: Dict[str, Any]) -> List[Dict[str, str]]:
+    """处理笔记中的图片，返回处理后的图片信息"""
+    image_jobs: List[Path] = []
+    planned_images = plan_note_images(root, meta, image_jobs)
+    results = process_image_jobs(root, image_jobs)
+
+    processed_images = []
+    for image in planned_images:
+        info = results.get(str(root / image["path"]))
+        if info:
+            processed_images.append(_image_entry(root, root / image["path"], image["caption"], info))
+        else:
+            logger.warning(f"Failed to process image {image['path']}")
     return processed_images
 
 
-def collect_notes(root: Path) -> list[NoteEntry]:
+def collect_notes(root: Path, image_jobs: Optional[List[Path]] = None) -> list[NoteEntry]:
+    """扫描笔记；传入 image_jobs 时只记录图片任务并使用预测路径，否则同步处理图片"""
     entries: list[NoteEntry] = []
     for category in CATEGORIES:
         cat_dir = root / "notes" / category
@@ -172,13 +243,17 @@ def collect_notes(root: Path) -> list[NoteEntry]:
             meta = read_front_matter(fp)
             title = infer_title(meta, fallback=fp.stem)
             # 处理图片
-            images = process_note_images(root, meta)
+            if image_jobs is not None:
+                images = plan_note_images(root, meta, image_jobs)
+            else:
+                images = process_note_images(root, meta)
             entries.append(NoteEntry(
                 category=category,
                 date=date,
                 path=fp.relative_to(root),
                 title=title,
-                images=images
+                images=images,
+                meta=meta
             ))
     
     # Sort by date desc, then title
@@ -214,8 +289,7 @@ def write_index(root: Path, entries: list[NoteEntry]) -> None:
         for e in group:
             # [YYYY-MM-DD] Title (relative path)
             # Try to show author if present in front matter
-            meta = read_front_matter(root / e.path)
-            author = meta.get("author", "")
+            author = e.meta.get("author", "")
             author_str = f" — @{author}" if author else ""
             
             # Add thumbnail if available
@@ -236,13 +310,12 @@ def write_index(root: Path, entries: list[NoteEntry]) -> None:
     # JSON indices
     json_entries = []
     for e in entries:
-        fm = read_front_matter(root / e.path)
         json_entries.append({
             "category": e.category,
             "date": e.date,
             "path": e.path.as_posix(),
             "title": e.title,
-            "author": fm.get("author", ""),
+            "author": e.meta.get("author", ""),
             "images": e.images
         })
     (notes_dir / "index.json").write_text(json.dumps(json_entries, ensure_ascii=False, indent=2), encoding="utf-8")
@@ -260,21 +333,23 @@ def write_index(root: Path, entries: list[NoteEntry]) -> None:
 
 def main() -> None:
     repo_root = Path(__file__).resolve().parents[1]
-    entries = collect_notes(repo_root)
-    write_index(repo_root, entries)
+    image_jobs: List[Path] = []
+    entries = collect_notes(repo_root, image_jobs)
+
+    # 图片在后台编码，索引先按预测路径写出
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending_images = executor.submit(process_image_jobs, repo_root, image_jobs)
+        write_index(repo_root, entries)
+        results = pending_images.result()
+
+    if reconcile_images(repo_root, entries, results):
+        write_index(repo_root, entries)
     
-    # Also build tag aggregation data
+    # Also build tag aggregation data from the notes parsed above
     try:
-        import subprocess
-        import sys
-        result = subprocess.run([
-            sys.executable, 
-            str(repo_root / "tools" / "build_tags.py")
-        ], capture_output=True, text=True)
-        if result.returncode == 0:
-            print("Tag aggregation data built successfully")
-        else:
-            print(f"Warning: Tag building failed: {result.stderr}")
+        from build_tags import collect_tags_from_notes, write_tag_data
+        write_tag_data(repo_root, collect_tags_from_notes(repo_root, entries))
+        print("Tag aggregation data built successfully")
     except Exception as e:
         print(f"Warning: Could not build tag data: {e}")
 
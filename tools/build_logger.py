@@ -16,6 +16,11 @@ class BuildLogger:
         self.logger = logging.getLogger(name)
         self.logger.setLevel(logging.INFO)
         
+        # logging.getLogger returns the same logger for the same name, so
+        # handlers from an earlier setup_logging call (e.g. a rebuild in
+        # watch mode) are reused instead of added again
+        existing = {getattr(handler, 'build_log_target', None) for handler in self.logger.handlers}
+        
         # Create formatters
         console_formatter = logging.Formatter(
             '%(asctime)s - %(levelname)s - %(message)s',
@@ -26,22 +31,26 @@ class BuildLogger:
         )
         
         # Console handler
-        console_handler = logging.StreamHandler(sys.stdout)
-        console_handler.setFormatter(console_formatter)
-        self.logger.addHandler(console_handler)
+        if 'console' not in existing:
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(console_formatter)
+            console_handler.build_log_target = 'console'
+            self.logger.addHandler(console_handler)
         
         # File handler
         if log_dir:
             log_dir = Path(log_dir)
-            log_dir.mkdir(parents=True, exist_ok=True)
             
             # Create daily log file
             today = datetime.now().strftime('%Y-%m-%d')
-            log_file = log_dir / f'build-{today}.log'
+            log_file = (log_dir / f'build-{today}.log').resolve()
             
-            file_handler = logging.FileHandler(log_file)
-            file_handler.setFormatter(file_formatter)
-            self.logger.addHandler(file_handler)
+            if str(log_file) not in existing:
+                log_dir.mkdir(parents=True, exist_ok=True)
+                file_handler = logging.FileHandler(log_file)
+                file_handler.setFormatter(file_formatter)
+                file_handler.build_log_target = str(log_file)
+                self.logger.addHandler(file_handler)
     
     def info(self, msg: str) -> None:
         """Log info message."""
@@ -7,14 +7,14 @@ Manages and coordinates all build processes.
 import os
 import sys
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Dict, Any, Optional, Set, Tuple
 import time
 
 from build_logger import setup_logging, BuildError, log_build_error
 
-# Set up logging
-logger = setup_logging('build_manager', Path('logs'))
+# Set up logging; the log directory is anchored to the repository root so
+# running from tools/ does not create a second logs/ tree
+logger = setup_logging('build_manager', Path(__file__).resolve().parent.parent / 'logs')
 
 class BuildManager:
     """Manages the static site build process."""
@@ -35,165 +35,506 @@ class BuildManager:
         self.modified_notes: List[Path] = []
         self.modified_images: List[Path] = []
         
-    def get_modified_files(self, since: Optional[float] = None) -> None:
-        """Get list of files modified since last build."""
-        if since is None:
-            # If no timestamp provided, process all files
-            self.modified_notes = list(self.notes_dir.rglob('*.md'))
-            self.modified_images = []
-            for img_dir in self.notes_dir.glob('*/images'):
-                self.modified_images.extend(img_dir.rglob('*'))
-            return
-            
-        for note in self.notes_dir.rglob('*.md'):
-            if note.stat().st_mtime > since:
-                self.modified_notes.append(note)
-                
-        for img_dir in self.notes_dir.glob('*/images'):
-            for img in img_dir.rglob('*'):
-                if img.stat().st_mtime > since:
-                    self.modified_images.append(img)
+        # Sources deleted (or renamed away) since the last build, whose
+        # outputs are stale
+        self.deleted_notes: List[Path] = []
+        self.deleted_images: List[Path] = []
+        
+        # Whether any note was added, changed or removed; stages derived
+        # from the whole note corpus are skipped in incremental builds
+        # when nothing changed
+        self.notes_changed = True
+        
+        # Source snapshot of the current build, saved once it succeeds
+        self.change_detector: Optional[Any] = None
+        
+        # File snapshot, parsed notes, image variants, asset hashes and
+        # stage timings, shared by all stages
+        from build_state import get_build_state
+        self.state = get_build_state(self.repo_root)
+        
+        # Parsed index entries (with the note body), keyed by note path.
+        # Feeds, tags and the search index are built from them once
+        # get_modified_files has filled in the unchanged notes from the
+        # build state; until then they read the notes themselves.
+        self.note_entries: Dict[Path, Dict[str, Any]] = {}
+        self.corpus_loaded = False
+        
+        # Run note and image tasks in worker processes instead of threads
+        build_config = self._load_build_config()
+        self.use_processes = build_config.get('use_processes', False)
+        
+        # Worker budget shared by all concurrently running stages
+        self.max_workers = build_config.get('workers') or (os.cpu_count() or 1)
+        
+        # Long-lived worker pool shared by note and image tasks in watch mode
+        self.executor: Optional[Any] = None
+        
+        # Monitor of the running build; stages and workers record trace
+        # spans in it
+        self.monitor: Optional[Any] = None
+        
+        # Sources the build rewrites in place (note images, pages) ->
+        # (mtime_ns, size) afterwards, so watch mode ignores its own writes
+        self.written_files: Dict[Path, Tuple[int, int]] = {}
+    
+    def _load_build_config(self) -> Dict[str, Any]:
+        """Read the "build" section of build.config.json."""
+        config_file = self.repo_root / 'build.config.json'
+        if not config_file.exists():
+            return {}
+        try:
+            import json
+            return json.loads(config_file.read_text()).get('build', {})
+        except Exception as e:
+            logger.warning(f"Failed to load build config: {e}")
+            return {}
+        
+    def _create_change_detector(self) -> Any:
+        from change_detector import ChangeDetector
+        
+        return ChangeDetector(
+            self.repo_root, [self.notes_dir], self.state,
+            include=lambda path: not self._is_build_output(path)
+        )
+    
+    def get_modified_files(self, incremental: bool = True) -> None:
+        """
+        Find the notes and images added, modified, deleted or renamed
+        since the last successful build, from git when the commit of that
+        build is known and from the saved file snapshot otherwise.
+        
+        Without a saved snapshot, or when not incremental, every source is
+        treated as modified. Deletions are reported either way so their
+        outputs can be removed.
+        """
+        self.change_detector = self._create_change_detector()
+        changes = self.change_detector.detect()
+        
+        if incremental and self.change_detector.has_snapshot:
+            logger.info(f"Source changes since last build ({self.change_detector.source}): {changes.summary()}")
+            changed = changes.changed
+        else:
+            changed = [self.repo_root / rel for rel in self.change_detector.current]
+        
+        self.modified_notes = [path for path in changed if path.suffix == '.md']
+        self.modified_images = [path for path in changed if self._is_image_source(path)]
+        self.deleted_notes = [path for path in changes.removed if path.suffix == '.md']
+        self.deleted_images = [path for path in changes.removed if self._is_image_source(path)]
+        self.notes_changed = bool(not incremental or self.modified_notes or self.deleted_notes)
+        
+        # Unchanged notes keep the entries parsed by earlier builds, so the
+        # corpus is complete without parsing every note again
+        modified = set(self.modified_notes)
+        cached = self.state.load_notes()
+        for rel, file_state in self.change_detector.current.items():
+            note = self.repo_root / rel
+            if note not in modified and rel in cached and cached[rel][0] == file_state.hash:
+                self.note_entries.setdefault(note, cached[rel][1])
+        self.corpus_loaded = True
+    
+    def note_corpus(self) -> Optional[List[Any]]:
+        """
+        The parsed notes as build_index.NoteEntry objects, or None when
+        process_notes has not run on a complete corpus (e.g. the preview
+        server's on-demand builds).
+        """
+        if not self.corpus_loaded:
+            return None
+        from build_index import NoteEntry
+        return [
+            NoteEntry(category=entry['category'], date=entry['date'], path=Path(entry['path']),
+                      title=entry['title'], images=[], meta=entry['meta'], body=entry.get('body', ''))
+            for entry in self.note_entries.values()
+        ]
+    
+    def _is_image_source(self, path: Path) -> bool:
+        """Images referenced by notes live in notes/<category>/images/."""
+        from parallel_processor import IMAGE_EXTENSIONS
+        return path.suffix.lower() in IMAGE_EXTENSIONS and path.parent.name == 'images'
     
-    def process_notes(self) -> None:
+    def process_notes(self, max_workers: Optional[int] = None) -> None:
         """Process notes in parallel."""
+        for note in self.deleted_notes:
+            self.note_entries.pop(note, None)
+        
         if not self.modified_notes:
             logger.info("No notes to process")
             return
             
         logger.info(f"Processing {len(self.modified_notes)} notes...")
         
-        from parallel_processor import ParallelProcessor, get_optimal_chunk_size
-        processor = ParallelProcessor()
-        
-        def process_note_wrapper(note: Path) -> None:
-            from build_index import process_note
-            process_note(note, self.docs_dir)
-            logger.info(f"Processed note: {note.name}")
+        from parallel_processor import ParallelProcessor
+        from build_tasks import make_task, init_worker
+        processor = ParallelProcessor(max_workers=max_workers, executor=self.executor, monitor=self.monitor)
         
-        chunk_size = get_optimal_chunk_size(len(self.modified_notes))
-        errors = processor.process_files(
-            self.modified_notes,
-            process_note_wrapper,
-            use_processes=False,  # Notes are typically CPU-bound
-            chunk_size=chunk_size
+        # Tasks are top-level functions with string arguments so they can
+        # be sent to worker processes
+        results = processor.process_files(
+            [str(note) for note in self.modified_notes],
+            make_task('parse_note', str(self.repo_root)),
+            use_processes=self.use_processes,
+            initializer=init_worker,
+            span_name='parse_note'
         )
         
-        if errors:
-            raise BuildError(f"Failed to process {len(errors)} notes")
+        failed = [Path(r.item).name for r in results if not r.ok]
+        if failed:
+            raise BuildError(f"Failed to process {len(failed)} notes: {', '.join(failed)}")
+        
+        # Keep the parsed corpus across rebuilds; only modified notes are replaced
+        from change_detector import hash_file
+        current = self.change_detector.current if self.change_detector else {}
+        updates: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        removed = [note.relative_to(self.repo_root).as_posix() for note in self.deleted_notes]
+        for r in results:
+            rel = Path(r.item).relative_to(self.repo_root).as_posix()
+            if r.value is None:
+                self.note_entries.pop(Path(r.item), None)
+                removed.append(rel)
+            else:
+                self.note_entries[Path(r.item)] = r.value
+                note_hash = current[rel].hash if rel in current else hash_file(Path(r.item))
+                updates[rel] = (note_hash, r.value)
+        self.state.update_notes(updates, removed)
+        logger.info(f"Parsed {len(self.modified_notes)} notes ({len(self.note_entries)} in corpus)")
     
-    def process_images(self) -> None:
+    def process_images(self, max_workers: Optional[int] = None) -> None:
         """Process images in parallel."""
+        self._remove_image_outputs(self.deleted_images)
+        
         if not self.modified_images:
             logger.info("No images to process")
             return
             
-        logger.info(f"Processing {len(self.modified_images)} images...")
-        
-        from parallel_processor import ParallelProcessor, get_optimal_chunk_size, is_io_bound
-        processor = ParallelProcessor()
-        
-        def process_image_wrapper(image: Path) -> None:
-            from build_index import process_image
-            process_image(image)
-            logger.info(f"Processed image: {image.name}")
-        
-        # Group images by whether they're IO-bound
-        io_bound_images = [img for img in self.modified_images if is_io_bound(img)]
-        cpu_bound_images = [img for img in self.modified_images if not is_io_bound(img)]
-        
-        errors = []
-        
-        # Process IO-bound images with processes
-        if io_bound_images:
-            chunk_size = get_optimal_chunk_size(len(io_bound_images))
-            errors.extend(processor.process_files(
-                io_bound_images,
-                process_image_wrapper,
-                use_processes=True,
-                chunk_size=chunk_size
-            ))
-        
-        # Process CPU-bound images with threads
-        if cpu_bound_images:
-            chunk_size = get_optimal_chunk_size(len(cpu_bound_images))
-            errors.extend(processor.process_files(
-                cpu_bound_images,
-                process_image_wrapper,
-                use_processes=False,
-                chunk_size=chunk_size
-            ))
-        
-        if errors:
-            raise BuildError(f"Failed to process {len(errors)} images")
+        from parallel_processor import ParallelProcessor, schedule_image_jobs, get_image_worker_count
+        
+        # Order by estimated cost (longest first) and size the pool from
+        # core count and available memory
+        jobs = schedule_image_jobs(self.modified_images)
+        if not jobs:
+            logger.info("No images to process")
+            return
+            
+        workers = get_image_worker_count(jobs)
+        if max_workers:
+            workers = min(workers, max_workers)
+        logger.info(f"Processing {len(jobs)} images with {workers} workers...")
+        processor = ParallelProcessor(max_workers=workers, executor=self.executor, monitor=self.monitor)
+        
+        from build_tasks import make_task, init_worker
+        
+        # Pillow releases the GIL while decoding, resizing and encoding, so
+        # threads already scale; processes also parallelise the Python-level
+        # work. Only paths cross the process boundary, never image data.
+        results = processor.process_files(
+            [str(job.path) for job in jobs],
+            make_task('process_image'),
+            use_processes=self.use_processes,
+            initializer=init_worker,
+            progress=lambda done, total, result: logger.debug(f"Images: {done}/{total}"),
+            span_name='process_image'
+        )
+        
+        self._record_written(Path(r.item) for r in results if r.ok)
+        
+        failed = [Path(r.item).name for r in results if not r.ok]
+        if failed:
+            raise BuildError(f"Failed to process {len(failed)} images: {', '.join(failed)}")
     
     def build_feeds(self) -> None:
         """Build RSS/Atom/JSON feeds."""
         try:
             from build_feeds import main as build_feeds_main
-            build_feeds_main()
+            build_feeds_main(self.note_corpus())
             logger.info("Built feeds successfully")
         except Exception as e:
             log_build_error(logger, e, "Building feeds")
             raise BuildError("Failed to build feeds")
     
-    def generate_assets(self) -> None:
-        """Generate site assets."""
+    def build_tags(self) -> None:
+        """Build tag aggregation data."""
+        try:
+            from build_tags import collect_tags_from_notes, write_tag_data
+            write_tag_data(self.repo_root, collect_tags_from_notes(self.repo_root, self.note_corpus()))
+            logger.info("Built tag data successfully")
+        except Exception as e:
+            log_build_error(logger, e, "Building tags")
+            raise BuildError("Failed to build tags")
+    
+    def generate_assets(self, force: bool = False) -> None:
+        """Generate site assets; up-to-date icons are only redrawn when forced."""
         try:
             from generate_assets import main as generate_assets_main
-            generate_assets_main()
+            generate_assets_main(force)
             logger.info("Generated assets successfully")
         except Exception as e:
             log_build_error(logger, e, "Generating assets")
             raise BuildError("Failed to generate assets")
     
-    def build(self, incremental: bool = True) -> None:
-        """Run the full build process."""
+    def get_stages(self, incremental: bool, monitor: Any) -> List[Any]:
+        """
+        Declare the build stages with the resources they read and write.
+        
+        Feeds, tags and the search index only need the parsed notes, images
+        are independent of them, and compression waits for everything that
+        writes published files.
+        """
+        from performance_monitor import TaskTimer
+        from stage_scheduler import Stage
+        
+        def timed(name: str, func: Callable[..., None], metadata: Optional[Callable[[], Dict]] = None,
+                  pass_workers: bool = False, needs_notes: bool = False) -> Callable[[int], None]:
+            def run(workers: int) -> None:
+                # Feeds, tags and search are rebuilt from all notes, so they
+                # are current unless a note was added, changed or removed
+                if needs_notes and incremental and not self.notes_changed:
+                    logger.info(f"Notes unchanged, skipping {name}")
+                    return
+                # The granted worker count shows in the trace next to the
+                # spans of the workers that actually ran
+                args = dict(metadata() if metadata else {}, workers=workers)
+                with TaskTimer(monitor, name, args):
+                    if pass_workers:
+                        func(workers)
+                    else:
+                        func()
+            return run
+        
+        return [
+            Stage('get_modified_files', timed('get_modified_files', lambda: self.get_modified_files(incremental),
+                                              lambda: {'incremental': incremental}),
+                  inputs=('notes',), outputs=('modified_notes', 'modified_images')),
+            Stage('process_notes', timed('process_notes', self.process_notes,
+                                         lambda: {'count': len(self.modified_notes)}, pass_workers=True),
+                  inputs=('modified_notes',), outputs=('note_entries',),
+                  workers=self.max_workers),
+            Stage('process_images', timed('process_images', self.process_images,
+                                          lambda: {'count': len(self.modified_images)}, pass_workers=True),
+                  inputs=('modified_images',), outputs=('note_images',),
+                  workers=self.max_workers, cost=4.0),
+            Stage('build_feeds', timed('build_feeds', self.build_feeds, needs_notes=True),
+                  inputs=('note_entries',), outputs=('docs/feeds',)),
+            Stage('build_tags', timed('build_tags', self.build_tags, needs_notes=True),
+                  inputs=('note_entries',), outputs=('docs/data/tags',)),
+            Stage('build_search_index', timed('build_search_index', self._build_search_index, needs_notes=True),
+                  inputs=('note_entries',), outputs=('docs/data/search',)),
+            Stage('generate_assets', timed('generate_assets', lambda: self.generate_assets(not incremental)),
+                  outputs=('docs/assets/icons',)),
+            Stage('bundle_scripts', timed('bundle_scripts', self._bundle_scripts),
+                  outputs=('docs/js/bundles', 'docs/pages')),
+            Stage('process_static_assets', timed('process_static_assets', self._process_static_assets),
+                  inputs=('docs/js/bundles',), outputs=('docs/pages', 'docs/js', 'docs/css'), cost=2.0),
+            Stage('compress_assets', timed('compress_assets', self._compress_assets),
+                  inputs=('docs/feeds', 'docs/data/tags', 'docs/data/search', 'docs/pages', 'docs/js', 'docs/css')),
+        ]
+    
+    def build(self, incremental: bool = True, stages: Optional[Set[str]] = None) -> None:
+        """
+        Run the full build process.
+        
+        With ``stages``, only those stages run and the modified notes and
+        images must already be set (used by watch mode).
+        
+        A monitor already set on the manager (watch mode keeps one for the
+        whole session) is reused and reported by its owner; otherwise the
+        build starts its own and writes a report when it finishes.
+        """
         from performance_monitor import PerformanceMonitor, TaskTimer
+        from stage_scheduler import StageScheduler
         
         # 初始化性能监控
-        monitor = PerformanceMonitor(self.docs_dir)
-        monitor.start_monitoring()
+        owns_monitor = self.monitor is None
+        if owns_monitor:
+            self.monitor = PerformanceMonitor(self.docs_dir)
+            self.monitor.start_monitoring()
+        monitor = self.monitor
         
         try:
             with TaskTimer(monitor, 'full_build'):
                 logger.info("Starting build process...")
                 
-                # Get modified files if doing incremental build
-                with TaskTimer(monitor, 'get_modified_files', {'incremental': incremental}):
-                    if incremental:
-                        last_build_file = self.docs_dir / '.lastbuild'
-                        last_build_time = None
-                        if last_build_file.exists():
-                            last_build_time = float(last_build_file.read_text().strip())
-                        self.get_modified_files(last_build_time)
-                    else:
-                        self.get_modified_files()
-                
-                # Process content
-                with TaskTimer(monitor, 'process_notes', {'count': len(self.modified_notes)}):
-                    self.process_notes()
-                    
-                with TaskTimer(monitor, 'process_images', {'count': len(self.modified_images)}):
-                    self.process_images()
+                # Independent stages run concurrently; the critical path is
+                # logged when all stages have finished
+                selected = [
+                    stage for stage in self.get_stages(incremental, monitor)
+                    if stages is None or stage.name in stages
+                ]
                 
-                # Build feeds and assets
-                with TaskTimer(monitor, 'build_feeds'):
-                    self.build_feeds()
-                    
-                with TaskTimer(monitor, 'generate_assets'):
-                    self.generate_assets()
+                # Once every stage has run before, order ready stages by
+                # their measured durations instead of the static estimates
+                history = self.state.average_stage_durations(incremental)
+                if all(stage.name in history for stage in selected):
+                    for stage in selected:
+                        stage.cost = max(history[stage.name], 0.001)
                 
-                # Process static assets
-                with TaskTimer(monitor, 'process_static_assets'):
-                    self._process_static_assets()
-                
-                # Build search index
-                with TaskTimer(monitor, 'build_search_index'):
-                    self._build_search_index()
-                
-                # Record build time
-                (self.docs_dir / '.lastbuild').write_text(str(time.time()))
+                started = time.time()
+                report = StageScheduler(selected, self.max_workers).run()
+                if stages is None:
+                    self.state.record_build(started, report.wall_time, incremental, [
+                        (r.name, r.start, r.end, r.workers) for r in report.results.values()
+                    ])
                 
+                # Save the source snapshot the next incremental build
+                # compares against; images optimised in place are re-hashed
+                if self.change_detector:
+                    self.change_detector.commit(self.written_files.keys())
+                    self.change_detector = None
+                elif stages is not None:
+                    # Watch rebuilds take their changes from the watcher;
+                    # snapshot the sources they processed so the next full
+                    # build does not detect them again
+                    detector = self._create_change_detector()
+                    detector.detect()
+                    detector.commit(self.written_files.keys())
+            
+            # 生成性能报告
+            if owns_monitor:
+                monitor.generate_report()
+            
+        except Exception as e:
+            logger.error(f"Build failed: {e}")
+            if owns_monitor:
+                monitor.stop_monitoring()  # 确保停止监控
+            raise BuildError("Build process failed") from e
+        finally:
+            if owns_monitor:
+                self.monitor = None
+            
+    def watch(self, debounce: float = 0.3) -> None:
+        """
+        Rebuild whenever notes or site sources change.
+        
+        Modules, the parsed note corpus and the worker pool stay loaded
+        between rebuilds, and each batch of changes only reruns the stages
+        whose inputs changed. One performance monitor records the whole
+        session and writes a single report when watching stops.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from build_tasks import init_worker
+        from file_watcher import FileWatcher
+        from parallel_processor import create_process_pool
+        from performance_monitor import PerformanceMonitor
+        
+        monitor = PerformanceMonitor(self.docs_dir)
+        monitor.start_monitoring()
+        self.monitor = monitor
+        
+        if self.use_processes:
+            self.executor = create_process_pool(self.max_workers, init_worker)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, initializer=init_worker)
+        watcher = None
+        try:
+            self.build(incremental=False)
+            watcher = FileWatcher([self.notes_dir, self.docs_dir], self._is_build_output)
+            logger.info(f"Watching {self.notes_dir} and {self.docs_dir} ({watcher.backend_name}), Ctrl+C to stop")
+            
+            for changed in watcher.changes(debounce):
+                stages = self._plan_rebuild(changed)
+                if not stages:
+                    continue
+                logger.info(f"{len(changed)} files changed, rebuilding: {', '.join(sorted(stages))}")
+                try:
+                    self.build(stages=stages)
+                except BuildError as e:
+                    # Keep watching so the next save can fix the problem
+                    logger.error(f"Rebuild failed: {e}")
+        except KeyboardInterrupt:
+            logger.info("Stopped watching")
+        finally:
+            if watcher:
+                watcher.close()
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+            self.monitor = None
+            monitor.generate_report()
+    
+    def _remove_image_outputs(self, images: List[Path]) -> None:
+        """Delete the thumbnails of source images that no longer exist."""
+        for image in images:
+            self.written_files.pop(image, None)
+            thumb = image.parent / f"{image.stem}_thumb{image.suffix}"
+            try:
+                thumb.unlink()
+                logger.info(f"Removed stale thumbnail {thumb.relative_to(self.repo_root)}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not remove stale thumbnail {thumb}: {e}")
+    
+    def _record_written(self, paths: Iterable[Path]) -> None:
+        """Remember the state of sources the build just rewrote."""
+        for path in paths:
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            self.written_files[path] = (stat.st_mtime_ns, stat.st_size)
+    
+    def _is_build_output(self, path: Path) -> bool:
+        """Paths written by the build itself, which must not trigger rebuilds."""
+        from asset_manager import RE_VERSIONED, EXCLUDED_DIRS
+        
+        name = path.name
+        if name.startswith('.') or name.endswith(('~', '.tmp', '.gz', '.br', '.zst')):
+            return True
+        if path.is_relative_to(self.docs_dir):
+            parts = path.relative_to(self.docs_dir).parts
+            return (
+                parts[0] in {'assets', 'data', 'images', 'metrics'}
+                or parts[:2] == ('js', 'bundles')
+                or bool(EXCLUDED_DIRS.intersection(parts))
+                or name in {'feed.xml', 'feed.atom', 'feed.json', 'sitemap.xml'}
+                or bool(RE_VERSIONED.match(name))
+            )
+        if path.is_relative_to(self.notes_dir):
+            return (
+                path.parent == self.notes_dir and name in {'README.md', 'index.json'}
+                or '_thumb.' in name
+            )
+        return False
+    
+    def _plan_rebuild(self, changed: Set[Path]) -> Set[str]:
+        """Map changed paths to the stages that must rerun."""
+        self.modified_notes = []
+        self.modified_images = []
+        self.deleted_notes = []
+        self.deleted_images = []
+        stages: Set[str] = set()
+        
+        for path in changed:
+            # Skip images whose only change is the build's own rewrite
+            if path in self.written_files:
+                try:
+                    stat = path.stat()
+                    if self.written_files[path] == (stat.st_mtime_ns, stat.st_size):
+                        continue
+                except OSError:
+                    pass
+                del self.written_files[path]
+            
+            if path.is_relative_to(self.notes_dir):
+                if path.suffix == '.md':
+                    if path.exists():
+                        self.modified_notes.append(path)
+                    else:
+                        self.deleted_notes.append(path)
+                    stages.update({'process_notes', 'build_feeds', 'build_tags', 'build_search_index'})
+                elif self._is_image_source(path):
+                    if path.exists():
+                        self.modified_images.append(path)
+                    else:
+                        self.deleted_images.append(path)
+                    stages.add('process_images')
+            elif path.suffix in {'.html', '.css', '.js'}:
+                stages.update({'bundle_scripts', 'process_static_assets'})
+        
+        if stages - {'process_images', 'process_notes', 'bundle_scripts'}:
+            stages.add('compress_assets')
+        self.notes_changed = 'process_notes' in stages
+        return stages
+    
     def _build_search_index(self) -> None:
         """Build search index for the website."""
         try:
@@ -201,33 +542,64 @@ class BuildManager:
             
             logger.info("Building search index...")
             builder = SearchIndexBuilder(self.repo_root)
-            builder.build_index()
+            builder.build_index(self.note_corpus())
             
         except Exception as e:
             logger.error(f"Search index build failed: {e}")
             raise BuildError("Failed to build search index") from e
             
-            # 生成性能报告
-            monitor.generate_report()
+    def _bundle_scripts(self) -> None:
+        """Bundle page scripts if enabled in build.config.json."""
+        try:
+            from asset_manager import load_output_config
+            if not load_output_config(self.repo_root).get('bundling', False):
+                return
             
-        except Exception as e:
-            logger.error(f"Build failed: {e}")
-            monitor.stop_monitoring()  # 确保停止监控
-            raise BuildError("Build process failed") from e
+            from bundle_assets import ScriptBundler
+            
+            logger.info("Bundling page scripts...")
+            ScriptBundler(self.docs_dir).bundle()
+            
+            # Pages are rewritten to reference the bundles
+            self._record_written(self.docs_dir.glob('*.html'))
             
+        except Exception as e:
+            logger.error(f"Script bundling failed: {e}")
+            raise BuildError("Failed to bundle scripts") from e
+    
     def _process_static_assets(self) -> None:
         """Process static assets with versioning and caching."""
         try:
             from asset_manager import AssetManager
             
             logger.info("Processing static assets...")
-            manager = AssetManager(self.repo_root)
+            # Bundling already ran as its own stage
+            manager = AssetManager(self.repo_root, bundle=False)
             manager.process_assets()
             
+            # Pages are rewritten with versioned references
+            self._record_written(self.docs_dir.glob('*.html'))
+            
         except Exception as e:
             logger.error(f"Static asset processing failed: {e}")
             raise BuildError("Failed to process static assets") from e
 
+    def _compress_assets(self) -> None:
+        """Write precompressed sidecars if enabled in build.config.json."""
+        try:
+            from asset_manager import load_output_config
+            if not load_output_config(self.repo_root).get('compression', False):
+                return
+            
+            from compress_assets import AssetCompressor
+            
+            logger.info("Compressing assets...")
+            AssetCompressor(self.repo_root).compress()
+            
+        except Exception as e:
+            logger.error(f"Asset compression failed: {e}")
+            raise BuildError("Failed to compress assets") from e
+
 def main():
     """Main entry point."""
     try:
@@ -241,6 +613,8 @@ def main():
                           help='Force full rebuild instead of incremental')
         parser.add_argument('--debug', action='store_true',
                           help='Enable debug logging')
+        parser.add_argument('--watch', action='store_true',
+                          help='Keep running and rebuild when notes or site sources change')
         args = parser.parse_args()
         
         # Configure debug logging if requested
@@ -250,9 +624,15 @@ def main():
         
         # Run build
         manager = BuildManager(repo_root)
-        manager.build(incremental=not args.full)
+        if args.watch:
+            manager.watch()
+        else:
+            manager.build(incremental=not args.full)
         
         return 0
+    except KeyboardInterrupt:
+        logger.info("Build interrupted")
+        return 130
     except BuildError as e:
         logger.error(str(e))
         return 1
@@ -261,4 +641,4 @@ def main():
         return 2
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
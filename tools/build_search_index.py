@@ -5,12 +5,13 @@ Build search index for the website.
 """
 import json
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import Any, Dict, Iterable, List, Optional
 import re
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from build_logger import setup_logging, BuildError
+from build_tags import parse_tag_list
 
 logger = setup_logging('build_search_index')
 
@@ -24,17 +25,19 @@ class SearchIndexBuilder:
         self.data_dir = self.docs_dir / 'data'
         self.data_dir.mkdir(parents=True, exist_ok=True)
         
-    def build_index(self) -> None:
-        """构建搜索索引"""
+    def build_index(self, entries: Optional[Iterable[Any]] = None) -> None:
+        """构建搜索索引；传入已解析的笔记（如 build_index.NoteEntry）时不再读取文件"""
         try:
             logger.info("Building search index...")
             
-            # 收集所有笔记
-            notes = self._collect_notes()
-            
-            # 处理笔记内容
-            with ThreadPoolExecutor() as executor:
-                index_entries = list(executor.map(self._process_note, notes))
+            if entries is None:
+                # 收集并处理所有笔记
+                notes = self._collect_notes()
+                with ThreadPoolExecutor() as executor:
+                    index_entries = list(executor.map(self._process_note, notes))
+            else:
+                index_entries = [self._entry_from_note(entry) for entry in
+                                 sorted(entries, key=lambda e: Path(e.path).as_posix())]
             
             # 过滤无效条目
             index_entries = [entry for entry in index_entries if entry]
@@ -60,9 +63,9 @@ class SearchIndexBuilder:
     def _collect_notes(self) -> List[Path]:
         """收集所有笔记文件"""
         notes = []
-        for category in self.notes_dir.iterdir():
+        for category in sorted(self.notes_dir.iterdir()):
             if category.is_dir() and not category.name.startswith('.'):
-                notes.extend(category.glob('*.md'))
+                notes.extend(sorted(category.glob('*.md')))
         return notes
     
     def _process_note(self, note_path: Path) -> Dict[str, Any]:
@@ -86,38 +89,57 @@ class SearchIndexBuilder:
             except:
                 return None
             
-            # 提取日期
-            date_match = re.match(r'(\d{4}-\d{2}-\d{2})', note_path.stem)
-            if not date_match:
-                return None
-                
-            # 构建索引条目
-            entry = {
-                'title': metadata.get('title', note_path.stem),
-                'author': metadata.get('author', 'Anonymous'),
-                'category': note_path.parent.name,
-                'tags': metadata.get('tags', []),
-                'date': date_match.group(1),
-                'url': f"./notes/{note_path.parent.name}/{note_path.name}",
-                'excerpt': self._extract_excerpt(body),
-                'rating': metadata.get('rating', None)
-            }
-            
-            # 添加额外的搜索字段
-            entry['search_text'] = ' '.join([
-                entry['title'],
-                entry['author'],
-                entry['category'],
-                ' '.join(entry['tags']),
-                entry['excerpt']
-            ]).lower()
-            
-            return entry
+            return self._index_entry(note_path.parent.name, note_path.name, metadata, body)
             
         except Exception as e:
             logger.error(f"Failed to process note {note_path}: {e}")
             return None
     
+    def _entry_from_note(self, note: Any) -> Optional[Dict[str, Any]]:
+        """由构建中已解析的笔记生成索引条目；没有 front matter 的笔记不编入索引"""
+        if not note.meta:
+            return None
+        try:
+            # 行内列表（"[a, b]"）在 front matter 解析后仍是字符串
+            metadata = dict(note.meta, tags=parse_tag_list(note.meta.get('tags', [])))
+            return self._index_entry(note.category, Path(note.path).name, metadata, note.body)
+        except Exception as e:
+            logger.error(f"Failed to process note {note.path}: {e}")
+            return None
+    
+    def _index_entry(self, category: str, filename: str, metadata: Dict[str, Any],
+                     body: str) -> Optional[Dict[str, Any]]:
+        """构建单个笔记的索引条目；文件名不以日期开头时返回None"""
+        stem = Path(filename).stem
+        
+        # 提取日期
+        date_match = re.match(r'(\d{4}-\d{2}-\d{2})', stem)
+        if not date_match:
+            return None
+            
+        # 构建索引条目
+        entry = {
+            'title': metadata.get('title', stem),
+            'author': metadata.get('author', 'Anonymous'),
+            'category': category,
+            'tags': metadata.get('tags', []),
+            'date': date_match.group(1),
+            'url': f"./notes/{category}/{filename}",
+            'excerpt': self._extract_excerpt(body),
+            'rating': metadata.get('rating', None)
+        }
+        
+        # 添加额外的搜索字段
+        entry['search_text'] = ' '.join([
+            entry['title'],
+            entry['author'],
+            entry['category'],
+            ' '.join(entry['tags']),
+            entry['excerpt']
+        ]).lower()
+        
+        return entry
+    
     def _extract_excerpt(self, content: str, max_length: int = 200) -> str:
         """提取内容摘要"""
         # 移除Markdown语法
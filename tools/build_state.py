@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite-backed build state shared by all build stages.
+
+One database (.buildstate.db in the repository root, outside the published
+docs/ tree) holds what used to be spread over several JSON files: the
+source file snapshot used for change detection, the parsed-note cache,
+processed image variants and their perceptual hashes, versioned asset
+hashes, precompression state and the timings of each build's stages. The
+database runs in WAL mode, so readers in other processes are not blocked by
+a writer, and every update method writes its whole batch in one
+transaction.
+
+A BuildState object may be shared by the threads of one process; a lock
+serialises access to its connection. Worker processes open their own
+connection through get_build_state().
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from build_logger import setup_logging
+
+logger = setup_logging('build_state')
+
+STATE_FILE_NAME = '.buildstate.db'
+
+# 数据库结构版本；不一致时重建（状态都可以通过一次全量构建恢复）
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS notes (
+    path TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    entry TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS image_variants (
+    cache_key TEXT PRIMARY KEY,
+    info TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS image_phashes (
+    phash TEXT PRIMARY KEY,
+    info TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS assets (
+    path TEXT PRIMARY KEY,
+    entry TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS compression (
+    path TEXT PRIMARY KEY,
+    entry TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS builds (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    wall_time REAL NOT NULL,
+    incremental INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stage_timings (
+    build_id INTEGER NOT NULL REFERENCES builds(id) ON DELETE CASCADE,
+    stage TEXT NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    workers INTEGER NOT NULL,
+    PRIMARY KEY (build_id, stage)
+);
+"""
+
+# 保留阶段耗时的最近构建次数
+MAX_BUILDS_KEPT = 50
+
+
+class BuildState:
+    """构建状态数据库"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False,
+                                    isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # WAL 模式下 NORMAL 足够安全：断电最多丢失最后一次提交
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA foreign_keys=ON')
+        self._migrate()
+
+    def _migrate(self) -> None:
+        with self.transaction() as conn:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version not in (0, SCHEMA_VERSION):
+                logger.info(f"Build state schema changed ({version} -> {SCHEMA_VERSION}), starting afresh")
+                tables = [row[0] for row in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+                )]
+                for table in tables:
+                    conn.execute(f'DROP TABLE {table}')
+            # executescript 会先提交当前事务，这里逐条执行
+            for statement in SCHEMA.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+            conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """在一个事务中执行一批读写；可以嵌套，只有最外层提交"""
+        with self.lock:
+            if self.conn.in_transaction:
+                yield self.conn
+                return
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+    # 键值元数据
+
+    def get_meta(self, key: str, default: Any = None) -> Any:
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, values: Dict[str, Any]) -> None:
+        with self.transaction() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                [(key, json.dumps(value)) for key, value in values.items()]
+            )
+
+    # 源文件快照
+
+    def load_files(self) -> Dict[str, Tuple[int, int, str]]:
+        with self.lock:
+            rows = self.conn.execute('SELECT path, size, mtime_ns, hash FROM files').fetchall()
+        return {path: (size, mtime_ns, file_hash) for path, size, mtime_ns, file_hash in rows}
+
+    def replace_files(self, files: Dict[str, Tuple[int, int, str]], meta: Dict[str, Any]) -> None:
+        """替换整个快照；meta（如提交号）在同一事务中写入"""
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM files')
+            conn.executemany(
+                'INSERT INTO files (path, size, mtime_ns, hash) VALUES (?, ?, ?, ?)',
+                [(path, *state) for path, state in files.items()]
+            )
+            self.set_meta(meta)
+
+    # 已解析的笔记
+
+    def load_notes(self) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+        """相对路径 -> (内容哈希, 索引条目)"""
+        with self.lock:
+            rows = self.conn.execute('SELECT path, hash, entry FROM notes').fetchall()
+        return {path: (note_hash, json.loads(entry)) for path, note_hash, entry in rows}
+
+    def update_notes(self, entries: Dict[str, Tuple[str, Dict[str, Any]]],
+                     deleted: Iterable[str] = ()) -> None:
+        with self.transaction() as conn:
+            conn.executemany('DELETE FROM notes WHERE path = ?', [(path,) for path in deleted])
+            conn.executemany(
+                'INSERT OR REPLACE INTO notes (path, hash, entry) VALUES (?, ?, ?)',
+                [(path, note_hash, json.dumps(entry, ensure_ascii=False))
+                 for path, (note_hash, entry) in entries.items()]
+            )
+
+    # 图片处理结果
+
+    def get_image_variant(self, cache_key: str, touch: bool = True) -> Optional[Dict[str, str]]:
+        """读取缓存的处理结果；touch 时刷新访问时间，供 LRU 淘汰使用"""
+        with self.transaction() as conn:
+            row = conn.execute('SELECT info FROM image_variants WHERE cache_key = ?', (cache_key,)).fetchone()
+            if row and touch:
+                conn.execute('UPDATE image_variants SET accessed = ? WHERE cache_key = ?',
+                             (time.time(), cache_key))
+        return json.loads(row[0]) if row else None
+
+    def put_image_variant(self, cache_key: str, info: Dict[str, str]) -> None:
+        data = json.dumps(info)
+        with self.transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO image_variants (cache_key, info, size, accessed) VALUES (?, ?, ?, ?)',
+                (cache_key, data, len(data), time.time())
+            )
+
+    def image_variant_usage(self) -> List[Tuple[str, int, float]]:
+        """(缓存键, 大小, 最近访问时间)，最久未使用的在前"""
+        with self.lock:
+            return self.conn.execute(
+                'SELECT cache_key, size, accessed FROM image_variants ORDER BY accessed'
+            ).fetchall()
+
+    def delete_image_variants(self, cache_keys: Iterable[str]) -> None:
+        with self.transaction() as conn:
+            conn.executemany('DELETE FROM image_variants WHERE cache_key = ?', [(key,) for key in cache_keys])
+
+    def load_image_phashes(self) -> Dict[str, Dict[str, str]]:
+        """感知哈希 -> 处理结果"""
+        with self.lock:
+            rows = self.conn.execute('SELECT phash, info FROM image_phashes').fetchall()
+        return {phash: json.loads(info) for phash, info in rows}
+
+    def put_image_phash(self, phash: str, info: Dict[str, str]) -> None:
+        with self.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO image_phashes (phash, info) VALUES (?, ?)',
+                         (phash, json.dumps(info)))
+
+    def delete_image_phashes(self, phashes: Iterable[str]) -> None:
+        with self.transaction() as conn:
+            conn.executemany('DELETE FROM image_phashes WHERE phash = ?', [(phash,) for phash in phashes])
+
+    # 按路径保存的 JSON 条目（表结构相同：path, entry）
+
+    def _load_entries(self, table: str) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            rows = self.conn.execute(f'SELECT path, entry FROM {table}').fetchall()
+        return {path: json.loads(entry) for path, entry in rows}
+
+    def _replace_entries(self, table: str, entries: Dict[str, Dict[str, Any]]) -> None:
+        with self.transaction() as conn:
+            conn.execute(f'DELETE FROM {table}')
+            conn.executemany(
+                f'INSERT INTO {table} (path, entry) VALUES (?, ?)',
+                [(path, json.dumps(entry, sort_keys=True)) for path, entry in entries.items()]
+            )
+
+    # 版本化的静态资源
+
+    def load_assets(self) -> Dict[str, Dict[str, Any]]:
+        return self._load_entries('assets')
+
+    def replace_assets(self, assets: Dict[str, Dict[str, Any]]) -> None:
+        self._replace_entries('assets', assets)
+
+    # 预压缩文件：相对于 docs/ 的路径 -> {'hash', 'size', 'mtime', 'encoders', 'encodings'}
+
+    def load_compression(self) -> Dict[str, Dict[str, Any]]:
+        return self._load_entries('compression')
+
+    def replace_compression(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        self._replace_entries('compression', entries)
+
+    # 阶段耗时
+
+    def record_build(self, started: float, wall_time: float, incremental: bool,
+                     stages: Iterable[Tuple[str, float, float, int]]) -> int:
+        """记录一次构建及其各阶段的 (名称, 开始, 结束, 工作数)，只保留最近的若干次"""
+        with self.transaction() as conn:
+            build_id = conn.execute(
+                'INSERT INTO builds (started, wall_time, incremental) VALUES (?, ?, ?)',
+                (started, wall_time, int(incremental))
+            ).lastrowid
+            conn.executemany(
+                'INSERT INTO stage_timings (build_id, stage, start, end, workers) VALUES (?, ?, ?, ?, ?)',
+                [(build_id, *stage) for stage in stages]
+            )
+            conn.execute('DELETE FROM builds WHERE id <= ?', (build_id - MAX_BUILDS_KEPT,))
+        return build_id
+
+    def average_stage_durations(self, incremental: bool, last: int = 5) -> Dict[str, float]:
+        """同类（增量或全量）构建中各阶段最近几次的平均耗时"""
+        with self.lock:
+            rows = self.conn.execute(
+                '''
+                SELECT stage, AVG(end - start) FROM (
+                    SELECT t.stage, t.start, t.end,
+                           ROW_NUMBER() OVER (PARTITION BY t.stage ORDER BY t.build_id DESC) AS n
+                    FROM stage_timings t JOIN builds b ON b.id = t.build_id
+                    WHERE b.incremental = ?
+                ) WHERE n <= ? GROUP BY stage
+                ''',
+                (int(incremental), last)
+            ).fetchall()
+        return dict(rows)
+
+
+# (进程号, 数据库路径) -> 状态；子进程不能复用父进程的连接
+_states: Dict[Tuple[int, Path], BuildState] = {}
+_states_lock = threading.Lock()
+
+
+def get_build_state(root_dir: Path) -> BuildState:
+    """返回仓库 root_dir 的构建状态，同一进程内共享一个连接"""
+    db_path = (root_dir / STATE_FILE_NAME).resolve()
+    key = (os.getpid(), db_path)
+    with _states_lock:
+        state = _states.get(key)
+        if state is None:
+            state = _states[key] = BuildState(db_path)
+        return state
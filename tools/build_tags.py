@@ -4,7 +4,9 @@
 Build tag aggregation data for the tobacco notes site.
 
 This script scans all note files, extracts tags from frontmatter,
-and generates aggregated tag data for the tag browsing feature.
+and generates aggregated tag data for the tag browsing feature. When the
+notes were already parsed (build_index.collect_notes), pass the entries to
+collect_tags_from_notes() to aggregate them without reading the files again.
 """
 from __future__ import annotations
 
@@ -12,7 +14,7 @@ import json
 import re
 from collections import defaultdict, Counter
 from pathlib import Path
-from typing import Dict, List, Any, Set
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Set, Tuple
 
 # Reuse the same categories and functions from build_index.py
 CATEGORIES = ["cigars", "cigarettes", "pipe", "ryo", "snus", "ecig"]
@@ -67,16 +69,18 @@ def parse_date_from_filename(filename: str) -> str | None:
     return match.group(1) if match else None
 
 
-def collect_tags_from_notes(root: Path) -> Dict[str, Any]:
-    """Collect all tags from note files and build aggregation data."""
-    
-    # Tag statistics
-    all_tags = Counter()  # tag -> count
-    tag_to_notes = defaultdict(list)  # tag -> list of note info
-    category_tags = defaultdict(Counter)  # category -> {tag: count}
-    notes_with_tags = []  # All notes that have tags
-    
-    # Process each category
+def parse_tag_list(value: Any) -> List[str]:
+    """Normalise a tags value: a parsed list, or an inline "[a, b]" string."""
+    if isinstance(value, list):
+        return [item for item in value if isinstance(item, str) and item]
+    if isinstance(value, str) and value.startswith("[") and value.endswith("]"):
+        items = [item.strip().strip("'\"") for item in value[1:-1].split(",")]
+        return [item for item in items if item]
+    return []
+
+
+def scan_notes(root: Path) -> Iterator[Tuple[str, str, Path, Dict[str, Any]]]:
+    """Yield (category, date, path, frontmatter) for every dated note."""
     for category in CATEGORIES:
         cat_dir = root / "notes" / category
         if not cat_dir.exists():
@@ -87,39 +91,63 @@ def collect_tags_from_notes(root: Path) -> Dict[str, Any]:
             date = parse_date_from_filename(note_file.name)
             if not date:
                 continue
-                
-            # Read frontmatter
-            meta = read_front_matter(note_file)
-            tags = meta.get("tags", [])
-            
-            if not tags or not isinstance(tags, list):
-                continue
-                
-            # Get note title/name
-            title = (meta.get("title") or 
-                    meta.get("product") or 
-                    meta.get("brand") or 
-                    note_file.stem.replace(f"{date}-", "").replace("-", " ").title())
-            
-            note_info = {
-                "category": category,
-                "date": date,
-                "path": note_file.relative_to(root).as_posix(),
-                "title": title,
-                "author": meta.get("author", ""),
-                "rating": meta.get("rating", ""),
-                "tags": tags
-            }
-            
-            notes_with_tags.append(note_info)
+            yield category, date, note_file, read_front_matter(note_file)
+
+
+def collect_tags_from_notes(root: Path, entries: Optional[Iterable[Any]] = None) -> Dict[str, Any]:
+    """
+    Collect all tags from note files and build aggregation data.
+    
+    entries are already parsed notes (objects with category, date, path
+    relative to root and meta, such as build_index.NoteEntry); without them
+    the notes are scanned and parsed here.
+    """
+    if entries is None:
+        notes: Iterable[Tuple[str, str, Path, Dict[str, Any]]] = scan_notes(root)
+    else:
+        # Same order as a scan: by category, then by file name
+        ordered = sorted((e for e in entries if e.category in CATEGORIES), key=lambda e: (
+            CATEGORIES.index(e.category), Path(e.path).name
+        ))
+        notes = [(e.category, e.date, root / e.path, e.meta) for e in ordered]
+    
+    # Tag statistics
+    all_tags = Counter()  # tag -> count
+    tag_to_notes = defaultdict(list)  # tag -> list of note info
+    category_tags = defaultdict(Counter)  # category -> {tag: count}
+    notes_with_tags = []  # All notes that have tags
+    
+    for category, date, note_file, meta in notes:
+        tags = parse_tag_list(meta.get("tags", []))
+        
+        if not tags:
+            continue
             
-            # Aggregate tag statistics
-            for tag in tags:
-                tag = tag.strip().lower()
-                if tag:
-                    all_tags[tag] += 1
-                    tag_to_notes[tag].append(note_info)
-                    category_tags[category][tag] += 1
+        # Get note title/name
+        title = (meta.get("title") or 
+                meta.get("product") or 
+                meta.get("brand") or 
+                note_file.stem.replace(f"{date}-", "").replace("-", " ").title())
+        
+        note_info = {
+            "category": category,
+            "date": date,
+            "path": note_file.relative_to(root).as_posix(),
+            "title": title,
+            "author": meta.get("author", ""),
+            "rating": meta.get("rating", ""),
+            "tags": tags
+        }
+        
+        notes_with_tags.append(note_info)
+        
+        # Aggregate tag statistics
+        for tag in tags:
+            tag = tag.strip().lower()
+            if tag:
+                all_tags[tag] += 1
+                tag_to_notes[tag].append(note_info)
+                category_tags[category][tag] += 1
     
     # Build featured tag collections based on frequency and categories
     featured_tags = build_featured_collections(all_tags, category_tags, tag_to_notes)
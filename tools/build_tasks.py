@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Picklable build tasks for process-based parallelism.
+
+Every task is a top-level function registered by name and takes only
+serialisable arguments (strings, numbers, plain containers), so it can be
+sent to a ProcessPoolExecutor worker. Results are plain dicts for the same
+reason. init_worker() is passed as the pool initializer to import the heavy
+modules (Pillow and its format plugins, yaml) once per worker process
+instead of once per task. Worker processes also ignore SIGINT: Ctrl+C
+reaches the whole process group, and the parent cancels the pool instead.
+"""
+import functools
+import multiprocessing
+import signal
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from build_logger import setup_logging
+
+logger = setup_logging('build_tasks')
+
+# 任务名称 -> 顶层任务函数
+TASKS: Dict[str, Callable[..., Any]] = {}
+
+
+def register_task(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """把顶层函数注册为可在子进程中运行的构建任务"""
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        if '<locals>' in func.__qualname__:
+            raise ValueError(f"Task {name} must be a top-level function to be picklable")
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def run_task(name: str, *args: Any) -> Any:
+    """在当前进程中按名称运行任务"""
+    try:
+        task = TASKS[name]
+    except KeyError:
+        raise ValueError(f"Unknown build task: {name}") from None
+    return task(*args)
+
+
+def make_task(name: str, *args: Any) -> Callable[[Any], Any]:
+    """返回绑定了前置参数的任务，可直接作为 ParallelProcessor 的 processor"""
+    if name not in TASKS:
+        raise ValueError(f"Unknown build task: {name}")
+    # functools.partial 可以被 pickle（绑定的参数也需要可以 pickle）
+    return functools.partial(run_task, name, *args)
+
+
+def init_worker() -> None:
+    """工作进程初始化：预先导入耗时的模块，每个进程只导入一次"""
+    if multiprocessing.parent_process() is not None:
+        # 终端的 Ctrl+C 会发给整个进程组；工作进程忽略它，由父进程取消进程池，
+        # 避免每个工作进程各打印一次 KeyboardInterrupt
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        from PIL import Image
+        # 注册所有格式插件，避免每个任务首次打开图片时再加载
+        Image.init()
+    except ImportError:
+        pass
+    try:
+        import yaml  # noqa: F401
+    except ImportError:
+        pass
+
+
+@register_task('parse_note')
+def parse_note(root: str, path: str) -> Optional[Dict[str, Any]]:
+    """解析单篇笔记，返回索引条目（含正文）；文件名不是 YYYY-MM-DD- 开头时返回None"""
+    from build_index import infer_title, note_body, parse_date_from_filename, parse_front_matter
+
+    note = Path(path)
+    date = parse_date_from_filename(note.name)
+    if not date:
+        return None
+    content = note.read_text(encoding='utf-8', errors='ignore')
+    meta = parse_front_matter(content)
+    return {
+        'category': note.parent.name,
+        'date': date,
+        'path': note.relative_to(root).as_posix(),
+        'title': infer_title(meta, fallback=note.stem),
+        'meta': meta,
+        'body': note_body(content)
+    }
+
+
+@register_task('process_image')
+def process_image(path: str) -> str:
+    """就地优化单张图片并生成缩略图，返回图片路径"""
+    from process_images import process_image as optimize_image
+
+    optimize_image(Path(path))
+    return path
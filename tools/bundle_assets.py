@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JavaScript bundling for the site's pages.
+
+For each top-level page in docs/, the local deferred scripts are
+concatenated into one critical bundle, and each data-lazy-scripts group
+becomes a lazily loaded chunk. The page is rewritten to reference the
+bundles, and each bundle reference keeps the list of its source scripts in
+a data-bundle-sources / data-lazy-sources attribute, so the page itself is
+the manifest: bundles can be regenerated on any checkout without the build
+state database, and the original script tags stay recoverable. Bundles are
+written to docs/js/bundles/ and fingerprinted by AssetManager like any other
+script.
+"""
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Set
+
+from asset_manager import RE_VERSIONED
+from build_logger import setup_logging, BuildError
+
+logger = setup_logging('bundle_assets')
+
+# 页面中的本地延迟脚本：<script defer src="./js/x.js"></script>
+# 关键包引用额外带有 data-bundle-sources，记录包内的源脚本
+RE_DEFER_SCRIPT = re.compile(
+    r'[ \t]*<script defer src="(\./js/[^"]+\.js)"(?: data-bundle-sources="([^"]*)")?></script>[ \t]*\n?'
+)
+
+# 脚本预加载：<link rel="preload" href="./js/x.js" as="script">
+RE_SCRIPT_PRELOAD = re.compile(r'[ \t]*<link rel="preload" href="(\./js/[^"]+\.js)" as="script"\s*/?>[ \t]*\n?')
+
+# 带有 data-lazy-scripts 属性的开始标签
+RE_LAZY_TAG = re.compile(r'<[a-zA-Z][^>]*?\bdata-lazy-scripts="([^"]*)"[^>]*>', re.S)
+
+# 已合并分块的源脚本列表
+RE_LAZY_SOURCES = re.compile(r'\bdata-lazy-sources="([^"]*)"')
+
+RE_ID_ATTR = re.compile(r'\bid="([^"]+)"')
+
+BUNDLE_DIR = 'js/bundles'
+
+
+class ScriptBundler:
+    """将页面脚本合并为关键包和按需加载的分块"""
+
+    def __init__(self, docs_dir: Path):
+        self.docs_dir = docs_dir
+        self.bundle_dir = docs_dir / BUNDLE_DIR
+        # 页面 -> {'critical': {'file', 'sources'}, 'chunks': {name: {'file', 'sources'}}}
+        # 每次从页面中的 data-bundle-sources / data-lazy-sources 属性重新得出
+        self.chunk_manifest: Dict[str, Dict[str, Any]] = {}
+
+    def bundle(self) -> Dict[str, Dict[str, Any]]:
+        """为所有页面生成脚本包，返回分块清单"""
+        try:
+            for page in sorted(self.docs_dir.glob('*.html')):
+                self._bundle_page(page)
+            return self.chunk_manifest
+
+        except Exception as e:
+            logger.error(f"Script bundling failed: {e}")
+            raise BuildError("Failed to bundle scripts") from e
+
+    def _bundle_page(self, page: Path) -> None:
+        """处理单个页面"""
+        content = page.read_text()
+
+        # 关键包记录的源脚本，以及页面中仍直接引用的源脚本
+        critical_sources: List[str] = []
+        eager: List[str] = []
+        has_bundle = False
+        for src, recorded in RE_DEFER_SCRIPT.findall(content):
+            if self._is_bundle(src):
+                has_bundle = True
+                critical_sources.extend(self._sources(recorded))
+            elif (self.docs_dir / self._rel(src)).exists():
+                eager.append(src)
+
+        # 按需加载的分块：新出现的脚本组生成新分块，已指向分块的按记录重新生成
+        chunks: Dict[str, Dict[str, Any]] = {}
+        chunk_refs: Dict[str, str] = {}
+        for index, match in enumerate(RE_LAZY_TAG.finditer(content)):
+            value = match.group(1)
+            id_match = RE_ID_ATTR.search(match.group(0))
+            name = id_match.group(1) if id_match else f"chunk{index}"
+            if self._is_bundle(value):
+                recorded = RE_LAZY_SOURCES.search(match.group(0))
+                sources = self._sources(recorded.group(1)) if recorded else []
+                if sources:
+                    chunks[name] = {'file': self._rel(value), 'sources': sources}
+                continue
+            sources = self._sources(value)
+            if not sources:
+                continue
+            chunks[name] = {'file': f"{BUNDLE_DIR}/{page.stem}.{name}.js", 'sources': sources}
+            chunk_refs[value] = f"./{chunks[name]['file']}"
+
+        lazy_sources = {src for chunk in chunks.values() for src in chunk['sources']}
+
+        # 关键包：已记录的脚本加上新出现的脚本；按需加载的脚本不再立即加载
+        critical_sources.extend(
+            self._rel(src) for src in eager if self._rel(src) not in critical_sources
+        )
+        critical_sources = [src for src in critical_sources if src not in lazy_sources]
+
+        if not critical_sources and not chunks:
+            return
+        if not has_bundle and len(eager) < 2 and not chunk_refs:
+            # 只有一个脚本的页面无需合并
+            return
+
+        critical = {'file': f"{BUNDLE_DIR}/{page.stem}.js", 'sources': critical_sources}
+        for bundle in [critical, *chunks.values()]:
+            self._write_bundle(bundle)
+
+        updated = self._rewrite_page(content, lazy_sources, critical, chunk_refs)
+        if updated != content:
+            page.write_text(updated)
+            logger.info(f"Bundled scripts in {page.name}: {len(critical_sources)} critical, {len(chunks)} lazy chunks")
+
+        self.chunk_manifest[page.name] = {'critical': critical, 'chunks': chunks}
+
+    def _rewrite_page(self, content: str, lazy_sources: Set[str],
+                      critical: Dict[str, Any], chunk_refs: Dict[str, str]) -> str:
+        """用分块引用替换页面中的源脚本引用"""
+        bundled = set(critical['sources']) | lazy_sources
+        sources_attr = ','.join(f"./{src}" for src in critical['sources'])
+        inserted = False
+
+        def replace_script(match: re.Match) -> str:
+            nonlocal inserted
+            src = match.group(1)
+            if not self._is_bundle(src) and self._rel(src) not in bundled:
+                return match.group(0)
+            if inserted or not critical['sources']:
+                return ''
+            inserted = True
+            # 已有的关键包引用保留（可能已被版本化）的地址，只更新源脚本列表
+            if not self._is_bundle(src):
+                src = f"./{critical['file']}"
+            indent = match.group(0)[:len(match.group(0)) - len(match.group(0).lstrip())]
+            return f'{indent}<script defer src="{src}" data-bundle-sources="{sources_attr}"></script>\n'
+
+        content = RE_DEFER_SCRIPT.sub(replace_script, content)
+
+        # 已合并脚本的预加载不再需要
+        content = RE_SCRIPT_PRELOAD.sub(
+            lambda m: '' if self._rel(m.group(1)) in bundled else m.group(0), content
+        )
+
+        for value, ref in chunk_refs.items():
+            content = content.replace(
+                f'data-lazy-scripts="{value}"',
+                f'data-lazy-scripts="{ref}" data-lazy-sources="{value}"'
+            )
+        return content
+
+    def _write_bundle(self, bundle: Dict[str, Any]) -> None:
+        """拼接源脚本并写出分块，内容未变化时不写（保持修改时间，便于跳过哈希）"""
+        parts = []
+        for src in bundle['sources']:
+            source = (self.docs_dir / src).read_text(encoding='utf-8').rstrip()
+            # 分号防止上一个文件末尾的表达式与下一个文件相连
+            parts.append(f"/* {src} */\n{source}\n;")
+        content = '\n'.join(parts) + '\n'
+
+        path = self.docs_dir / bundle['file']
+        if path.exists() and path.read_text(encoding='utf-8') == content:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding='utf-8')
+
+    def _rel(self, src: str) -> str:
+        """页面中的引用 -> 相对于 docs/ 的源文件路径（去掉版本号）"""
+        path = Path(os.path.normpath(src))
+        match = RE_VERSIONED.match(path.name)
+        if match:
+            path = path.with_name(match['stem'] + match['ext'])
+        return path.as_posix()
+
+    def _sources(self, value: str) -> List[str]:
+        """逗号分隔的脚本列表 -> 仍存在的源文件路径"""
+        sources = [self._rel(src.strip()) for src in value.split(',') if src.strip()]
+        return [src for src in sources if (self.docs_dir / src).exists()]
+
+    def _is_bundle(self, src: str) -> bool:
+        return self._rel(src).startswith(BUNDLE_DIR + '/')
+
+def main():
+    """主入口函数"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Bundle page scripts into critical and lazy chunks')
+    parser.add_argument('root_dir', type=Path, help='Project root directory')
+    args = parser.parse_args()
+
+    try:
+        ScriptBundler(args.root_dir / 'docs').bundle()
+    except Exception as e:
+        logger.error(f"Script bundling failed: {e}")
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
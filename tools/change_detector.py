@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Snapshot-based change detection for incremental builds.
+
+The state of every source file (size, mtime and content hash) is saved in
+the build state database after a successful build. The next build walks the source tree with
+os.scandir, compares it with that snapshot and reports which files were
+added, modified, deleted or renamed. Contents are only hashed when size or
+mtime differ from the snapshot, so an unchanged tree costs one stat per
+file, and a file whose mtime changed but whose content did not (a touch, a
+fresh checkout) is not reported. A deleted path and an added path with the
+same hash are reported as a rename.
+
+Checkouts (as in CI) reset every mtime, which would force each file to be
+hashed again. So when the tree is a git work tree and the commit recorded
+with the snapshot is still known, the changes are taken from
+``git diff --name-status`` between that commit and the work tree, plus
+untracked files, and only those paths are stat-ed and hashed. An unknown
+commit (a shallow clone, a rewritten history) falls back to the full walk.
+"""
+import hashlib
+import os
+import subprocess
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from build_logger import setup_logging
+from build_state import BuildState
+
+logger = setup_logging('change_detector')
+
+
+@dataclass
+class FileState:
+    """Stat and content hash of one source file."""
+    size: int
+    mtime_ns: int
+    hash: str
+
+
+@dataclass
+class ChangeSet:
+    """Differences between the saved snapshot and the source tree."""
+    added: List[Path] = field(default_factory=list)
+    modified: List[Path] = field(default_factory=list)
+    deleted: List[Path] = field(default_factory=list)
+    # 旧路径 -> 新路径
+    renamed: Dict[Path, Path] = field(default_factory=dict)
+
+    @property
+    def changed(self) -> List[Path]:
+        """Files that need to be (re)processed."""
+        return self.added + self.modified + list(self.renamed.values())
+
+    @property
+    def removed(self) -> List[Path]:
+        """Paths whose outputs are stale, including the old side of renames."""
+        return self.deleted + list(self.renamed.keys())
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.modified or self.deleted or self.renamed)
+
+    def summary(self) -> str:
+        return (f"{len(self.added)} added, {len(self.modified)} modified, "
+                f"{len(self.deleted)} deleted, {len(self.renamed)} renamed")
+
+
+def hash_file(path: Path) -> str:
+    """计算文件内容的哈希值"""
+    hasher = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class ChangeDetector:
+    """比较源文件与上次成功构建时保存的快照"""
+
+    def __init__(self, root_dir: Path, roots: List[Path], state: BuildState,
+                 include: Optional[Callable[[Path], bool]] = None):
+        self.root_dir = root_dir
+        self.roots = roots
+        self.state = state
+        self.include = include or (lambda path: True)
+
+        # 相对路径（posix）-> 状态；保存快照时 git 的 HEAD，以及当时
+        # 与 HEAD 不同的路径（之后改回 HEAD 的内容时 git diff 不会报告）
+        self.snapshot: Optional[Dict[str, FileState]] = None
+        self.commit_id: Optional[str] = None
+        self.dirty: List[str] = []
+        self._load()
+        # 最近一次 detect() 得到的状态，commit() 时写入快照
+        self.current: Dict[str, FileState] = {}
+        # 最近一次 detect() 使用的变更来源：'git' 或 'snapshot'
+        self.source = 'snapshot'
+
+    @property
+    def has_snapshot(self) -> bool:
+        return self.snapshot is not None
+
+    def _load(self) -> None:
+        # 从未保存过快照时（首次构建）snapshot 保持为None
+        if not self.state.get_meta('snapshot_saved', False):
+            return
+        self.snapshot = {rel: FileState(*state) for rel, state in self.state.load_files().items()}
+        self.commit_id = self.state.get_meta('commit')
+        self.dirty = self.state.get_meta('dirty', [])
+
+    def _git(self, *args: str) -> Optional[str]:
+        """在 root_dir 中运行 git，失败（没有 git、不是仓库、对象不存在）时返回None"""
+        try:
+            result = subprocess.run(['git', *args], cwd=self.root_dir,
+                                    capture_output=True, text=True, encoding='utf-8')
+        except OSError:
+            return None
+        return result.stdout if result.returncode == 0 else None
+
+    def head_commit(self) -> Optional[str]:
+        head = self._git('rev-parse', '--verify', '--quiet', 'HEAD')
+        return head.strip() if head else None
+
+    def _walk(self) -> Iterable[os.DirEntry]:
+        """用 os.scandir 遍历源目录（stat 结果随目录项一起返回）"""
+        stack = [str(root) for root in self.roots if root.exists()]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                if not self.include(Path(entry.path)):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        yield entry
+                except OSError:
+                    continue
+
+    def _state(self, path: Path, size: int, mtime_ns: int, previous: Optional[FileState]) -> FileState:
+        # 大小和修改时间都没变时沿用快照中的哈希
+        if previous and previous.size == size and previous.mtime_ns == mtime_ns:
+            return previous
+        return FileState(size, mtime_ns, hash_file(path))
+
+    def detect(self) -> ChangeSet:
+        """返回相对快照的变化；优先使用 git，没有快照时所有文件都算新增"""
+        if self.snapshot is not None and self.commit_id:
+            changes = self._detect_git(self.commit_id)
+            if changes is not None:
+                self.source = 'git'
+                return changes
+            logger.info(f"Commit {self.commit_id[:12]} of the last build is unknown, scanning all sources")
+        self.source = 'snapshot'
+        return self._detect_snapshot()
+
+    def _git_candidates(self, commit: str) -> Optional[Tuple[List[str], List[str], List[Tuple[str, str]]]]:
+        """git 报告的变更：(新增或修改, 删除, 重命名)，路径相对于 root_dir"""
+        if self._git('cat-file', '-e', f'{commit}^{{commit}}') is None:
+            return None
+        pathspec = [root.relative_to(self.root_dir).as_posix() for root in self.roots]
+        # 与工作区比较，已提交和未提交的修改都包含在内；-z 避免路径被转义
+        diff = self._git('diff', '--name-status', '-M', '-z', '--relative', '--no-ext-diff',
+                         commit, '--', *pathspec)
+        untracked = self._git('ls-files', '-z', '--others', '--exclude-standard', '--', *pathspec)
+        if diff is None or untracked is None:
+            return None
+
+        changed: List[str] = [rel for rel in untracked.split('\0') if rel]
+        deleted: List[str] = []
+        renamed: List[Tuple[str, str]] = []
+        fields = diff.split('\0')
+        i = 0
+        while i < len(fields) and fields[i]:
+            status = fields[i]
+            if status[0] in 'RC':
+                old, new = fields[i + 1], fields[i + 2]
+                i += 3
+                if status[0] == 'R':
+                    renamed.append((old, new))
+                else:
+                    changed.append(new)
+            else:
+                rel = fields[i + 1]
+                i += 2
+                if status[0] == 'D':
+                    deleted.append(rel)
+                else:
+                    changed.append(rel)
+        return changed, deleted, renamed
+
+    def _detect_git(self, commit: str) -> Optional[ChangeSet]:
+        """只对 git 报告的路径取状态，其余文件沿用快照"""
+        candidates = self._git_candidates(commit)
+        if candidates is None:
+            return None
+        changed, deleted, renamed = candidates
+        snapshot = self.snapshot or {}
+        current = dict(snapshot)
+        changes = ChangeSet()
+
+        def included(rel: str) -> bool:
+            return self.include(self.root_dir / rel)
+
+        def refresh(rel: str) -> Optional[FileState]:
+            path = self.root_dir / rel
+            try:
+                stat = path.stat()
+                state = self._state(path, stat.st_size, stat.st_mtime_ns, snapshot.get(rel))
+            except OSError:
+                current.pop(rel, None)
+                return None
+            current[rel] = state
+            return state
+
+        handled = set()
+        for old, new in renamed:
+            handled.update((old, new))
+            old_known = current.pop(old, None) if included(old) else None
+            if not included(new) or refresh(new) is None:
+                if old_known:
+                    changes.deleted.append(self.root_dir / old)
+            elif old_known:
+                changes.renamed[self.root_dir / old] = self.root_dir / new
+            else:
+                changes.added.append(self.root_dir / new)
+
+        # 与快照比较后才报告：上次构建时已处理过的未提交修改不会重复出现
+        for rel in dict.fromkeys(deleted + changed + self.dirty):
+            if rel in handled or not included(rel):
+                continue
+            previous = snapshot.get(rel)
+            state = refresh(rel)
+            if state is None:
+                if previous is not None:
+                    changes.deleted.append(self.root_dir / rel)
+            elif previous is None:
+                changes.added.append(self.root_dir / rel)
+            elif previous.hash != state.hash:
+                changes.modified.append(self.root_dir / rel)
+
+        self.current = current
+        return changes
+
+    def _detect_snapshot(self) -> ChangeSet:
+        """扫描源目录并与快照逐一比较"""
+        snapshot = self.snapshot or {}
+        current: Dict[str, FileState] = {}
+        changes = ChangeSet()
+
+        for entry in self._walk():
+            path = Path(entry.path)
+            rel = path.relative_to(self.root_dir).as_posix()
+            try:
+                stat = entry.stat()
+                state = self._state(path, stat.st_size, stat.st_mtime_ns, snapshot.get(rel))
+            except OSError:
+                continue  # 扫描期间被删除
+            current[rel] = state
+            previous = snapshot.get(rel)
+            if previous is None:
+                changes.added.append(path)
+            elif previous.hash != state.hash:
+                changes.modified.append(path)
+
+        deleted = [rel for rel in snapshot if rel not in current]
+
+        # 内容相同的删除/新增配对为重命名
+        added_by_hash: Dict[str, List[Path]] = {}
+        for path in changes.added:
+            added_by_hash.setdefault(current[path.relative_to(self.root_dir).as_posix()].hash, []).append(path)
+        for rel in deleted:
+            old_path = self.root_dir / rel
+            candidates = added_by_hash.get(snapshot[rel].hash)
+            if candidates:
+                new_path = candidates.pop(0)
+                changes.renamed[old_path] = new_path
+                changes.added.remove(new_path)
+            else:
+                changes.deleted.append(old_path)
+
+        self.current = current
+        return changes
+
+    def commit(self, rewritten: Iterable[Path] = ()) -> None:
+        """
+        Save the state seen by detect() as the new snapshot.
+
+        Sources the build rewrote in place (optimised images) are stat-ed
+        and hashed again, so they do not show up as modified next time.
+        Other files edited while the build ran keep their pre-build state
+        and are picked up by the next build.
+        """
+        for path in rewritten:
+            try:
+                rel = path.relative_to(self.root_dir).as_posix()
+            except ValueError:
+                continue
+            if rel not in self.current:
+                continue
+            try:
+                stat = path.stat()
+                self.current[rel] = self._state(path, stat.st_size, stat.st_mtime_ns, None)
+            except OSError:
+                self.current.pop(rel, None)
+
+        self.commit_id = self.head_commit()
+        self.dirty = []
+        if self.commit_id:
+            candidates = self._git_candidates(self.commit_id)
+            if candidates:
+                changed, deleted, renamed = candidates
+                paths = changed + deleted + [rel for pair in renamed for rel in pair]
+                self.dirty = sorted({rel for rel in paths if self.include(self.root_dir / rel)})
+        self.state.replace_files(
+            {rel: (state.size, state.mtime_ns, state.hash) for rel, state in self.current.items()},
+            {'snapshot_saved': True, 'commit': self.commit_id, 'dirty': self.dirty}
+        )
+        self.snapshot = self.current
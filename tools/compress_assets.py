@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Precompressed sidecars for published text assets.
+
+Writes name.ext.gz (and .br / .zst when the brotli or zstandard modules are
+importable) next to each data file, feed, script, stylesheet and page, so a
+static server can send precompressed bytes without compressing per request.
+What was compressed, and with which encoders, is kept in the build state
+database so unchanged files are skipped on the next run.
+"""
+import gzip
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from asset_manager import EXCLUDED_DIRS
+from build_logger import setup_logging, BuildError
+from build_state import get_build_state
+
+logger = setup_logging('compress_assets')
+
+# 需要预压缩的文件（相对于 docs/）
+COMPRESS_PATTERNS = (
+    'data/*.json',
+    'feed.xml',
+    'feed.atom',
+    'feed.json',
+    'sitemap.xml',
+    'js/**/*.js',
+    '**/*.css',
+    '**/*.html',
+)
+
+
+def _gzip(data: bytes) -> bytes:
+    # mtime=0 使输出可复现，内容不变时字节也不变
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def get_encoders() -> Dict[str, Callable[[bytes], bytes]]:
+    """返回可用的压缩编码：扩展名 -> 压缩函数"""
+    encoders: Dict[str, Callable[[bytes], bytes]] = {'.gz': _gzip}
+    try:
+        import brotli
+        encoders['.br'] = lambda data: brotli.compress(data, quality=11)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        encoders['.zst'] = lambda data: zstandard.ZstdCompressor(level=19).compress(data)
+    except ImportError:
+        pass
+    return encoders
+
+
+class AssetCompressor:
+    """为发布的文本资源生成预压缩文件"""
+
+    def __init__(self, root_dir: Path, max_workers: Optional[int] = None):
+        self.root_dir = root_dir
+        self.docs_dir = root_dir / 'docs'
+        self.max_workers = max_workers
+        self.encoders = get_encoders()
+
+        # 相对路径 -> {'hash', 'size', 'mtime', 'encoders', 'encodings'}
+        self.build_state = get_build_state(root_dir)
+        self.state: Dict[str, Dict[str, Any]] = self.build_state.load_compression()
+
+    def compress(self) -> Dict[str, int]:
+        """压缩所有发布的文本资源，返回统计信息"""
+        try:
+            files = self._collect_files()
+            logger.info(f"Compressing {len(files)} assets with {', '.join(self.encoders)}...")
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(executor.map(self._compress_file, files))
+
+            stats = {'compressed': 0, 'skipped': 0, 'bytes_in': 0, 'bytes_out': 0}
+            state: Dict[str, Dict[str, Any]] = {}
+            for rel_path, entry, written in results:
+                state[rel_path] = entry
+                if written is None:
+                    stats['skipped'] += 1
+                    continue
+                stats['compressed'] += 1
+                stats['bytes_in'] += entry['size']
+                stats['bytes_out'] += written
+
+            removed = self._remove_stale_sidecars(state)
+            self.state = state
+            self._save_state()
+
+            logger.info(
+                f"Compressed {stats['compressed']} assets ({stats['bytes_in']} -> {stats['bytes_out']} bytes gzip), "
+                f"skipped {stats['skipped']} unchanged, removed {removed} stale sidecars"
+            )
+            return stats
+
+        except Exception as e:
+            logger.error(f"Asset compression failed: {e}")
+            raise BuildError("Failed to compress assets") from e
+
+    def _collect_files(self) -> List[Path]:
+        """收集需要压缩的文件"""
+        files = set()
+        for pattern in COMPRESS_PATTERNS:
+            for path in self.docs_dir.glob(pattern):
+                if path.is_file() and not EXCLUDED_DIRS.intersection(path.relative_to(self.docs_dir).parts):
+                    files.add(path)
+        return sorted(files)
+
+    def _sidecar(self, path: Path, ext: str) -> Path:
+        return path.with_name(path.name + ext)
+
+    def _compress_file(self, path: Path):
+        """压缩单个文件，返回 (相对路径, 状态条目, gzip大小或None表示跳过)"""
+        rel_path = path.relative_to(self.docs_dir).as_posix()
+        stat = path.stat()
+        entry = self.state.get(rel_path, {})
+        # 上次使用相同的编码器且压缩文件都还在
+        up_to_date = (
+            entry.get('encoders') == list(self.encoders)
+            and all(self._sidecar(path, ext).exists() for ext in entry.get('encodings', []))
+        )
+
+        # 大小和修改时间未变时无需读取文件
+        if up_to_date and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime_ns:
+            return rel_path, entry, None
+
+        data = path.read_bytes()
+        file_hash = hashlib.sha1(data).hexdigest()
+        new_entry = {
+            'hash': file_hash,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'encoders': list(self.encoders)
+        }
+
+        # 内容未变（例如只是被重新写出）时保留已有的压缩文件
+        if up_to_date and entry.get('hash') == file_hash:
+            new_entry['encodings'] = entry['encodings']
+            return rel_path, new_entry, None
+
+        encodings = []
+        gzip_size = 0
+        for ext, encode in self.encoders.items():
+            sidecar = self._sidecar(path, ext)
+            compressed = encode(data)
+            # 压缩后没有变小的文件不生成压缩文件
+            if len(compressed) >= len(data):
+                sidecar.unlink(missing_ok=True)
+                continue
+            tmp = sidecar.with_name(sidecar.name + '.tmp')
+            tmp.write_bytes(compressed)
+            os.replace(tmp, sidecar)
+            encodings.append(ext)
+            if ext == '.gz':
+                gzip_size = len(compressed)
+
+        new_entry['encodings'] = encodings
+        return rel_path, new_entry, gzip_size
+
+    def _remove_stale_sidecars(self, state: Dict[str, Dict[str, Any]]) -> int:
+        """删除源文件已不存在的压缩文件"""
+        removed = 0
+        for rel_path, entry in self.state.items():
+            if rel_path in state:
+                continue
+            path = self.docs_dir / rel_path
+            for ext in entry.get('encodings', []):
+                sidecar = self._sidecar(path, ext)
+                if sidecar.exists():
+                    sidecar.unlink()
+                    removed += 1
+        return removed
+
+    def _save_state(self) -> None:
+        """保存压缩状态"""
+        self.build_state.replace_compression(self.state)
+
+def main():
+    """主入口函数"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Write precompressed sidecars for published assets')
+    parser.add_argument('root_dir', type=Path, help='Project root directory')
+    parser.add_argument('--workers', type=int, help='Number of worker threads')
+    args = parser.parse_args()
+
+    try:
+        AssetCompressor(args.root_dir, args.workers).compress()
+    except Exception as e:
+        logger.error(f"Asset compression failed: {e}")
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
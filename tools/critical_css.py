@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Critical CSS extraction for the site's pages.
+
+The elements above the fold (everything in <body> up to the end of the first
+<section>) are collected, and the stylesheet rules whose selectors can match
+them are inlined into the page head as <style id="critical-css">. The full
+stylesheet is then loaded without blocking rendering. The inline block
+records the versioned stylesheet it was extracted from, so it is only
+regenerated when AssetManager produces a new version of the stylesheet.
+"""
+import os
+import re
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from asset_manager import RE_VERSIONED
+from build_logger import setup_logging, BuildError
+from minify import minify_css
+
+logger = setup_logging('critical_css')
+
+# 首屏包含的 <section> 数量
+DEFAULT_FOLD_SECTIONS = 1
+
+# 阻塞渲染的样式表引用（行首，不含 media 属性；<noscript> 中的不匹配）
+RE_BLOCKING_STYLESHEET = re.compile(r'^[ \t]*<link rel="stylesheet" href="([^"]+)"\s*/?>[ \t]*\n?', re.M)
+
+# 已延迟加载的样式表引用
+RE_DEFERRED_STYLESHEET = re.compile(r'<link rel="stylesheet" href="([^"]+)" media="print" onload="[^"]*"\s*/?>')
+
+# 内联的关键CSS
+RE_CRITICAL_BLOCK = re.compile(r'<style id="critical-css"(?: data-source="([^"]*)")?>.*?</style>', re.S)
+
+# 选择器中的伪类/伪元素名称和属性选择器
+RE_PSEUDO = re.compile(r'::?[a-zA-Z-]+')
+RE_ATTRIBUTE = re.compile(r'\[[^\]]*\]')
+RE_SIMPLE_SELECTOR = re.compile(r'([.#]?)(-?[_a-zA-Z][\w-]*)')
+
+RE_ANIMATION = re.compile(r'animation(?:-name)?\s*:\s*([^;}]+)')
+
+
+class FoldCollector(HTMLParser):
+    """收集首屏元素使用的标签、类名和ID"""
+
+    def __init__(self, fold_sections: int = DEFAULT_FOLD_SECTIONS):
+        super().__init__()
+        self.fold_sections = fold_sections
+        self.tags: Set[str] = {'html', 'body'}
+        self.classes: Set[str] = set()
+        self.ids: Set[str] = set()
+        self._in_body = False
+        self._sections = 0
+        self._done = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'body':
+            self._in_body = True
+        if not self._in_body or self._done:
+            return
+        if tag == 'section':
+            self._sections += 1
+            if self._sections > self.fold_sections:
+                self._done = True
+                return
+        self.tags.add(tag)
+        for name, value in attrs:
+            if name == 'class' and value:
+                self.classes.update(value.split())
+            elif name == 'id' and value:
+                self.ids.add(value)
+
+
+def _split_top_level(text: str, sep: str) -> List[str]:
+    """按分隔符拆分，忽略括号、方括号和字符串中的分隔符"""
+    parts, depth, quote, start = [], 0, None, 0
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in '"\'':
+            quote = ch
+        elif ch in '([':
+            depth += 1
+        elif ch in ')]':
+            depth -= 1
+        elif ch == sep and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def _strip_pseudo(selector: str) -> str:
+    """去掉伪类（包括 :not(...) 之类的参数）和属性选择器；它们可能在运行时匹配"""
+    selector = RE_ATTRIBUTE.sub('', selector)
+    out, i = [], 0
+    while i < len(selector):
+        match = RE_PSEUDO.match(selector, i) if selector[i] == ':' else None
+        if not match:
+            out.append(selector[i])
+            i += 1
+            continue
+        i = match.end()
+        if i < len(selector) and selector[i] == '(':
+            depth = 0
+            while i < len(selector):
+                depth += {'(': 1, ')': -1}.get(selector[i], 0)
+                i += 1
+                if depth == 0:
+                    break
+    return ''.join(out)
+
+
+def _parse_blocks(css: str) -> List[Tuple[str, Optional[str]]]:
+    """把（已压缩的）CSS拆分为 (前导部分, 块内容) 列表；以分号结束的 @规则 块内容为 None"""
+    blocks = []
+    i, n = 0, len(css)
+    while i < n:
+        start = i
+        quote = None
+        # 读取前导部分，直到 { 或 ;
+        while i < n:
+            ch = css[i]
+            if quote:
+                if ch == '\\':
+                    i += 1
+                elif ch == quote:
+                    quote = None
+            elif ch in '"\'':
+                quote = ch
+            elif ch in '{;':
+                break
+            elif ch == '}':
+                # 源样式表中多余的右花括号，跳过
+                start = i + 1
+            i += 1
+        prelude = css[start:i].strip()
+        if i >= n or css[i] == ';':
+            if prelude:
+                blocks.append((prelude, None))
+            i += 1
+            continue
+
+        # 匹配花括号，读取块内容
+        depth, body_start = 0, i + 1
+        while i < n:
+            ch = css[i]
+            if quote:
+                if ch == '\\':
+                    i += 1
+                elif ch == quote:
+                    quote = None
+            elif ch in '"\'':
+                quote = ch
+            elif ch == '{':
+                depth += 1
+            elif ch == '}':
+                depth -= 1
+                if depth == 0:
+                    break
+            i += 1
+        blocks.append((prelude, css[body_start:i]))
+        i += 1
+    return blocks
+
+
+class CriticalCssExtractor:
+    """从样式表中挑出首屏元素可能用到的规则"""
+
+    def __init__(self, html: str, fold_sections: int = DEFAULT_FOLD_SECTIONS):
+        collector = FoldCollector(fold_sections)
+        collector.feed(html)
+        self.tags = collector.tags
+        self.classes = collector.classes
+        self.ids = collector.ids
+
+    def extract(self, css: str) -> str:
+        """返回压缩后的关键CSS"""
+        rules = self._select(_parse_blocks(minify_css(css)))
+
+        # 只保留被关键规则引用的动画
+        used_animations: Set[str] = set()
+        for value in RE_ANIMATION.findall(self._render(rules, None)):
+            used_animations.update(re.findall(r'[\w-]+', value))
+        return self._render(rules, used_animations)
+
+    def _select(self, blocks: List[Tuple[str, Optional[str]]]) -> List[Tuple[str, Any]]:
+        """挑出保留的规则：('rule', 文本)、('keyframes', 名称, 文本) 或 ('group', 前导, 子规则)"""
+        rules: List[Tuple[str, Any]] = []
+        for prelude, body in blocks:
+            if prelude.startswith('@'):
+                name = prelude.split(None, 1)[0].lower()
+                if body is None:
+                    # @import / @charset 必须保留在最前面
+                    if name in ('@import', '@charset'):
+                        rules.append(('rule', prelude + ';'))
+                elif name in ('@media', '@supports'):
+                    inner = self._select(_parse_blocks(body))
+                    if inner:
+                        rules.append(('group', prelude, inner))
+                elif name.endswith('keyframes'):
+                    animation = prelude.split(None, 1)[1].strip() if ' ' in prelude else ''
+                    rules.append(('keyframes', animation, f"{prelude}{{{body}}}"))
+                elif name == '@font-face':
+                    rules.append(('rule', f"{prelude}{{{body}}}"))
+                continue
+            if body is None:
+                # 没有块内容的普通前导（残缺的规则）不能输出
+                continue
+
+            selectors = [s for s in _split_top_level(prelude, ',') if self._matches(s)]
+            if selectors:
+                rules.append(('rule', f"{','.join(selectors)}{{{body}}}"))
+        return rules
+
+    def _render(self, rules: List[Tuple[str, Any]], used_animations: Optional[Set[str]]) -> str:
+        """输出规则文本；used_animations 为None时不输出 @keyframes"""
+        out = []
+        for rule in rules:
+            if rule[0] == 'rule':
+                out.append(rule[1])
+            elif rule[0] == 'keyframes':
+                if used_animations is not None and rule[1] in used_animations:
+                    out.append(rule[2])
+            else:
+                inner = self._render(rule[2], used_animations)
+                if inner:
+                    out.append(f"{rule[1]}{{{inner}}}")
+        return ''.join(out)
+
+    def _matches(self, selector: str) -> bool:
+        """选择器中的所有标签、类名和ID都出现在首屏时认为可能匹配"""
+        for prefix, name in RE_SIMPLE_SELECTOR.findall(_strip_pseudo(selector)):
+            if prefix == '.' and name not in self.classes:
+                return False
+            if prefix == '#' and name not in self.ids:
+                return False
+            if not prefix and name.lower() not in self.tags:
+                return False
+        return True
+
+
+class CriticalCssInliner:
+    """为页面内联关键CSS，并将完整样式表改为非阻塞加载"""
+
+    def __init__(self, docs_dir: Path, versioned_names: Dict[str, str],
+                 fold_sections: int = DEFAULT_FOLD_SECTIONS):
+        self.docs_dir = docs_dir
+        # 资源相对路径 -> 版本化文件名（来自 AssetManager 的清单）
+        self.versioned_names = versioned_names
+        self.fold_sections = fold_sections
+
+    def inline(self) -> int:
+        """处理所有页面，返回更新的页面数"""
+        try:
+            updated = 0
+            for page in sorted(self.docs_dir.glob('*.html')):
+                if self._inline_page(page):
+                    updated += 1
+            return updated
+
+        except Exception as e:
+            logger.error(f"Critical CSS inlining failed: {e}")
+            raise BuildError("Failed to inline critical CSS") from e
+
+    def _inline_page(self, page: Path) -> bool:
+        content = page.read_text()
+        stylesheets = [
+            href for href in RE_BLOCKING_STYLESHEET.findall(content) + RE_DEFERRED_STYLESHEET.findall(content)
+            if self._source(href) is not None
+        ]
+        if not stylesheets:
+            return False
+        source = self._source(stylesheets[0])
+
+        # 记录的版本与当前样式表版本一致时无需重新提取
+        version = self.versioned_names.get(source, source)
+        block = RE_CRITICAL_BLOCK.search(content)
+        updated = content
+        if not (block and block.group(1) == version):
+            critical = CriticalCssExtractor(content, self.fold_sections).extract(
+                (self.docs_dir / source).read_text(encoding='utf-8')
+            )
+            new_block = f'<style id="critical-css" data-source="{version}">{critical}</style>'
+            if block:
+                updated = updated[:block.start()] + new_block + updated[block.end():]
+            else:
+                # 插入到第一个样式表引用之前
+                first = min(m.start() for m in (
+                    RE_BLOCKING_STYLESHEET.search(updated), RE_DEFERRED_STYLESHEET.search(updated)
+                ) if m)
+                line_start = updated.rfind('\n', 0, first) + 1
+                indent = re.match(r'[ \t]*', updated[line_start:]).group(0)
+                updated = f"{updated[:line_start]}{indent}{new_block}\n{updated[line_start:]}"
+            logger.info(f"Extracted critical CSS for {page.name} from {version} ({len(critical)} bytes)")
+
+        updated = self._defer_stylesheets(updated)
+        if updated == content:
+            return False
+        page.write_text(updated)
+        return True
+
+    def _defer_stylesheets(self, content: str) -> str:
+        """把阻塞的样式表引用改为 media="print" 加载后切换；已有延迟引用的直接删除"""
+        deferred = {self._source(href) for href in RE_DEFERRED_STYLESHEET.findall(content)}
+
+        def replace(match: re.Match) -> str:
+            href = match.group(1)
+            source = self._source(href)
+            if source is None:
+                return match.group(0)
+            if source in deferred:
+                return ''
+            deferred.add(source)
+            indent = match.group(0)[:len(match.group(0)) - len(match.group(0).lstrip())]
+            return (
+                f'{indent}<link rel="stylesheet" href="{href}" media="print" onload="this.media=\'all\'">\n'
+                f'{indent}<noscript><link rel="stylesheet" href="{href}"></noscript>\n'
+            )
+
+        return RE_BLOCKING_STYLESHEET.sub(replace, content)
+
+    def _source(self, href: str) -> Optional[str]:
+        """页面中的样式表引用 -> 相对于 docs/ 的源文件路径；不是本地样式表时返回None"""
+        if '://' in href or href.startswith('//'):
+            return None
+        path = Path(os.path.normpath(href.split('?', 1)[0]))
+        match = RE_VERSIONED.match(path.name)
+        if match:
+            path = path.with_name(match['stem'] + match['ext'])
+        if path.suffix != '.css' or not (self.docs_dir / path).exists():
+            return None
+        return path.as_posix()
+
+def main():
+    """主入口函数"""
+    import argparse
+    from asset_manager import AssetManager
+    parser = argparse.ArgumentParser(description='Inline critical CSS into the site pages')
+    parser.add_argument('root_dir', type=Path, help='Project root directory')
+    args = parser.parse_args()
+
+    try:
+        manager = AssetManager(args.root_dir)
+        CriticalCssInliner(manager.docs_dir, manager.versioned_names()).inline()
+    except Exception as e:
+        logger.error(f"Critical CSS inlining failed: {e}")
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+File change notification for watch mode.
+
+Uses inotify (through the optional inotify_simple package) when it is
+available and falls back to polling directory snapshots taken with
+os.scandir. Bursts of events, such as an editor's save or a git checkout,
+are coalesced into one batch of changed paths.
+"""
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from build_logger import setup_logging
+
+logger = setup_logging('file_watcher')
+
+# 默认合并事件的静默时间和最长等待时间（秒）
+DEFAULT_DEBOUNCE = 0.3
+DEFAULT_MAX_DELAY = 2.0
+
+
+class _PollingBackend:
+    """定期扫描目录，比较文件的修改时间和大小"""
+
+    name = 'polling'
+
+    def __init__(self, roots: List[Path], ignore: Callable[[Path], bool], interval: float):
+        self.roots = roots
+        self.ignore = ignore
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        snapshot: Dict[Path, Tuple[int, int]] = {}
+        stack = [root for root in self.roots if root.exists()]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                path = Path(entry.path)
+                if self.ignore(path):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(path)
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    continue
+        return snapshot
+
+    def read(self, timeout: Optional[float]) -> Set[Path]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = self.interval if deadline is None else min(self.interval, max(0.0, deadline - time.monotonic()))
+            time.sleep(delay)
+            snapshot = self._scan()
+            changed = {
+                path for path in snapshot.keys() | self.snapshot.keys()
+                if snapshot.get(path) != self.snapshot.get(path)
+            }
+            self.snapshot = snapshot
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def close(self) -> None:
+        pass
+
+
+class _InotifyBackend:
+    """使用 inotify 接收变更事件；inotify 不递归，每个目录单独监听"""
+
+    name = 'inotify'
+
+    def __init__(self, roots: List[Path], ignore: Callable[[Path], bool]):
+        from inotify_simple import INotify, flags
+        self.flags = flags
+        self.ignore = ignore
+        self.inotify = INotify()
+        self.mask = (flags.CREATE | flags.CLOSE_WRITE | flags.MODIFY | flags.DELETE |
+                     flags.MOVED_FROM | flags.MOVED_TO | flags.ATTRIB)
+        self.watches: Dict[int, Path] = {}
+        for root in roots:
+            if root.exists():
+                self._watch_tree(root)
+
+    def _watch_tree(self, root: Path) -> None:
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                self.watches[self.inotify.add_watch(str(directory), self.mask)] = directory
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                path = Path(entry.path)
+                if entry.is_dir(follow_symlinks=False) and not self.ignore(path):
+                    stack.append(path)
+
+    def read(self, timeout: Optional[float]) -> Set[Path]:
+        changed: Set[Path] = set()
+        events = self.inotify.read(timeout=None if timeout is None else int(timeout * 1000))
+        for event in events:
+            directory = self.watches.get(event.wd)
+            if directory is None or not event.name:
+                continue
+            path = directory / event.name
+            if self.ignore(path):
+                continue
+            if event.mask & self.flags.ISDIR:
+                # 新建或移入的目录需要补充监听，其中已有的文件也算作变更
+                if event.mask & (self.flags.CREATE | self.flags.MOVED_TO):
+                    self._watch_tree(path)
+                    changed.update(p for p in path.rglob('*') if p.is_file() and not self.ignore(p))
+                continue
+            changed.add(path)
+        return changed
+
+    def close(self) -> None:
+        self.inotify.close()
+
+
+class FileWatcher:
+    """监听目录树的文件变更"""
+
+    def __init__(self, roots: List[Path], ignore: Optional[Callable[[Path], bool]] = None,
+                 interval: float = 0.5):
+        ignore = ignore or (lambda path: False)
+        try:
+            self.backend = _InotifyBackend(roots, ignore)
+        except (ImportError, OSError) as e:
+            logger.debug(f"inotify unavailable, polling every {interval}s: {e}")
+            self.backend = _PollingBackend(roots, ignore, interval)
+
+    @property
+    def backend_name(self) -> str:
+        return self.backend.name
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        """等待变更；timeout 为None时一直等到有变更为止"""
+        while True:
+            changed = self.backend.read(timeout)
+            if changed or timeout is not None:
+                return changed
+
+    def changes(self, debounce: float = DEFAULT_DEBOUNCE,
+                max_delay: float = DEFAULT_MAX_DELAY) -> Iterator[Set[Path]]:
+        """逐批返回变更：静默 debounce 秒或累计等待 max_delay 秒后输出一批"""
+        while True:
+            batch = self.wait()
+            started = time.monotonic()
+            while True:
+                remaining = max_delay - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+                more = self.wait(min(debounce, remaining))
+                if not more:
+                    break
+                batch |= more
+            yield batch
+
+    def close(self) -> None:
+        self.backend.close()
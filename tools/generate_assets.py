@@ -2,11 +2,18 @@
 # -*- coding: utf-8 -*-
 """
 Generate site assets: favicon and OG image
+
+The images only depend on the constants in this script, so assets that
+already exist and are newer than the script are left alone and PIL is not
+imported at all when nothing needs to be drawn.
 """
 from pathlib import Path
-from PIL import Image, ImageDraw, ImageFont
 import os
 
+from build_logger import setup_logging, BuildError
+
+logger = setup_logging('generate_assets')
+
 BRAND_COLOR = "#ff4d6d"
 BG_COLOR = "#0f1115"
 CARD_COLOR = "#151924"
@@ -14,6 +21,8 @@ TEXT_COLOR = "#e6e9ef"
 
 def create_icon(size, output_path):
     """Create a simple icon with 'TN' text."""
+    from PIL import Image, ImageDraw, ImageFont
+    
     img = Image.new('RGBA', (size, size), BG_COLOR)
     draw = ImageDraw.Draw(img)
     
@@ -46,6 +55,8 @@ def create_icon(size, output_path):
 
 def create_og_image(output_path):
     """Create OG image (1200x630) with site title and description."""
+    from PIL import Image, ImageDraw, ImageFont
+    
     width = 1200
     height = 630
     
@@ -84,10 +95,14 @@ def create_og_image(output_path):
     # 保存
     img.save(output_path, quality=95)
 
-def main():
-    from build_logger import setup_logging, BuildError
-    logger = setup_logging('generate_assets')
-    
+def is_up_to_date(output_path: Path) -> bool:
+    """输出存在且比本脚本新时无需重新生成"""
+    try:
+        return output_path.stat().st_mtime_ns >= Path(__file__).stat().st_mtime_ns
+    except OSError:
+        return False
+
+def main(force: bool = False):
     try:
         # 确保目录存在
         assets_dir = Path(__file__).resolve().parents[1] / 'docs' / 'assets'
@@ -102,6 +117,14 @@ def main():
             (512, 'icon-512.png')
         ]
         
+        # 跳过已是最新的资源
+        if not force:
+            icons = [(size, name) for size, name in icons if not is_up_to_date(assets_dir / name)]
+        need_og = force or not is_up_to_date(assets_dir / 'og-image.png')
+        if not icons and not need_og:
+            logger.info(f"Assets in {assets_dir} are up to date")
+            return
+        
         # 并行生成图标
         from concurrent.futures import ThreadPoolExecutor
         
@@ -129,7 +152,8 @@ def main():
             list(executor.map(generate_icon, icons))
             
             # 生成 OG 图片
-            executor.submit(generate_og).result()
+            if need_og:
+                executor.submit(generate_og).result()
         
         logger.info(f"Generated all assets in {assets_dir}")
         
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Garbage collection for processed image outputs and the image cache.
+
+Outputs in docs/images/ and image cache entries in the build state database
+are only kept while a note still references their source image. Everything
+else is reported (or deleted) as an orphan, and the remaining cache is
+trimmed to a size budget in least-recently-used order. Per-image .cache
+files left in docs/images/.cache/ by older builds are removed as orphans.
+"""
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, Any
+
+from asset_manager import RE_VERSIONED
+from build_logger import setup_logging, BuildError
+from build_state import get_build_state
+
+logger = setup_logging('image_gc')
+
+# 缓存默认上限：64 MB
+DEFAULT_MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+# 图片缓存条目：(缓存键, 大小, 最近访问时间)
+CacheEntry = Tuple[str, int, float]
+
+
+class ImageGarbageCollector:
+    """清理源图片或笔记被删除后遗留的图片输出和缓存"""
+
+    def __init__(self, root_dir: Path, output_dir: Optional[Path] = None,
+                 cache_dir: Optional[Path] = None,
+                 max_cache_bytes: int = DEFAULT_MAX_CACHE_BYTES):
+        # 统一使用绝对路径，与 ImageProcessor 记录的路径一致
+        self.root_dir = root_dir = root_dir.resolve()
+        self.output_dir = output_dir or root_dir / 'docs' / 'images'
+        self.cache_dir = cache_dir or self.output_dir / '.cache'
+        self.max_cache_bytes = max_cache_bytes
+        # 图片缓存条目所在的构建状态数据库（与 ImageProcessor 使用同一个）
+        self.state = get_build_state(root_dir)
+
+        # 源图片目录（process_images 会在其中生成 *_thumb 文件）
+        self.source_dirs = [root_dir / 'images']
+        self.source_dirs.extend((root_dir / 'notes').glob('*/images'))
+
+    def collect_live_sources(self) -> Set[Path]:
+        """从笔记前言区收集仍被引用且存在的源图片"""
+        from build_index import CATEGORIES, parse_date_from_filename, read_front_matter
+
+        live: Set[Path] = set()
+        for category in CATEGORIES:
+            cat_dir = self.root_dir / 'notes' / category
+            if not cat_dir.exists():
+                continue
+            for note in cat_dir.glob('*.md'):
+                if not parse_date_from_filename(note.name):
+                    continue
+                images = read_front_matter(note).get('images', [])
+                if not isinstance(images, list):
+                    continue
+                for img in images:
+                    if not isinstance(img, dict) or 'path' not in img:
+                        continue
+                    img_path = self.root_dir / img['path']
+                    if img_path.exists():
+                        live.add(img_path)
+        return live
+
+    def collect(self, dry_run: bool = False) -> Dict[str, Any]:
+        """执行一次清理，返回清理报告；dry_run 时只报告不删除"""
+        from image_processor import ImageProcessor
+
+        try:
+            processor = ImageProcessor(self.output_dir, self.cache_dir, self.state, root_dir=self.root_dir)
+            live_sources = self.collect_live_sources()
+
+            # 计算存活的输出文件和缓存键
+            live_outputs: Set[str] = set()
+            live_keys: Set[str] = set()
+            for source in live_sources:
+                names = processor.output_names(source)
+                live_outputs.update(names.values())
+                cache_key = processor._compute_cache_key(source)
+                live_keys.add(cache_key)
+                # 去重后的图片引用的是另一张图片的输出
+                cached = self._read_cache_entry(cache_key)
+                if cached:
+                    live_outputs.update(cached[k] for k in names if k in cached)
+
+            orphaned_outputs = self._find_orphaned_outputs(live_outputs)
+            orphaned_thumbs = self._find_orphaned_thumbs()
+            orphaned_cache, live_cache = self._partition_cache(live_keys)
+            evicted_cache = self._select_lru_evictions(live_cache)
+            legacy_cache = self._find_legacy_cache_files()
+
+            doomed = orphaned_outputs + orphaned_thumbs + legacy_cache
+            doomed_keys = [key for key, _, _ in orphaned_cache + evicted_cache]
+            freed_bytes = (sum(p.stat().st_size for p in doomed) +
+                           sum(size for _, size, _ in orphaned_cache + evicted_cache))
+
+            if not dry_run:
+                for path in doomed:
+                    path.unlink(missing_ok=True)
+                self.state.delete_image_variants(doomed_keys)
+                self._prune_phash_index(live_outputs)
+
+            report = {
+                'dry_run': dry_run,
+                'live_sources': len(live_sources),
+                'orphaned_outputs': [str(p) for p in orphaned_outputs + orphaned_thumbs],
+                'orphaned_cache': [key for key, _, _ in orphaned_cache] + [str(p) for p in legacy_cache],
+                'evicted_cache': [key for key, _, _ in evicted_cache],
+                'freed_bytes': freed_bytes
+            }
+
+            action = 'Would remove' if dry_run else 'Removed'
+            logger.info(
+                f"{action} {len(report['orphaned_outputs'])} orphaned outputs, "
+                f"{len(report['orphaned_cache'])} orphaned and {len(evicted_cache)} evicted cache entries "
+                f"({freed_bytes} bytes)"
+            )
+            return report
+
+        except Exception as e:
+            logger.error(f"Image garbage collection failed: {e}")
+            raise BuildError("Failed to collect orphaned images") from e
+
+    def _read_cache_entry(self, cache_key: str) -> Optional[Dict[str, str]]:
+        """读取缓存条目，但不刷新其访问时间"""
+        return self.state.get_image_variant(cache_key, touch=False)
+
+    def _prune_phash_index(self, live_outputs: Set[str]) -> None:
+        """从感知哈希索引中移除输出已被清理的条目"""
+        index = self.state.load_image_phashes()
+        self.state.delete_image_phashes(
+            phash for phash, info in index.items() if info.get('optimized') not in live_outputs
+        )
+
+    def _find_orphaned_outputs(self, live_outputs: Set[str]) -> List[Path]:
+        """查找输出目录中不再被引用的文件"""
+        if not self.output_dir.exists():
+            return []
+
+        orphans = []
+        for entry in os.scandir(self.output_dir):
+            if not entry.is_file() or entry.name.startswith('.'):
+                continue
+            name = entry.name
+            # 已存活输出的版本化副本交由 AssetManager 管理
+            match = RE_VERSIONED.match(name)
+            if name in live_outputs or (match and match['stem'] + match['ext'] in live_outputs):
+                continue
+            orphans.append(Path(entry.path))
+        return orphans
+
+    def _find_orphaned_thumbs(self) -> List[Path]:
+        """查找源图片目录中源文件已删除的 *_thumb 文件"""
+        orphans = []
+        for source_dir in self.source_dirs:
+            if not source_dir.exists():
+                continue
+            for thumb in source_dir.rglob('*_thumb.*'):
+                source = thumb.with_name(thumb.name.replace('_thumb', '', 1))
+                if not source.exists():
+                    orphans.append(thumb)
+        return orphans
+
+    def _partition_cache(self, live_keys: Set[str]) -> Tuple[List[CacheEntry], List[CacheEntry]]:
+        """将缓存条目 (键, 大小, 访问时间) 分为孤立条目和存活条目"""
+        orphaned, live = [], []
+        for entry in self.state.image_variant_usage():
+            (live if entry[0] in live_keys else orphaned).append(entry)
+        return orphaned, live
+
+    def _select_lru_evictions(self, entries: List[CacheEntry]) -> List[CacheEntry]:
+        """超出缓存上限时，按最久未使用顺序选出需要淘汰的条目"""
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_cache_bytes:
+            return []
+
+        evicted = []
+        for entry in sorted(entries, key=lambda item: item[2]):
+            if total <= self.max_cache_bytes:
+                break
+            evicted.append(entry)
+            total -= entry[1]
+        return evicted
+
+    def _find_legacy_cache_files(self) -> List[Path]:
+        """旧版本按图片写出的 .cache 文件，缓存已移入构建状态数据库"""
+        if not self.cache_dir.exists():
+            return []
+        return [Path(entry.path) for entry in os.scandir(self.cache_dir)
+                if entry.is_file() and entry.name.endswith('.cache')]
+
+def main():
+    """主入口函数"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Remove orphaned image outputs and cache entries')
+    parser.add_argument('root_dir', type=Path, help='Project root directory')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be removed')
+    parser.add_argument('--max-cache-mb', type=int, default=DEFAULT_MAX_CACHE_BYTES // (1024 * 1024),
+                        help='Maximum size of the image cache in MB')
+    args = parser.parse_args()
+
+    try:
+        collector = ImageGarbageCollector(
+            args.root_dir,
+            max_cache_bytes=args.max_cache_mb * 1024 * 1024
+        )
+        report = collector.collect(dry_run=args.dry_run)
+        for path in report['orphaned_outputs'] + report['orphaned_cache'] + report['evicted_cache']:
+            logger.info(f"  {path}")
+    except Exception as e:
+        logger.error(f"Image garbage collection failed: {e}")
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
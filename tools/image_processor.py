@@ -3,10 +3,10 @@
 """
 Image processing utilities for tobacco notes.
 """
-import os
 from pathlib import Path
-from typing import Optional, Tuple, Dict
+from typing import Any, Optional, Tuple, Dict
 import hashlib
+import threading
 from PIL import Image, ImageOps
 import piexif
 from concurrent.futures import ThreadPoolExecutor
@@ -15,17 +15,34 @@ from build_logger import setup_logging, BuildError
 
 logger = setup_logging('image_processor')
 
+# 工具脚本所在的仓库根目录
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
 class ImageProcessor:
     """处理和优化图片的工具类"""
     
-    def __init__(self, output_dir: Path, cache_dir: Optional[Path] = None):
+    def __init__(self, output_dir: Path, cache_dir: Optional[Path] = None, state: Optional[Any] = None,
+                 root_dir: Optional[Path] = None):
         self.output_dir = output_dir
         self.cache_dir = cache_dir or output_dir / '.cache'
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         
+        # 缓存键使用相对于仓库根目录的路径，与工作目录和调用方式无关；
+        # 未指定时使用本工具所在的仓库，与输出目录的位置无关
+        self.root_dir = (root_dir or REPO_ROOT).resolve()
+        
+        # 处理结果和感知哈希索引保存在该仓库的构建状态数据库中
+        if state is None:
+            from build_state import get_build_state
+            state = get_build_state(self.root_dir)
+        self.state = state
+        
         # 支持的图片格式
         self.supported_formats = {'.jpg', '.jpeg', '.png', '.webp'}
         
+        # 最大输出尺寸（较长边 2000px，见 docs/image-guidelines.md）
+        self.max_size = (2000, 2000)
+        
         # 缩略图尺寸
         self.thumb_size = (300, 300)
         
@@ -33,6 +50,13 @@ class ImageProcessor:
         self.jpeg_quality = 85
         self.webp_quality = 80
         
+        # 感知哈希去重：汉明距离不超过阈值视为同一张图片
+        self.phash_threshold = 4
+        self.color_threshold = 16
+        self._phash_index: Optional[Dict[str, Dict[str, str]]] = None
+        self._phash_lock = threading.Lock()
+        self._pending_phashes: Dict[str, threading.Event] = {}
+        
     def process_image(self, image_path: Path) -> Dict[str, str]:
         """处理单个图片，返回处理后的图片信息"""
         if not image_path.exists():
@@ -57,17 +81,43 @@ class ImageProcessor:
                 if 'exif' in img.info:
                     exif_data = img.info['exif']
                 
+                # 大尺寸 JPEG 直接在 DCT 域按比例解码，避免按原始分辨率解码
+                self._draft(img, self.max_size)
+                
                 # 自动旋转图片
                 img = ImageOps.exif_transpose(img)
                 
-                # 生成优化后的图片
-                optimized = self._optimize_image(img, image_path.name)
+                # 限制输出尺寸；非 JPEG 源先做整数倍缩小再精细重采样
+                if img.width > self.max_size[0] or img.height > self.max_size[1]:
+                    img.thumbnail(self.max_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
                 
-                # 生成 WebP 版本
-                webp = self._convert_to_webp(img, image_path.name)
+                # 近似重复的图片直接复用已编码的版本
+                phash = self._compute_phash(img)
+                duplicate = self._claim_phash(phash)
+                if duplicate:
+                    logger.info(f"Reusing variants of {Path(duplicate['original']).name} for {image_path.name}")
+                    info = {
+                        'original': str(image_path),
+                        'optimized': duplicate['optimized'],
+                        'webp': duplicate['webp'],
+                        'thumbnail': duplicate['thumbnail'],
+                        'duplicate_of': duplicate['original']
+                    }
+                    self._cache_info(cache_key, info)
+                    return info
                 
-                # 生成缩略图
-                thumb = self._create_thumbnail(img, image_path.name)
+                try:
+                    # 生成优化后的图片
+                    optimized = self._optimize_image(img, image_path.name)
+                    
+                    # 生成 WebP 版本
+                    webp = self._convert_to_webp(img, image_path.name)
+                    
+                    # 生成缩略图
+                    thumb = self._create_thumbnail(img, image_path.name)
+                except Exception:
+                    self._release_phash(phash)
+                    raise
                 
                 # 保存处理结果
                 info = {
@@ -79,6 +129,7 @@ class ImageProcessor:
                 
                 # 缓存结果
                 self._cache_info(cache_key, info)
+                self._register_phash(phash, info)
                 
                 return info
                 
@@ -86,9 +137,37 @@ class ImageProcessor:
             logger.error(f"Error processing image {image_path}: {e}")
             raise BuildError(f"Failed to process image {image_path}") from e
             
+    def _draft(self, img: Image.Image, size: Tuple[int, int]) -> None:
+        """源图片远大于目标尺寸时，配置 JPEG 解码器按 1/2、1/4 或 1/8 缩小解码
+        
+        draft 只对 JPEG 生效，且选择的缩放比例保证解码结果不小于目标尺寸，
+        之后仍由 LANCZOS 重采样得到最终尺寸。必须在读取像素数据之前调用。
+        """
+        width, height = img.size
+        ratio = min(size[0] / width, size[1] / height)
+        if ratio > 0.5:
+            return
+        img.draft(None, (max(1, int(width * ratio)), max(1, int(height * ratio))))
+        
+    def predict_outputs(self, image_path: Path) -> Dict[str, str]:
+        """预测图片的处理结果而不进行编码：优先使用缓存，否则使用默认输出文件名"""
+        cached_info = self._get_cached_info(self._compute_cache_key(image_path))
+        if cached_info:
+            return cached_info
+        return {'original': str(image_path), **self.output_names(image_path)}
+        
+    def output_names(self, image_path: Path) -> Dict[str, str]:
+        """返回图片各输出版本的文件名（相对于输出目录）"""
+        stem = Path(image_path.name).stem
+        return {
+            'optimized': image_path.name,
+            'webp': f"{stem}.webp",
+            'thumbnail': f"{stem}_thumb.jpg"
+        }
+        
     def _optimize_image(self, img: Image.Image, name: str) -> str:
         """优化图片质量和大小"""
-        output_path = self.output_dir / name
+        output_path = self.output_dir / self.output_names(Path(name))['optimized']
         
         # 转换为RGB模式
         if img.mode in ('RGBA', 'LA'):
@@ -109,7 +188,7 @@ class ImageProcessor:
         
     def _convert_to_webp(self, img: Image.Image, name: str) -> str:
         """转换图片为WebP格式"""
-        output_path = self.output_dir / f"{Path(name).stem}.webp"
+        output_path = self.output_dir / self.output_names(Path(name))['webp']
         
         # 保存WebP版本
         img.save(
@@ -124,11 +203,11 @@ class ImageProcessor:
         
     def _create_thumbnail(self, img: Image.Image, name: str) -> str:
         """创建缩略图"""
-        output_path = self.output_dir / f"{Path(name).stem}_thumb.jpg"
+        output_path = self.output_dir / self.output_names(Path(name))['thumbnail']
         
         # 创建缩略图
         thumb = img.copy()
-        thumb.thumbnail(self.thumb_size, Image.Resampling.LANCZOS)
+        thumb.thumbnail(self.thumb_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
         
         # 保存缩略图
         thumb.save(
@@ -140,40 +219,130 @@ class ImageProcessor:
         
         return str(output_path.relative_to(self.output_dir))
         
+    def _compute_phash(self, img: Image.Image) -> str:
+        """计算图片的感知哈希：64 位差值哈希（dHash）加平均颜色"""
+        small = img.convert('L').resize((9, 8), Image.Resampling.LANCZOS)
+        # L 模式每个像素一个字节
+        pixels = small.tobytes()
+        bits = 0
+        for row in range(8):
+            for col in range(8):
+                left = pixels[row * 9 + col]
+                right = pixels[row * 9 + col + 1]
+                bits = (bits << 1) | (left > right)
+        
+        # dHash 只描述明暗梯度，纯色图片的哈希全部相同，需再比较平均颜色
+        r, g, b = img.convert('RGB').resize((1, 1), Image.Resampling.BOX).getpixel((0, 0))
+        return f"{bits:016x}-{r:02x}{g:02x}{b:02x}"
+        
+    def _load_phash_index(self) -> Dict[str, Dict[str, str]]:
+        """加载感知哈希索引（调用方需持有锁）"""
+        if self._phash_index is None:
+            self._phash_index = self.state.load_image_phashes()
+        return self._phash_index
+        
+    def _match_phash(self, phash: str, candidates) -> Optional[str]:
+        """在候选哈希中查找与给定哈希近似的一个"""
+        bits, color = self._split_phash(phash)
+        for other in candidates:
+            other_bits, other_color = self._split_phash(other)
+            if bin(bits ^ other_bits).count('1') > self.phash_threshold:
+                continue
+            if max(abs(a - b) for a, b in zip(color, other_color)) > self.color_threshold:
+                continue
+            return other
+        return None
+        
+    def _find_duplicate(self, phash: str) -> Optional[Dict[str, str]]:
+        """查找与给定哈希近似且输出文件仍然存在的已处理图片（调用方需持有锁）"""
+        index = self._load_phash_index()
+        live = [
+            other for other, info in index.items()
+            if all(info.get(k) and (self.output_dir / info[k]).exists()
+                   for k in ('optimized', 'webp', 'thumbnail'))
+        ]
+        match = self._match_phash(phash, live)
+        return index[match] if match else None
+        
+    def _claim_phash(self, phash: str) -> Optional[Dict[str, str]]:
+        """返回可复用的已处理图片；没有时登记为正在编码，调用方负责注册或释放。
+        
+        并行处理时，近似图片若正在被其他线程编码，则等待其完成后复用。
+        """
+        while True:
+            with self._phash_lock:
+                duplicate = self._find_duplicate(phash)
+                if duplicate:
+                    return duplicate
+                pending = self._match_phash(phash, self._pending_phashes)
+                if pending is None:
+                    self._pending_phashes[phash] = threading.Event()
+                    return None
+                event = self._pending_phashes[pending]
+            event.wait()
+        
+    def _release_phash(self, phash: str) -> None:
+        """释放未能完成编码的哈希登记"""
+        with self._phash_lock:
+            event = self._pending_phashes.pop(phash, None)
+        if event:
+            event.set()
+        
+    @staticmethod
+    def _split_phash(phash: str) -> Tuple[int, Tuple[int, int, int]]:
+        """拆分感知哈希为 dHash 位和平均颜色"""
+        bits, color = phash.split('-')
+        return int(bits, 16), tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+        
+    def _register_phash(self, phash: str, info: Dict[str, str]) -> None:
+        """记录新编码图片的感知哈希"""
+        with self._phash_lock:
+            index = self._load_phash_index()
+            index[phash] = info
+            self.state.put_image_phash(phash, info)
+        self._release_phash(phash)
+        
     def _compute_cache_key(self, image_path: Path) -> str:
-        """计算图片的缓存键"""
+        """计算图片的缓存键：相对于仓库根目录的路径、大小和修改时间"""
         stat = image_path.stat()
-        content = f"{image_path}:{stat.st_size}:{stat.st_mtime}"
+        resolved = image_path.resolve()
+        try:
+            key_path = resolved.relative_to(self.root_dir).as_posix()
+        except ValueError:
+            key_path = resolved.as_posix()
+        content = f"{key_path}:{stat.st_size}:{stat.st_mtime}"
         return hashlib.sha1(content.encode()).hexdigest()
         
     def _get_cached_info(self, cache_key: str) -> Optional[Dict[str, str]]:
-        """获取缓存的处理结果"""
-        cache_file = self.cache_dir / f"{cache_key}.cache"
-        if cache_file.exists():
-            try:
-                import json
-                return json.loads(cache_file.read_text())
-            except:
-                return None
-        return None
+        """获取缓存的处理结果（同时刷新访问时间，供缓存的 LRU 淘汰使用）"""
+        try:
+            return self.state.get_image_variant(cache_key)
+        except Exception as e:
+            logger.warning(f"Failed to read cached info for {cache_key}: {e}")
+            return None
         
     def _cache_info(self, cache_key: str, info: Dict[str, str]) -> None:
         """缓存处理结果"""
-        cache_file = self.cache_dir / f"{cache_key}.cache"
         try:
-            import json
-            cache_file.write_text(json.dumps(info))
-        except:
-            logger.warning(f"Failed to cache info for {cache_key}")
+            self.state.put_image_variant(cache_key, info)
+        except Exception as e:
+            logger.warning(f"Failed to cache info for {cache_key}: {e}")
             
     def process_batch(self, image_paths: list[Path], max_workers: Optional[int] = None) -> Dict[str, Dict[str, str]]:
-        """并行处理多个图片"""
+        """并行处理多个图片，按预估开销从大到小调度"""
+        from parallel_processor import schedule_image_jobs, get_image_worker_count
+        
         results = {}
+        jobs = schedule_image_jobs(image_paths)
+        if not jobs:
+            return results
+        if max_workers is None:
+            max_workers = get_image_worker_count(jobs)
         
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             future_to_path = {
-                executor.submit(self.process_image, path): path
-                for path in image_paths
+                executor.submit(self.process_image, job.path): job.path
+                for job in jobs
             }
             
             for future in future_to_path:
@@ -192,10 +361,12 @@ def main():
     parser.add_argument('input_dir', type=Path, help='Input directory containing images')
     parser.add_argument('output_dir', type=Path, help='Output directory for processed images')
     parser.add_argument('--cache-dir', type=Path, help='Cache directory')
+    parser.add_argument('--root-dir', type=Path, default=REPO_ROOT,
+                        help='Repository whose build state caches the results (default: this repository)')
     args = parser.parse_args()
     
     try:
-        processor = ImageProcessor(args.output_dir, args.cache_dir)
+        processor = ImageProcessor(args.output_dir, args.cache_dir, root_dir=args.root_dir)
         
         # 收集所有图片
         image_paths = []
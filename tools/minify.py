@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Conservative pure-Python minifiers for the site's CSS and JavaScript.
+
+Both minifiers only remove comments and redundant whitespace; they never
+rename identifiers or rewrite syntax. The JavaScript minifier keeps line
+breaks between statements so automatic semicolon insertion behaves exactly
+as in the source. Comments starting with /*! (licence headers) are kept.
+"""
+import re
+from pathlib import Path
+from typing import List
+
+from build_logger import setup_logging
+
+logger = setup_logging('minify')
+
+# CSS：字符串、注释、空白和其他内容
+RE_CSS_TOKEN = re.compile(
+    r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')'   # 字符串
+    r'|(/\*.*?\*/)'                                # 注释
+    r'|(\s+)'                                      # 空白
+    r'|([{};,>:]|[^"\'/\s{};,>:]+|/)',             # 符号或其他
+    re.S | re.I
+)
+
+# CSS中两侧空白可以去掉的符号
+CSS_PUNCTUATION = set('{};,>')
+
+# JS中可以去掉相邻空白的符号（不含 + - / . 以免拼出 ++、--、注释或数字）
+JS_PUNCTUATION = set('{}()[];,:=<>!?&|*%^~')
+
+# 这些关键字之后的 / 是正则表达式字面量而不是除号
+JS_REGEX_KEYWORDS = {
+    'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void',
+    'throw', 'case', 'do', 'else', 'yield', 'await'
+}
+
+
+def minify_css(source: str) -> str:
+    """压缩CSS：去掉注释和多余空白，保留字符串原样"""
+    out: List[str] = []
+    pending_space = False
+
+    for match in RE_CSS_TOKEN.finditer(source):
+        string, comment, space, other = match.groups()
+        if comment is not None:
+            # 注释不等同于空白（.a/**/.b 即 .a.b），直接丢弃
+            if comment.startswith('/*!'):
+                out.append(comment)
+            continue
+        if space is not None:
+            pending_space = True
+            continue
+
+        token = string or other
+        if pending_space and out:
+            prev = out[-1][-1]
+            if prev not in CSS_PUNCTUATION and prev != ':' and token[0] not in CSS_PUNCTUATION:
+                out.append(' ')
+        pending_space = False
+
+        # 去掉块结束前多余的分号
+        if token == '}' and out and out[-1] == ';':
+            out.pop()
+        out.append(token)
+
+    return ''.join(out).strip()
+
+
+def _is_ident_char(ch: str) -> bool:
+    return ch.isalnum() or ch in '_$' or ord(ch) > 127
+
+
+def _skip_string(source: str, i: int) -> int:
+    """返回从 i 开始的字符串字面量结束后的位置"""
+    quote = source[i]
+    i += 1
+    while i < len(source):
+        ch = source[i]
+        if ch == '\\':
+            i += 2
+            continue
+        if ch == quote or ch == '\n':
+            return i + 1
+        i += 1
+    return i
+
+
+def _skip_regex(source: str, i: int) -> int:
+    """返回从 i 开始的正则表达式字面量（含标志）结束后的位置"""
+    i += 1
+    in_class = False
+    while i < len(source):
+        ch = source[i]
+        if ch == '\\':
+            i += 2
+            continue
+        if ch == '\n':
+            return i
+        if in_class:
+            if ch == ']':
+                in_class = False
+        elif ch == '[':
+            in_class = True
+        elif ch == '/':
+            i += 1
+            while i < len(source) and _is_ident_char(source[i]):
+                i += 1
+            return i
+        i += 1
+    return i
+
+
+def _skip_template(source: str, i: int) -> int:
+    """返回从 i 开始的模板字符串结束后的位置，正确跳过嵌套的 ${...}"""
+    i += 1
+    while i < len(source):
+        ch = source[i]
+        if ch == '\\':
+            i += 2
+            continue
+        if ch == '`':
+            return i + 1
+        if ch == '$' and source.startswith('${', i):
+            i = _skip_template_expression(source, i + 2)
+            continue
+        i += 1
+    return i
+
+
+def _skip_template_expression(source: str, i: int) -> int:
+    """跳过模板字符串中的 ${...} 表达式，返回右花括号之后的位置"""
+    depth = 1
+    while i < len(source):
+        ch = source[i]
+        if ch in '"\'':
+            i = _skip_string(source, i)
+            continue
+        if ch == '`':
+            i = _skip_template(source, i)
+            continue
+        if ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+
+def _regex_allowed(out: List[str]) -> bool:
+    """根据前一个有效记号判断 / 是否开始一个正则表达式字面量"""
+    text = ''.join(out[-3:]).rstrip()
+    if not text:
+        return True
+    prev = text[-1]
+    if prev in ')]}' or prev in '"\'`':
+        return False
+    if _is_ident_char(prev):
+        word = re.search(r'[\w$]+$', text)
+        return bool(word) and word.group(0) in JS_REGEX_KEYWORDS
+    return True
+
+
+def minify_js(source: str) -> str:
+    """压缩JavaScript：去掉注释和多余空白，保留换行以保证自动分号插入行为不变"""
+    out: List[str] = []
+    i = 0
+    n = len(source)
+    pending_space = False
+    pending_newline = False
+
+    def emit(token: str) -> None:
+        nonlocal pending_space, pending_newline
+        if out and (pending_space or pending_newline):
+            prev = out[-1][-1]
+            nxt = token[0]
+            if pending_newline and prev not in '{[(,;' and nxt not in '}])':
+                out.append('\n')
+            elif _is_ident_char(prev) and _is_ident_char(nxt):
+                out.append(' ')
+            elif prev not in JS_PUNCTUATION and nxt not in JS_PUNCTUATION:
+                # 保留空白，避免 a + +b 变成 a++b 之类的歧义
+                out.append(' ')
+        pending_space = pending_newline = False
+        out.append(token)
+
+    while i < n:
+        ch = source[i]
+
+        if ch in ' \t\r\f\v\ufeff\u00a0':
+            pending_space = True
+            i += 1
+        elif ch == '\n':
+            pending_newline = True
+            i += 1
+        elif ch == '/' and source.startswith('//', i):
+            end = source.find('\n', i)
+            i = n if end == -1 else end
+        elif ch == '/' and source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            end = n if end == -1 else end + 2
+            comment = source[i:end]
+            if comment.startswith('/*!'):
+                emit(comment)
+                pending_newline = True
+            elif '\n' in comment:
+                pending_newline = True
+            else:
+                pending_space = True
+            i = end
+        elif ch in '"\'':
+            end = _skip_string(source, i)
+            emit(source[i:end])
+            i = end
+        elif ch == '`':
+            end = _skip_template(source, i)
+            emit(source[i:end])
+            i = end
+        elif ch == '/' and _regex_allowed(out):
+            end = _skip_regex(source, i)
+            emit(source[i:end])
+            i = end
+        elif _is_ident_char(ch):
+            j = i + 1
+            while j < n and (_is_ident_char(source[j]) or
+                             (source[j] == '.' and source[i].isdigit())):
+                j += 1
+            emit(source[i:j])
+            i = j
+        else:
+            emit(ch)
+            i += 1
+
+    return ''.join(out).strip() + '\n'
+
+
+def minify_file(path: Path) -> str:
+    """按扩展名压缩文件内容并返回压缩结果"""
+    source = path.read_text(encoding='utf-8')
+    if path.suffix == '.css':
+        return minify_css(source)
+    if path.suffix == '.js':
+        return minify_js(source)
+    raise ValueError(f"Unsupported file type for minification: {path}")
+
+
+def main():
+    """主入口函数"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Minify CSS and JavaScript files')
+    parser.add_argument('files', type=Path, nargs='+', help='Files to minify')
+    args = parser.parse_args()
+
+    for path in args.files:
+        minified = minify_file(path)
+        before = path.stat().st_size
+        after = len(minified.encode('utf-8'))
+        logger.info(f"{path}: {before} -> {after} bytes ({100 - after * 100 // max(before, 1)}% smaller)")
+
+if __name__ == '__main__':
+    main()
@@ -4,8 +4,13 @@
 Parallel processing utilities for build process.
 """
 import multiprocessing
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
-from typing import List, Callable, Any, Optional
+import time
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+)
+from dataclasses import dataclass
+from typing import List, Callable, Any, Deque, Dict, NamedTuple, Optional, Sequence, Tuple
 from pathlib import Path
 import os
 
@@ -13,112 +18,343 @@ from build_logger import setup_logging, BuildError
 
 logger = setup_logging('parallel_processor')
 
+@dataclass
+class TaskResult:
+    """Outcome of processing one item."""
+    item: Any
+    value: Any = None
+    error: Optional[BaseException] = None
+    attempts: int = 0
+    duration: float = 0.0
+    
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+ProgressCallback = Callable[[int, int, TaskResult], None]
+
+def create_process_pool(max_workers: int,
+                        initializer: Optional[Callable[[], None]] = None) -> ProcessPoolExecutor:
+    """
+    Create a process pool that is safe to start from a multi-threaded parent.
+    
+    Build stages run in threads, and forking while another thread holds a
+    lock (e.g. a logging handler's) can deadlock the child, so workers are
+    started through a fork server (or spawned where that is unavailable).
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=initializer)
+
+def _call_task(task: Callable[[], Any]) -> Any:
+    """Run a zero-argument task (module level so process pools can pickle it)."""
+    return task()
+
+def _traced_call(processor: Callable[[Any], Any], name: str, item: Any) -> Tuple[Any, Optional[Exception], Any]:
+    """
+    Run processor(item) in a worker and return (value, error, span).
+    
+    The span carries the worker's pid and thread id; errors are returned
+    rather than raised so the span reaches the parent either way.
+    """
+    from performance_monitor import current_span
+    start = time.time()
+    try:
+        value, error = processor(item), None
+    except Exception as e:
+        value, error = None, e
+    return value, error, current_span(name, start, category='worker')
+
 class ParallelProcessor:
     """Manages parallel processing of build tasks."""
     
-    def __init__(self, max_workers: Optional[int] = None):
-        """Initialize processor with optional worker limit."""
+    def __init__(self, max_workers: Optional[int] = None, executor: Optional[Executor] = None,
+                 monitor: Optional[Any] = None):
+        """
+        Initialize processor with optional worker limit.
+        
+        A long-lived ``executor`` (e.g. the warm pool kept by watch mode) is
+        used instead of creating a pool per call; it is never shut down here.
+        With a PerformanceMonitor, every attempt is recorded as a trace span
+        on the worker process and thread that ran it.
+        """
         if max_workers is None:
             max_workers = min(32, (os.cpu_count() or 1) + 4)
         self.max_workers = max_workers
+        self.executor = executor
+        self.monitor = monitor
         
     def process_files(self, 
-                     files: List[Path],
-                     processor: Callable[[Path], Any],
+                     files: Sequence[Any],
+                     processor: Callable[[Any], Any],
                      use_processes: bool = False,
-                     chunk_size: Optional[int] = None) -> List[Exception]:
+                     max_in_flight: Optional[int] = None,
+                     timeout: Optional[float] = None,
+                     retries: int = 0,
+                     progress: Optional[ProgressCallback] = None,
+                     initializer: Optional[Callable[[], None]] = None,
+                     span_name: Optional[str] = None) -> List[TaskResult]:
         """
         Process files in parallel using either threads or processes.
         
+        Items are submitted lazily so at most ``max_in_flight`` are queued or
+        running at once, and results are handled in completion order, so one
+        slow file never holds back the others.
+        
         Args:
-            files: List of files to process
+            files: Files (or other items) to process, in submission order
             processor: Function to process each file
             use_processes: If True, use ProcessPoolExecutor instead of ThreadPoolExecutor
-            chunk_size: Optional chunk size for batching files
+            max_in_flight: Maximum number of submitted but unfinished items
+                (defaults to the worker count, so the timeout runs from when
+                an item actually starts)
+            timeout: Seconds an attempt may take before it is abandoned;
+                a running thread cannot be interrupted, so it keeps its
+                worker until it returns
+            retries: Number of extra attempts after an error or timeout
+            progress: Called as progress(completed, total, result) whenever
+                an item finishes, successfully or not
+            initializer: Run once in each worker before its first item (e.g.
+                build_tasks.init_worker to preload heavy modules); with
+                processes, it and ``processor`` must be picklable
+            span_name: Name of the trace spans recorded per item (defaults
+                to the processor's name)
             
         Returns:
-            List of exceptions that occurred during processing
+            One TaskResult per file, in the order of ``files``
         """
         if not files:
             return []
-            
-        errors = []
-        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
         
-        with executor_class(max_workers=self.max_workers) as executor:
-            if chunk_size and len(files) > chunk_size:
-                # Process in chunks for better memory management
-                chunks = [files[i:i + chunk_size] 
-                         for i in range(0, len(files), chunk_size)]
-                
-                for chunk in chunks:
-                    futures = {executor.submit(processor, f): f for f in chunk}
-                    for future in futures:
-                        try:
-                            future.result()
-                        except Exception as e:
-                            errors.append(e)
-                            logger.error(f"Error processing {futures[future]}: {e}")
+        window = max(1, max_in_flight or self.max_workers)
+        results = [TaskResult(item) for item in files]
+        # Retries go back on this queue, so they pass the same window check
+        pending: Deque[int] = deque(range(len(files)))
+        # future -> (index, submit time, submit wall-clock time)
+        in_flight: Dict[Future, Tuple[int, float, float]] = {}
+        completed = 0
+        abandoned = False
+        
+        if self.executor is not None:
+            executor = self.executor
+        else:
+            if use_processes:
+                executor = create_process_pool(self.max_workers, initializer)
+            else:
+                executor = ThreadPoolExecutor(max_workers=self.max_workers, initializer=initializer)
+        
+        name = span_name or getattr(processor, '__name__', 'task')
+        
+        def submit(index: int) -> None:
+            results[index].attempts += 1
+            if self.monitor is not None:
+                future = executor.submit(_traced_call, processor, name, files[index])
             else:
-                # Process all files at once
-                futures = {executor.submit(processor, f): f for f in files}
-                for future in futures:
+                future = executor.submit(processor, files[index])
+            in_flight[future] = (index, time.monotonic(), time.time())
+        
+        def unwrap(index: int, submitted: float, outcome: Any) -> Any:
+            """Record the span returned by _traced_call and return the value."""
+            if self.monitor is None:
+                return outcome
+            value, error, span = outcome
+            span.args.update({
+                'item': str(results[index].item),
+                'attempt': results[index].attempts,
+                # Time spent waiting for a free worker
+                'queued_ms': round(max(0.0, span.start - submitted) * 1000, 3)
+            })
+            if error is not None:
+                span.args['error'] = str(error)
+            self.monitor.record_span(span)
+            if error is not None:
+                raise error
+            return value
+        
+        def finish(index: int, error: Optional[BaseException]) -> None:
+            nonlocal completed
+            result = results[index]
+            if error is not None and result.attempts <= retries:
+                logger.warning(f"Retrying {result.item} (attempt {result.attempts + 1}) after error: {error}")
+                pending.appendleft(index)
+                return
+            result.error = error
+            completed += 1
+            if error is not None:
+                logger.error(f"Error processing {result.item}: {error}")
+            if progress:
+                progress(completed, len(files), result)
+        
+        try:
+            while True:
+                while pending and len(in_flight) < window:
+                    submit(pending.popleft())
+                if not in_flight:
+                    break
+                
+                wait_timeout = None
+                if timeout is not None:
+                    oldest = min(started for _, started, _ in in_flight.values())
+                    wait_timeout = max(0.0, oldest + timeout - time.monotonic())
+                done, _ = wait(list(in_flight), timeout=wait_timeout, return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    index, started, submitted = in_flight.pop(future)
+                    results[index].duration += time.monotonic() - started
                     try:
-                        future.result()
+                        results[index].value = unwrap(index, submitted, future.result())
+                        finish(index, None)
                     except Exception as e:
-                        errors.append(e)
-                        logger.error(f"Error processing {futures[future]}: {e}")
+                        finish(index, e)
+                
+                if timeout is None:
+                    continue
+                now = time.monotonic()
+                for future, (index, started, _) in list(in_flight.items()):
+                    if now - started < timeout:
+                        continue
+                    del in_flight[future]
+                    if not future.cancel():
+                        abandoned = True
+                    results[index].duration += now - started
+                    finish(index, TimeoutError(f"timed out after {timeout}s"))
+        finally:
+            if self.executor is None:
+                # Abandoned attempts may still be running; do not block on them
+                executor.shutdown(wait=not abandoned, cancel_futures=True)
         
-        return errors
+        return results
 
     def process_tasks(self,
                      tasks: List[Callable[[], Any]],
-                     use_processes: bool = False) -> List[Exception]:
+                     use_processes: bool = False,
+                     **kwargs: Any) -> List[TaskResult]:
         """
         Execute multiple tasks in parallel.
         
         Args:
             tasks: List of task functions to execute
             use_processes: If True, use ProcessPoolExecutor instead of ThreadPoolExecutor
+            **kwargs: Passed through to process_files (timeout, retries, ...)
             
         Returns:
-            List of exceptions that occurred during processing
+            One TaskResult per task, in the order of ``tasks``
         """
-        if not tasks:
-            return []
-            
-        errors = []
-        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
-        
-        with executor_class(max_workers=self.max_workers) as executor:
-            futures = [executor.submit(task) for task in tasks]
-            for future in futures:
-                try:
-                    future.result()
-                except Exception as e:
-                    errors.append(e)
-                    logger.error(f"Error executing task: {e}")
-        
-        return errors
-
-def get_optimal_chunk_size(total_items: int) -> int:
-    """Calculate optimal chunk size based on system resources and workload."""
-    cpu_count = os.cpu_count() or 1
-    
-    # Base chunk size on CPU count and total items
-    if total_items < 100:
-        return total_items  # Process all at once for small workloads
-    elif total_items < 1000:
-        return total_items // (cpu_count * 2)  # Split workload across CPUs
-    else:
-        return 100  # Cap chunk size for very large workloads
+        return self.process_files(tasks, _call_task, use_processes=use_processes, **kwargs)
 
 def is_io_bound(file_path: Path) -> bool:
     """Determine if a file operation is likely to be IO-bound."""
-    # Image files and large files are typically IO-bound
-    io_bound_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
-    
+    # Image decoding/encoding is CPU-bound and handled by the image scheduler;
+    # only large non-image files are treated as IO-bound here.
     return (
-        file_path.suffix.lower() in io_bound_extensions or
+        file_path.suffix.lower() not in IMAGE_EXTENSIONS and
         file_path.stat().st_size > 1024 * 1024  # Files larger than 1MB
     )
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
+# Relative cost per output pixel of each target format, normalised to a
+# baseline JPEG encode. WebP at method=6 is several times slower than JPEG.
+IMAGE_FORMAT_COSTS = {
+    'jpeg': 1.0,
+    'webp': 4.0,
+    'thumbnail': 0.05,
+}
+
+# Relative cost per decoded source pixel
+IMAGE_DECODE_COST = 0.5
+
+# Output images are capped at this size (see ImageProcessor.max_size)
+IMAGE_MAX_SIZE = (2000, 2000)
+
+class ImageJob(NamedTuple):
+    """An image scheduled for processing with its estimated cost."""
+    path: Path
+    cost: float
+    decoded_pixels: int
+
+def _decoded_pixels(width: int, height: int, is_jpeg: bool) -> int:
+    """Pixels actually decoded, accounting for JPEG draft (1/2, 1/4, 1/8) scaling."""
+    ratio = min(IMAGE_MAX_SIZE[0] / width, IMAGE_MAX_SIZE[1] / height)
+    scale = 1
+    if is_jpeg:
+        while scale < 8 and ratio * scale * 2 <= 1:
+            scale *= 2
+    return (width // scale) * (height // scale)
+
+def estimate_image_cost(file_path: Path,
+                        formats: Sequence[str] = ('jpeg', 'webp', 'thumbnail')) -> ImageJob:
+    """
+    Estimate the relative processing cost of an image from its pixel
+    dimensions and target formats.
+    
+    Only the file header is read. Files that cannot be parsed fall back to
+    their size in bytes, which keeps them schedulable.
+    """
+    try:
+        from PIL import Image
+        with Image.open(file_path) as img:
+            width, height = img.size
+            is_jpeg = img.format in ('JPEG', 'MPO')
+    except Exception:
+        return ImageJob(file_path, float(file_path.stat().st_size), 0)
+    
+    ratio = min(1.0, IMAGE_MAX_SIZE[0] / width, IMAGE_MAX_SIZE[1] / height)
+    output_pixels = width * height * ratio * ratio
+    decoded = _decoded_pixels(width, height, is_jpeg)
+    
+    cost = IMAGE_DECODE_COST * decoded
+    cost += sum(IMAGE_FORMAT_COSTS.get(fmt, 1.0) * output_pixels for fmt in formats)
+    return ImageJob(file_path, cost, decoded)
+
+def schedule_image_jobs(files: List[Path],
+                        formats: Sequence[str] = ('jpeg', 'webp', 'thumbnail')) -> List[ImageJob]:
+    """
+    Order image jobs longest-first by estimated cost.
+    
+    Submitting in this order to a FIFO worker pool is the LPT heuristic,
+    which keeps one huge photo from starting last and dominating the makespan.
+    Non-image files are dropped.
+    """
+    jobs = [
+        estimate_image_cost(f, formats)
+        for f in files
+        if f.is_file() and f.suffix.lower() in IMAGE_EXTENSIONS
+    ]
+    jobs.sort(key=lambda job: job.cost, reverse=True)
+    return jobs
+
+def get_available_memory() -> Optional[int]:
+    """Return available system memory in bytes, if it can be determined."""
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def get_image_worker_count(jobs: List[ImageJob], memory_fraction: float = 0.5) -> int:
+    """
+    Pick a worker count for image jobs from core count and available memory.
+    
+    Image work is CPU-bound, so workers never exceed the core count. Each
+    worker is budgeted for the largest job's decoded frame plus its
+    converted and resized copies, and all workers together may use at most
+    ``memory_fraction`` of the available memory.
+    """
+    if not jobs:
+        return 1
+    
+    workers = min(os.cpu_count() or 1, len(jobs))
+    
+    available = get_available_memory()
+    if available:
+        peak_pixels = max(job.decoded_pixels for job in jobs)
+        # RGBA frame, one converted copy and the resized output
+        per_worker = max(peak_pixels * 4 * 3, 1)
+        workers = min(workers, int(available * memory_fraction // per_worker))
+    
+    return max(1, workers)
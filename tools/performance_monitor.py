@@ -2,44 +2,165 @@
 # -*- coding: utf-8 -*-
 """
 Performance monitoring and reporting for the build process.
+
+psutil and matplotlib are optional and imported when monitoring starts or
+charts are drawn, so importing this module (and the build manager, which
+uses TaskTimer) stays cheap.
+
+Resource samples go into fixed-size ring buffers backed by array('d'), and
+min/max/mean are updated as samples arrive, so a long watch session uses
+constant memory. CPU usage is sampled with cpu_percent(interval=None), which
+returns the average since the previous call instead of blocking.
+
+Timed tasks are kept as spans with the process and thread that ran them,
+including items run by ParallelProcessor workers, and are exported with
+each report as Chrome trace event JSON (trace_<time>.json), which
+ui.perfetto.dev and chrome://tracing open directly. Spans on the same
+thread nest by time, so a stage shows the tasks run inside it.
+
+Report and trace names carry the time to the microsecond and the process
+id, so builds finishing within the same second do not overwrite each
+other, and only the most recent reports and traces are kept.
 """
 import time
 import json
-import psutil
 import os
+from array import array
+from collections import deque
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Deque, Dict, List, Optional, Tuple
 from datetime import datetime
 import threading
-from concurrent.futures import ThreadPoolExecutor
-import matplotlib.pyplot as plt
 
 from build_logger import setup_logging
 
 logger = setup_logging('performance_monitor')
 
+# 默认保留的采样数（每秒采样一次时约为一小时）
+DEFAULT_MAX_SAMPLES = 3600
+
+# 默认保留的跟踪区间数（每个并行处理的文件一个）
+DEFAULT_MAX_SPANS = 100000
+
+# 默认保留的报告数（每个报告附带一个跟踪文件）
+DEFAULT_KEEP_REPORTS = 20
+
+@dataclass
+class TraceSpan:
+    """A timed piece of work and the process/thread that ran it; times are time.time() seconds."""
+    name: str
+    start: float
+    end: float
+    pid: int
+    tid: int
+    category: str = 'task'
+    args: Dict[str, Any] = field(default_factory=dict)
+    thread_name: Optional[str] = None
+
+def current_span(name: str, start: float, category: str = 'task',
+                 args: Optional[Dict[str, Any]] = None) -> TraceSpan:
+    """从 start 到现在、属于当前线程的区间（也在工作进程中调用）"""
+    return TraceSpan(name, start, time.time(), os.getpid(), threading.get_native_id(),
+                     category, args or {}, threading.current_thread().name)
+
+class StreamingStats:
+    """Count, min, max and mean of every value added, in constant memory."""
+    
+    __slots__ = ('count', 'total', 'min', 'max')
+    
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+        
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+            
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+class RingBuffer:
+    """Fixed-capacity buffer of floats backed by array('d'); the oldest values are overwritten."""
+    
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._data = array('d', bytes(8 * self.capacity))
+        self._start = 0
+        self._size = 0
+        
+    def append(self, value: float) -> None:
+        index = (self._start + self._size) % self.capacity
+        self._data[index] = value
+        if self._size < self.capacity:
+            self._size += 1
+        else:
+            self._start = (self._start + 1) % self.capacity
+            
+    def __len__(self) -> int:
+        return self._size
+        
+    def values(self) -> List[float]:
+        """按时间顺序返回保留的值"""
+        end = self._start + self._size
+        if end <= self.capacity:
+            return self._data[self._start:end].tolist()
+        return self._data[self._start:].tolist() + self._data[:end - self.capacity].tolist()
+
+class MetricSeries:
+    """Samples of one metric: the most recent window for charts, plus stats and the first/last value over the whole run."""
+    
+    def __init__(self, capacity: int):
+        self.timestamps = RingBuffer(capacity)
+        self.values = RingBuffer(capacity)
+        self.stats = StreamingStats()
+        self.first: Optional[float] = None
+        self.last: Optional[float] = None
+        
+    def add(self, timestamp: float, value: float) -> None:
+        self.timestamps.append(timestamp)
+        self.values.append(value)
+        self.stats.add(value)
+        if self.first is None:
+            self.first = value
+        self.last = value
+
 class PerformanceMonitor:
     """监控构建过程的性能指标"""
     
-    def __init__(self, output_dir: Path):
+    def __init__(self, output_dir: Path, max_samples: int = DEFAULT_MAX_SAMPLES,
+                 max_spans: int = DEFAULT_MAX_SPANS, keep_reports: int = DEFAULT_KEEP_REPORTS):
         self.output_dir = output_dir
         self.metrics_dir = output_dir / 'metrics'
         self.metrics_dir.mkdir(parents=True, exist_ok=True)
+        self.keep_reports = max(1, keep_reports)
         
         self.start_time = time.time()
-        self.metrics: Dict[str, List[Dict]] = {
-            'cpu': [],
-            'memory': [],
-            'disk': [],
-            'tasks': []
+        
+        # 资源采样：环形缓冲区只保留最近 max_samples 个采样，统计值覆盖整个运行过程
+        self.series: Dict[str, MetricSeries] = {
+            name: MetricSeries(max_samples)
+            for name in ('cpu', 'rss', 'vms', 'read_bytes', 'write_bytes')
         }
         
-        self._monitoring = False
+        # 任务耗时：按名称汇总，另外保留最近的区间用于导出跟踪
+        self.task_stats: Dict[str, StreamingStats] = {}
+        self.spans: Deque[TraceSpan] = deque(maxlen=max_spans)
+        self._tasks_lock = threading.Lock()
+        
+        self._stop = threading.Event()
         self._monitor_thread = None
         
     def start_monitoring(self, interval: float = 1.0) -> None:
         """开始性能监控"""
-        self._monitoring = True
+        self._stop.clear()
         self._monitor_thread = threading.Thread(
             target=self._monitor_resources,
             args=(interval,),
@@ -48,52 +169,118 @@ class PerformanceMonitor:
         self._monitor_thread.start()
         
     def stop_monitoring(self) -> None:
-        """停止性能监控"""
-        self._monitoring = False
+        """停止性能监控（采样线程会在退出前再采样一次）"""
+        self._stop.set()
         if self._monitor_thread:
             self._monitor_thread.join()
+            self._monitor_thread = None
             
     def _monitor_resources(self, interval: float) -> None:
         """监控系统资源使用情况"""
-        while self._monitoring:
+        try:
+            import psutil
+        except ImportError:
+            logger.warning("psutil not installed, resource usage will not be recorded")
+            return
+        
+        process = psutil.Process()
+        # interval=None 不阻塞：返回距上次调用以来的平均使用率，
+        # 第一次调用只建立基线
+        psutil.cpu_percent(interval=None)
+        
+        while True:
+            stopped = self._stop.wait(interval)
             try:
+                now = time.time()
                 # CPU使用率
-                cpu_percent = psutil.cpu_percent(interval=0.1, percpu=True)
-                self.metrics['cpu'].append({
-                    'timestamp': time.time(),
-                    'overall': sum(cpu_percent) / len(cpu_percent),
-                    'per_cpu': cpu_percent
-                })
+                self.series['cpu'].add(now, psutil.cpu_percent(interval=None))
                 
                 # 内存使用
-                memory = psutil.Process().memory_info()
-                self.metrics['memory'].append({
-                    'timestamp': time.time(),
-                    'rss': memory.rss,
-                    'vms': memory.vms
-                })
+                memory = process.memory_info()
+                self.series['rss'].add(now, memory.rss)
+                self.series['vms'].add(now, memory.vms)
                 
-                # 磁盘I/O
+                # 磁盘I/O（部分容器中不可用）
                 disk_io = psutil.disk_io_counters()
-                self.metrics['disk'].append({
-                    'timestamp': time.time(),
-                    'read_bytes': disk_io.read_bytes,
-                    'write_bytes': disk_io.write_bytes
-                })
-                
-                time.sleep(interval)
-                
+                if disk_io:
+                    self.series['read_bytes'].add(now, disk_io.read_bytes)
+                    self.series['write_bytes'].add(now, disk_io.write_bytes)
+                    
             except Exception as e:
                 logger.error(f"Error monitoring resources: {e}")
+            if stopped:
+                break
                 
     def record_task(self, task_name: str, duration: float, metadata: Optional[Dict] = None) -> None:
-        """记录任务执行时间"""
-        self.metrics['tasks'].append({
-            'name': task_name,
-            'start_time': time.time() - duration,
-            'duration': duration,
-            'metadata': metadata or {}
-        })
+        """记录刚在当前线程结束的任务"""
+        self.record_span(current_span(task_name, time.time() - duration, args=metadata))
+        
+    def record_span(self, span: TraceSpan) -> None:
+        """记录一个区间；category 为 'task' 的区间同时计入任务汇总"""
+        with self._tasks_lock:
+            if span.category == 'task':
+                self.task_stats.setdefault(span.name, StreamingStats()).add(span.end - span.start)
+            self.spans.append(span)
+            
+    def trace_events(self) -> List[Dict[str, Any]]:
+        """Chrome trace 事件：每个区间一个完整事件（ph 'X'），时间为相对监控开始的微秒数"""
+        with self._tasks_lock:
+            spans = list(self.spans)
+        
+        events: List[Dict[str, Any]] = []
+        parent = os.getpid()
+        threads: Dict[Tuple[int, int], str] = {}
+        for span in spans:
+            if span.thread_name:
+                threads.setdefault((span.pid, span.tid), span.thread_name)
+            events.append({
+                'name': span.name,
+                'cat': span.category,
+                'ph': 'X',
+                'ts': round((span.start - self.start_time) * 1e6, 3),
+                'dur': round((span.end - span.start) * 1e6, 3),
+                'pid': span.pid,
+                'tid': span.tid,
+                'args': span.args
+            })
+        
+        # 元数据事件：进程和线程名称
+        for pid in sorted({span.pid for span in spans}):
+            name = 'build' if pid == parent else f'worker {pid}'
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': name}})
+        for (pid, tid), name in sorted(threads.items()):
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}})
+        return events
+        
+    def export_trace(self, path: Path) -> None:
+        """写出 Chrome trace 事件 JSON，可以在 ui.perfetto.dev 中打开"""
+        trace = {'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}
+        path.write_text(json.dumps(trace, ensure_ascii=False, default=str))
+        
+    def _resource_usage(self) -> Dict[str, Any]:
+        """汇总资源使用；没有采样（未安装psutil）时返回空字典"""
+        cpu, rss, vms = self.series['cpu'], self.series['rss'], self.series['vms']
+        if not cpu.stats.count:
+            return {}
+        usage = {
+            'samples': cpu.stats.count,
+            'cpu': {
+                'average': cpu.stats.mean,
+                'peak': cpu.stats.max
+            },
+            'memory': {
+                'peak_rss': rss.stats.max,
+                'peak_vms': vms.stats.max,
+                'average_rss': rss.stats.mean
+            }
+        }
+        read, write = self.series['read_bytes'], self.series['write_bytes']
+        if read.stats.count:
+            usage['disk'] = {
+                'total_read': read.last - read.first,
+                'total_write': write.last - write.first
+            }
+        return usage
         
     def generate_report(self) -> None:
         """生成性能报告"""
@@ -103,66 +290,76 @@ class PerformanceMonitor:
             
             # 计算总体指标
             total_duration = time.time() - self.start_time
-            task_times = {}
-            for task in self.metrics['tasks']:
-                name = task['name']
-                if name not in task_times:
-                    task_times[name] = []
-                task_times[name].append(task['duration'])
+            with self._tasks_lock:
+                task_summary = {
+                    name: {
+                        'count': stats.count,
+                        'total_time': stats.total,
+                        'average_time': stats.mean,
+                        'min_time': stats.min,
+                        'max_time': stats.max
+                    }
+                    for name, stats in self.task_stats.items()
+                }
             
             # 生成报告数据
             report = {
                 'timestamp': datetime.now().isoformat(),
                 'total_duration': total_duration,
-                'task_summary': {
-                    name: {
-                        'count': len(times),
-                        'total_time': sum(times),
-                        'average_time': sum(times) / len(times),
-                        'min_time': min(times),
-                        'max_time': max(times)
-                    }
-                    for name, times in task_times.items()
-                },
-                'resource_usage': {
-                    'cpu': {
-                        'average': sum(m['overall'] for m in self.metrics['cpu']) / len(self.metrics['cpu']),
-                        'peak': max(m['overall'] for m in self.metrics['cpu'])
-                    },
-                    'memory': {
-                        'peak_rss': max(m['rss'] for m in self.metrics['memory']),
-                        'peak_vms': max(m['vms'] for m in self.metrics['memory'])
-                    },
-                    'disk': {
-                        'total_read': self.metrics['disk'][-1]['read_bytes'] - self.metrics['disk'][0]['read_bytes'],
-                        'total_write': self.metrics['disk'][-1]['write_bytes'] - self.metrics['disk'][0]['write_bytes']
-                    }
-                }
+                'task_summary': task_summary,
+                'resource_usage': self._resource_usage()
             }
             
-            # 保存报告
-            report_file = self.metrics_dir / f'report_{int(time.time())}.json'
+            # 保存报告和跟踪；文件名精确到微秒并带进程号，同一秒内的构建不会互相覆盖
+            suffix = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}"
+            report_file = self.metrics_dir / f'report_{suffix}.json'
             report_file.write_text(json.dumps(report, indent=2))
+            trace_file = self.metrics_dir / f'trace_{suffix}.json'
+            self.export_trace(trace_file)
+            self._remove_old_reports()
             
             # 生成可视化
             self._generate_visualizations(report)
             
             logger.info(f"Performance report generated: {report_file}")
+            logger.info(f"Trace written to {trace_file} (open in https://ui.perfetto.dev)")
             
         except Exception as e:
             logger.error(f"Failed to generate performance report: {e}")
             
+    def _remove_old_reports(self) -> None:
+        """只保留最近的 keep_reports 个报告和跟踪文件"""
+        for pattern in ('report_*.json', 'trace_*.json'):
+            files = []
+            for path in self.metrics_dir.glob(pattern):
+                try:
+                    files.append((path.stat().st_mtime_ns, path.name, path))
+                except OSError:
+                    continue
+            files.sort(reverse=True)
+            for _, _, path in files[self.keep_reports:]:
+                path.unlink(missing_ok=True)
+            
     def _generate_visualizations(self, report: Dict) -> None:
         """生成性能指标可视化"""
+        try:
+            import matplotlib
+            # 无显示环境下也能保存图片
+            matplotlib.use('Agg')
+            import matplotlib.pyplot as plt
+        except ImportError:
+            logger.debug("matplotlib not installed, skipping charts")
+            return
+        
         try:
             # 设置图表样式
             plt.style.use('seaborn')
             
             # CPU使用率趋势
             plt.figure(figsize=(12, 6))
-            timestamps = [m['timestamp'] - self.start_time for m in self.metrics['cpu']]
-            cpu_usage = [m['overall'] for m in self.metrics['cpu']]
-            plt.plot(timestamps, cpu_usage)
+            cpu = self.series['cpu']
+            timestamps = [t - self.start_time for t in cpu.timestamps.values()]
+            plt.plot(timestamps, cpu.values.values())
             plt.title('CPU Usage Over Time')
             plt.xlabel('Time (seconds)')
             plt.ylabel('CPU Usage (%)')
@@ -171,8 +368,9 @@ class PerformanceMonitor:
             
             # 内存使用趋势
             plt.figure(figsize=(12, 6))
-            timestamps = [m['timestamp'] - self.start_time for m in self.metrics['memory']]
-            memory_usage = [m['rss'] / 1024 / 1024 for m in self.metrics['memory']]  # MB
+            rss = self.series['rss']
+            timestamps = [t - self.start_time for t in rss.timestamps.values()]
+            memory_usage = [value / 1024 / 1024 for value in rss.values.values()]  # MB
             plt.plot(timestamps, memory_usage)
             plt.title('Memory Usage Over Time')
             plt.xlabel('Time (seconds)')
@@ -211,8 +409,7 @@ class TaskTimer:
         return self
         
     def __exit__(self, exc_type, exc_val, exc_tb):
-        duration = time.time() - self.start_time
-        self.monitor.record_task(self.task_name, duration, self.metadata)
+        self.monitor.record_span(current_span(self.task_name, self.start_time, args=self.metadata))
 
 def main():
     """主入口函数"""
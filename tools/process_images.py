@@ -7,9 +7,7 @@
 import os
 import sys
 from pathlib import Path
-from PIL import Image, ExifTags
-import piexif
-import yaml
+from PIL import Image
 import glob
 import logging
 from typing import Tuple, Optional
@@ -41,9 +39,8 @@ def get_image_paths() -> list[Path]:
 def remove_exif(image: Image.Image) -> Image.Image:
     """移除 EXIF 数据"""
     try:
-        data = list(image.getdata())
         image_without_exif = Image.new(image.mode, image.size)
-        image_without_exif.putdata(data)
+        image_without_exif.paste(image)
         return image_without_exif
     except Exception as e:
         logging.warning(f"移除 EXIF 数据时出错: {e}")
@@ -65,10 +62,18 @@ def calculate_new_size(width: int, height: int) -> Tuple[int, int]:
     
     return int(width * ratio), int(height * ratio)
 
+def draft_for_size(image: Image.Image, size: Tuple[int, int]) -> None:
+    """目标尺寸远小于原图时，让 JPEG 解码器在 DCT 域直接缩小解码（须在读取像素前调用）"""
+    width, height = image.size
+    if size[0] * 2 > width and size[1] * 2 > height:
+        return
+    # 只对 JPEG 生效；解码结果不小于请求尺寸，后续仍需 resize
+    image.draft(None, size)
+
 def create_thumbnail(image: Image.Image, path: Path) -> None:
     """创建缩略图"""
     thumb = image.copy()
-    thumb.thumbnail(CONFIG['thumb_size'])
+    thumb.thumbnail(CONFIG['thumb_size'], reducing_gap=2.0)
     thumb_path = path.parent / f"{path.stem}_thumb{path.suffix}"
     thumb.save(thumb_path, quality=CONFIG['quality'], optimize=True)
 
@@ -77,6 +82,10 @@ def process_image(path: Path) -> None:
     try:
         # 打开图片
         with Image.open(path) as img:
+            # 根据文件头中的尺寸计算目标尺寸，并在解码前配置缩小解码
+            new_width, new_height = calculate_new_size(*img.size)
+            draft_for_size(img, (new_width, new_height))
+            
             # 移除 EXIF 数据
             img = remove_exif(img)
             
@@ -84,11 +93,9 @@ def process_image(path: Path) -> None:
             if img.mode == 'RGBA':
                 img = img.convert('RGB')
             
-            # 调整尺寸
-            width, height = img.size
-            new_width, new_height = calculate_new_size(width, height)
-            if (new_width, new_height) != (width, height):
-                img = img.resize((new_width, new_height), Image.LANCZOS)
+            # 调整尺寸（缩小解码后的尺寸可能仍大于目标尺寸）
+            if img.size != (new_width, new_height):
+                img = img.resize((new_width, new_height), Image.LANCZOS, reducing_gap=2.0)
             
             # 创建缩略图
             create_thumbnail(img, path)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local preview server for the site.
+
+Serves docs/ over HTTP. Nothing is built up front: the data files and feeds
+are built through BuildManager on their first request, and again after a
+note changes. Precompressed sidecars (.br/.zst/.gz) are sent when the client
+accepts them and they are newer than their source. Every response carries an
+ETag, so unchanged files get 304 Not Modified. HTML pages get a small
+script that reloads the page when the server sends a server-sent event,
+which happens after each rebuild triggered by a file change.
+"""
+import hashlib
+import threading
+from email.utils import formatdate
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Optional, Set, Tuple
+from urllib.parse import unquote, urlsplit
+
+from build_logger import setup_logging, BuildError
+
+logger = setup_logging('serve')
+
+RELOAD_PATH = '/__reload'
+
+# 注入到页面中的自动刷新脚本
+RELOAD_SCRIPT = (
+    f'<script>new EventSource("{RELOAD_PATH}").addEventListener("reload",'
+    f'function(){{location.reload()}})</script>'
+)
+
+# 预压缩文件，按优先顺序：Accept-Encoding 中的名称 -> 扩展名
+ENCODINGS = (('br', '.br'), ('zstd', '.zst'), ('gzip', '.gz'))
+
+# SSE 保活间隔（秒）
+KEEPALIVE_INTERVAL = 15.0
+
+
+class ReloadBroadcaster:
+    """通知所有已连接的页面刷新"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.version = 0
+
+    def notify(self) -> None:
+        with self._condition:
+            self.version += 1
+            self._condition.notify_all()
+
+    def wait(self, version: int, timeout: float) -> int:
+        """等待版本号变化或超时，返回当前版本号"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+
+class DataBuilder:
+    """按需构建的数据文件：第一次请求时构建，笔记变化后标记为过期"""
+
+    def __init__(self, name: str, build: Callable[[], None]):
+        self.name = name
+        self.build = build
+        self.stale = True
+        self.lock = threading.Lock()
+
+    def ensure_built(self) -> None:
+        if not self.stale:
+            return
+        with self.lock:
+            if not self.stale:
+                return
+            logger.info(f"Building {self.name} on demand...")
+            self.build()
+            self.stale = False
+
+
+class PreviewServer(ThreadingHTTPServer):
+    """基于 BuildManager 的本地预览服务器"""
+
+    daemon_threads = True
+
+    def __init__(self, repo_root: Path, address: Tuple[str, int], watch: bool = True):
+        from build_manager import BuildManager
+
+        self.manager = BuildManager(repo_root)
+        self.docs_dir = self.manager.docs_dir
+        self.broadcaster = ReloadBroadcaster()
+
+        # 数据文件（相对于 docs/）-> 构建器
+        self.builders: Dict[str, DataBuilder] = {}
+        for builder, outputs in (
+            (DataBuilder('note index', self._build_note_index), ('data/index.json', 'data/latest.json')),
+            (DataBuilder('search index', self.manager._build_search_index), ('data/search-index.json',)),
+            (DataBuilder('tags', self.manager.build_tags), ('data/tags.json', 'data/tags-simple.json')),
+            (DataBuilder('feeds', self.manager.build_feeds), ('feed.xml', 'feed.atom', 'feed.json')),
+        ):
+            for output in outputs:
+                self.builders[output] = builder
+
+        super().__init__(address, PreviewRequestHandler)
+
+        if watch:
+            threading.Thread(target=self._watch, name='watch', daemon=True).start()
+
+    def _build_note_index(self) -> None:
+        """写出笔记索引；图片只按预测路径记录，不在请求中编码"""
+        from build_index import collect_notes, write_index
+        write_index(self.manager.repo_root, collect_notes(self.manager.repo_root, image_jobs=[]))
+
+    def ensure_built(self, rel_path: str) -> None:
+        builder = self.builders.get(rel_path)
+        if builder:
+            builder.ensure_built()
+
+    def _watch(self) -> None:
+        """文件变化后重建受影响的阶段；数据文件只标记为过期，等下次请求再构建"""
+        from file_watcher import FileWatcher
+
+        watcher = FileWatcher([self.manager.notes_dir, self.docs_dir], self.manager._is_build_output)
+        logger.info(f"Watching for changes ({watcher.backend_name})")
+        try:
+            for changed in watcher.changes():
+                stages = self.manager._plan_rebuild(changed)
+                if not stages:
+                    continue
+                if 'process_notes' in stages:
+                    for builder in set(self.builders.values()):
+                        builder.stale = True
+                eager = stages & {'process_notes', 'process_images', 'bundle_scripts', 'process_static_assets'}
+                if eager:
+                    try:
+                        self.manager.build(stages=eager)
+                    except BuildError as e:
+                        logger.error(f"Rebuild failed: {e}")
+                logger.info(f"{len(changed)} files changed, reloading pages")
+                self.broadcaster.notify()
+        finally:
+            watcher.close()
+
+
+class PreviewRequestHandler(SimpleHTTPRequestHandler):
+    """静态文件处理：按需构建、预压缩文件、ETag 和自动刷新"""
+
+    server: PreviewServer
+
+    def __init__(self, request, client_address, server):
+        super().__init__(request, client_address, server, directory=str(server.docs_dir))
+
+    def do_GET(self):
+        if urlsplit(self.path).path == RELOAD_PATH:
+            self._serve_events()
+            return
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _serve(self, send_body: bool) -> None:
+        url_path = unquote(urlsplit(self.path).path)
+        rel_path = url_path.lstrip('/')
+        if rel_path == '' or rel_path.endswith('/'):
+            rel_path += 'index.html'
+
+        try:
+            self.server.ensure_built(rel_path)
+        except Exception as e:
+            logger.error(f"On-demand build of {rel_path} failed: {e}")
+            self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR, f"Failed to build {rel_path}")
+            return
+
+        path = Path(self.translate_path(self.path))
+        if path.is_dir() and url_path.endswith('/'):
+            path = path / 'index.html'
+        # 目录重定向、目录列表和404交给基类处理
+        if not path.is_file():
+            if send_body:
+                super().do_GET()
+            else:
+                super().do_HEAD()
+            return
+
+        if path.suffix == '.html':
+            body = path.read_bytes().decode('utf-8', errors='replace')
+            marker = body.rfind('</body>')
+            body = body[:marker] + RELOAD_SCRIPT + body[marker:] if marker != -1 else body + RELOAD_SCRIPT
+            data = body.encode('utf-8')
+            etag = f'"{hashlib.sha1(data).hexdigest()[:16]}"'
+            self._send(path, etag, None, len(data), send_body, data=data)
+            return
+
+        served, encoding = self._choose_encoding(path)
+        stat = served.stat()
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+        self._send(path, etag, encoding, stat.st_size, send_body, served=served, mtime=stat.st_mtime)
+
+    def _choose_encoding(self, path: Path) -> Tuple[Path, Optional[str]]:
+        """客户端接受且比源文件新的预压缩文件"""
+        accepted = self._accepted_encodings()
+        source_mtime = path.stat().st_mtime_ns
+        for name, ext in ENCODINGS:
+            if name not in accepted:
+                continue
+            sidecar = path.with_name(path.name + ext)
+            try:
+                if sidecar.stat().st_mtime_ns >= source_mtime:
+                    return sidecar, name
+            except OSError:
+                continue
+        return path, None
+
+    def _accepted_encodings(self) -> Set[str]:
+        accepted = set()
+        for part in self.headers.get('Accept-Encoding', '').split(','):
+            name, _, params = part.strip().partition(';')
+            if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                continue
+            if name:
+                accepted.add(name.strip().lower())
+        return accepted
+
+    def _etag_matches(self, etag: str) -> bool:
+        header = self.headers.get('If-None-Match')
+        if not header:
+            return False
+        tags = [tag.strip() for tag in header.split(',')]
+        return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+    def _send(self, path: Path, etag: str, encoding: Optional[str], length: int, send_body: bool,
+              data: Optional[bytes] = None, served: Optional[Path] = None,
+              mtime: Optional[float] = None) -> None:
+        if self._etag_matches(etag):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', self.guess_type(str(path)))
+        self.send_header('Content-Length', str(length))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if mtime is not None:
+            self.send_header('Last-Modified', formatdate(mtime, usegmt=True))
+        self.end_headers()
+
+        if not send_body:
+            return
+        if data is not None:
+            self.wfile.write(data)
+        else:
+            with served.open('rb') as f:
+                self.copyfile(f, self.wfile)
+
+    def _serve_events(self) -> None:
+        """服务器推送事件：文件变化后发送 reload"""
+        self.close_connection = True
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        broadcaster = self.server.broadcaster
+        version = broadcaster.version
+        try:
+            while True:
+                current = broadcaster.wait(version, KEEPALIVE_INTERVAL)
+                if current != version:
+                    version = current
+                    self.wfile.write(b'event: reload\ndata: {}\n\n')
+                else:
+                    self.wfile.write(b': keepalive\n\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+def main():
+    """主入口函数"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve docs/ locally with on-demand builds and live reload')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to bind')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
+    parser.add_argument('--no-watch', action='store_true', help='Do not watch for changes')
+    args = parser.parse_args()
+
+    repo_root = Path(__file__).resolve().parents[1]
+    try:
+        server = PreviewServer(repo_root, (args.host, args.port), watch=not args.no_watch)
+    except OSError as e:
+        logger.error(f"Could not start server: {e}")
+        raise SystemExit(1)
+
+    logger.info(f"Serving {server.docs_dir} at http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopped")
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dependency-driven scheduling of build stages.
+
+Each stage declares the resources it reads (inputs) and writes (outputs).
+A stage depends on every stage that writes one of its inputs, plus any
+explicit deps. Ready stages run concurrently in threads and share a fixed
+worker budget: a stage that parallelises internally asks for several
+workers and is told how many it was granted. Stages on the longest
+remaining path start first. After the run, the critical path is the chain
+of stages that actually determined the wall-clock time.
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from build_logger import setup_logging, BuildError
+
+logger = setup_logging('stage_scheduler')
+
+
+@dataclass
+class Stage:
+    """A build stage; run receives the number of workers it was granted."""
+    name: str
+    run: Callable[[int], None]
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+    deps: Tuple[str, ...] = ()
+    # 希望使用的工作线程/进程数（内部并行的阶段大于1）
+    workers: int = 1
+    # 相对耗时估计，用于决定就绪阶段的启动顺序
+    cost: float = 1.0
+
+
+@dataclass
+class StageResult:
+    """Timing of one executed stage."""
+    name: str
+    start: float
+    end: float
+    workers: int
+    # 最后完成的依赖阶段，即实际推迟本阶段启动的阶段
+    gated_by: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+@dataclass
+class ScheduleReport:
+    """Outcome of a scheduled build."""
+    results: Dict[str, StageResult] = field(default_factory=dict)
+    wall_time: float = 0.0
+    critical_path: List[str] = field(default_factory=list)
+
+    @property
+    def serial_time(self) -> float:
+        """Time the stages would have taken one after another."""
+        return sum(r.duration for r in self.results.values())
+
+
+class StageScheduler:
+    """Runs stages in dependency order with a shared worker budget."""
+
+    def __init__(self, stages: List[Stage], max_workers: int):
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Stage names must be unique")
+        self.max_workers = max(1, max_workers)
+        self.dependencies = self._resolve_dependencies()
+        self.priority = self._compute_priorities()
+
+    def _resolve_dependencies(self) -> Dict[str, Set[str]]:
+        """根据输入/输出推导依赖关系，并检查未知依赖、写冲突和环"""
+        writers: Dict[str, List[str]] = {}
+        for stage in self.stages.values():
+            for resource in stage.outputs:
+                writers.setdefault(resource, []).append(stage.name)
+
+        dependencies: Dict[str, Set[str]] = {}
+        for stage in self.stages.values():
+            deps = set(stage.deps)
+            unknown = deps - set(self.stages)
+            if unknown:
+                raise ValueError(f"Stage {stage.name} depends on unknown stages: {', '.join(sorted(unknown))}")
+            for resource in stage.inputs:
+                deps.update(writers.get(resource, []))
+            deps.discard(stage.name)
+            dependencies[stage.name] = deps
+
+        self._check_acyclic(dependencies)
+
+        # 同一资源的多个写入者之间必须有先后关系
+        for resource, names in writers.items():
+            for i, a in enumerate(names):
+                for b in names[i + 1:]:
+                    if not (self._reaches(dependencies, a, b) or self._reaches(dependencies, b, a)):
+                        raise ValueError(f"Stages {a} and {b} both write {resource} without an ordering")
+        return dependencies
+
+    def _check_acyclic(self, dependencies: Dict[str, Set[str]]) -> None:
+        visiting: Set[str] = set()
+        done: Set[str] = set()
+
+        def visit(name: str, chain: List[str]) -> None:
+            if name in done:
+                return
+            if name in visiting:
+                cycle = chain[chain.index(name):] + [name]
+                raise ValueError(f"Stage dependency cycle: {' -> '.join(cycle)}")
+            visiting.add(name)
+            for dep in dependencies[name]:
+                visit(dep, chain + [name])
+            visiting.discard(name)
+            done.add(name)
+
+        for name in dependencies:
+            visit(name, [])
+
+    def _reaches(self, dependencies: Dict[str, Set[str]], stage: str, ancestor: str) -> bool:
+        """ancestor 是否是 stage 的（间接）依赖"""
+        stack, seen = [stage], set()
+        while stack:
+            for dep in dependencies[stack.pop()]:
+                if dep == ancestor:
+                    return True
+                if dep not in seen:
+                    seen.add(dep)
+                    stack.append(dep)
+        return False
+
+    def _compute_priorities(self) -> Dict[str, float]:
+        """每个阶段到终点的最长估计耗时（含自身）"""
+        dependents: Dict[str, Set[str]] = {name: set() for name in self.stages}
+        for name, deps in self.dependencies.items():
+            for dep in deps:
+                dependents[dep].add(name)
+
+        priority: Dict[str, float] = {}
+
+        def longest(name: str) -> float:
+            if name not in priority:
+                tail = max((longest(d) for d in dependents[name]), default=0.0)
+                priority[name] = self.stages[name].cost + tail
+            return priority[name]
+
+        for name in self.stages:
+            longest(name)
+        return priority
+
+    def run(self) -> ScheduleReport:
+        """执行所有阶段；任何阶段失败时不再启动新阶段，等待运行中的阶段结束后抛出 BuildError"""
+        report = ScheduleReport()
+        remaining = set(self.stages)
+        running: Dict[Future, Tuple[str, int]] = {}
+        free = self.max_workers
+        failures: List[Tuple[str, BaseException]] = []
+        lock = threading.Lock()
+        build_start = time.monotonic()
+
+        def execute(name: str, workers: int) -> None:
+            stage = self.stages[name]
+            start = time.monotonic()
+            try:
+                stage.run(workers)
+            finally:
+                with lock:
+                    report.results[name] = StageResult(name, start - build_start,
+                                                       time.monotonic() - build_start, workers)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='stage') as executor:
+            while remaining or running:
+                if not failures:
+                    ready = sorted(
+                        (name for name in remaining if self.dependencies[name].issubset(report.results)),
+                        key=lambda name: -self.priority[name]
+                    )
+                    for index, name in enumerate(ready):
+                        if free < 1:
+                            break
+                        # 给其余就绪阶段各留一个工作位
+                        others = len(ready) - index - 1
+                        workers = min(self.stages[name].workers, max(1, free - others))
+                        free -= workers
+                        remaining.discard(name)
+                        logger.info(f"Starting stage {name} ({workers} workers)")
+                        running[executor.submit(execute, name, workers)] = (name, workers)
+
+                if not running:
+                    break
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, workers = running.pop(future)
+                    free += workers
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.error(f"Stage {name} failed: {e}")
+                        failures.append((name, e))
+
+        report.wall_time = time.monotonic() - build_start
+        for name, result in report.results.items():
+            deps = self.dependencies[name]
+            if deps:
+                result.gated_by = max(deps, key=lambda dep: report.results[dep].end)
+
+        if failures:
+            skipped = sorted(remaining)
+            if skipped:
+                logger.error(f"Skipped stages: {', '.join(skipped)}")
+            name, error = failures[0]
+            raise BuildError(f"Stage {name} failed") from error
+
+        report.critical_path = self._critical_path(report)
+        self._log_report(report)
+        return report
+
+    def _critical_path(self, report: ScheduleReport) -> List[str]:
+        """从最后结束的阶段沿着推迟其启动的依赖回溯"""
+        if not report.results:
+            return []
+        name: Optional[str] = max(report.results.values(), key=lambda r: r.end).name
+        path = []
+        while name is not None:
+            path.append(name)
+            name = report.results[name].gated_by
+        return list(reversed(path))
+
+    def _log_report(self, report: ScheduleReport) -> None:
+        logger.info(
+            f"Build stages finished in {report.wall_time:.2f}s "
+            f"({report.serial_time:.2f}s if run serially)"
+        )
+        path_time = sum(report.results[name].duration for name in report.critical_path)
+        logger.info(f"Critical path ({path_time:.2f}s): {' -> '.join(report.critical_path)}")
+        for name in report.critical_path:
+            result = report.results[name]
+            logger.info(f"  {name}: {result.start:.2f}s - {result.end:.2f}s ({result.workers} workers)")
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Startup benchmark for the build tools.
+
+Runs build_manager.py under ``python -X importtime`` and adds up the time
+spent importing modules. Two scenarios are measured: ``--help`` and a no-op
+incremental build (an incremental build run right after another one, so no
+notes or images changed). Each total, and the wall time of the no-op
+build, is compared with the budgets in the "startup" section of
+build.config.json, and the exit status is 1 when a budget is exceeded.
+
+The builds run against a temporary copy of the repository, so the build
+state, metrics reports and generated files of the work tree are left alone.
+"""
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from build_logger import setup_logging
+
+logger = setup_logging('startup_benchmark')
+
+# 未配置时使用的预算（毫秒）
+DEFAULT_BUDGETS = {
+    'help_budget_ms': 100,
+    'noop_build_budget_ms': 300,
+    'noop_build_wall_budget_ms': 500,
+}
+
+
+@dataclass
+class ImportProfile:
+    """One run under -X importtime."""
+    wall_time: float = 0.0
+    # 顶层导入（不是被其他模块导入的模块）-> 累计耗时（微秒）
+    top_level: Dict[str, int] = field(default_factory=dict)
+    # 每个模块自身的耗时（微秒）
+    self_times: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def import_time_ms(self) -> float:
+        return sum(self.top_level.values()) / 1000
+
+    def slowest(self, count: int) -> List[Tuple[str, int]]:
+        return sorted(self.top_level.items(), key=lambda item: -item[1])[:count]
+
+
+def parse_importtime(output: str) -> ImportProfile:
+    """解析 -X importtime 的输出：'import time: self [us] | cumulative | imported package'"""
+    profile = ImportProfile()
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # 表头
+        name = parts[2].rstrip()
+        module = name.strip()
+        profile.self_times[module] = profile.self_times.get(module, 0) + int(parts[0])
+        # 只有一个空格缩进的是顶层导入，其累计时间已包含它导入的模块
+        if not name.startswith('  '):
+            profile.top_level[module] = profile.top_level.get(module, 0) + int(parts[1])
+    return profile
+
+
+def profile_command(args: List[str], cwd: Path) -> ImportProfile:
+    """在 -X importtime 下运行脚本并返回导入耗时"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', *args],
+        cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    wall_time = time.perf_counter() - start
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+        raise RuntimeError(f"{' '.join(args)} exited with {result.returncode}: {' '.join(errors[-3:])}")
+    profile = parse_importtime(result.stderr)
+    profile.wall_time = wall_time
+    return profile
+
+
+def load_budgets(repo_root: Path) -> Dict[str, float]:
+    """读取 build.config.json 中的启动预算"""
+    budgets = dict(DEFAULT_BUDGETS)
+    config_file = repo_root / 'build.config.json'
+    if config_file.exists():
+        try:
+            budgets.update(json.loads(config_file.read_text()).get('startup', {}))
+        except Exception as e:
+            logger.warning(f"Failed to load build config: {e}")
+    return budgets
+
+
+def copy_repository(repo_root: Path, target: Path) -> Path:
+    """把仓库（包括 .git，变更检测会用到）复制到 target 下，返回副本的根目录"""
+    copy_root = target / repo_root.name
+    shutil.copytree(
+        repo_root, copy_root, symlinks=True,
+        ignore=shutil.ignore_patterns('logs', '__pycache__')
+    )
+    return copy_root
+
+
+def run_benchmark(repo_root: Path, top: int = 10) -> bool:
+    """在仓库的临时副本中测量 --help 和空增量构建的导入耗时，全部在预算内时返回True"""
+    budgets = load_budgets(repo_root)
+    with tempfile.TemporaryDirectory(prefix='startup-benchmark-') as tmp_dir:
+        copy_root = copy_repository(repo_root, Path(tmp_dir))
+        return _run_scenarios(copy_root, budgets, top)
+
+
+def _run_scenarios(repo_root: Path, budgets: Dict[str, float], top: int) -> bool:
+    script = str(repo_root / 'tools' / 'build_manager.py')
+
+    # 先构建一次（同时写好字节码缓存），之后的增量构建没有需要处理的文件
+    logger.info("Warming up with an incremental build...")
+    profile_command([script], repo_root)
+
+    within_budget = True
+    for scenario, args, budget_key, wall_budget_key in (
+        ('--help', [script, '--help'], 'help_budget_ms', None),
+        ('no-op build', [script], 'noop_build_budget_ms', 'noop_build_wall_budget_ms'),
+    ):
+        profile = profile_command(args, repo_root)
+        budget = budgets[budget_key]
+        wall_time_ms = profile.wall_time * 1000
+        ok = profile.import_time_ms <= budget
+        wall_note = ''
+        if wall_budget_key:
+            wall_budget = budgets[wall_budget_key]
+            ok = ok and wall_time_ms <= wall_budget
+            wall_note = f" (budget {wall_budget}ms)"
+        logger.info(
+            f"{scenario}: imports {profile.import_time_ms:.1f}ms (budget {budget}ms), "
+            f"wall {wall_time_ms:.0f}ms{wall_note} - {'ok' if ok else 'OVER BUDGET'}"
+        )
+        for module, cumulative in profile.slowest(top):
+            logger.info(f"  {cumulative / 1000:8.1f}ms  {module}")
+        if not ok:
+            within_budget = False
+    return within_budget
+
+
+def main():
+    """主入口函数"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Check build tool startup time against the configured budget')
+    parser.add_argument('--top', type=int, default=10, help='Number of slowest imports to list')
+    args = parser.parse_args()
+
+    repo_root = Path(__file__).resolve().parents[1]
+    try:
+        ok = run_benchmark(repo_root, args.top)
+    except Exception as e:
+        logger.error(f"Startup benchmark failed: {e}")
+        raise SystemExit(2)
+    if not ok:
+        logger.error("Startup time exceeds the configured budget")
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""构建工具测试的公共设置：工具脚本以 tools/ 为导入根目录"""
+import sys
+from pathlib import Path
+
+TOOLS_DIR = Path(__file__).resolve().parents[1]
+if str(TOOLS_DIR) not in sys.path:
+    sys.path.insert(0, str(TOOLS_DIR))
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Tests for asset_manager: hashing, hardlinked versions, pruning and reference rewriting."""
+import hashlib
+import os
+
+import pytest
+
+from asset_manager import AssetManager
+
+PAGE = (
+    '<link rel="stylesheet" href="styles.css">\n'
+    '<script defer src="./js/app.js?v=1"></script>\n'
+    '<script src="https://cdn.example.com/lib.js"></script>\n'
+    '<div data-lazy-scripts="./js/app.js,./js/missing.js"></div>\n'
+)
+
+
+@pytest.fixture
+def site(tmp_path):
+    docs = tmp_path / 'docs'
+    (docs / 'js' / 'tests' / 'coverage').mkdir(parents=True)
+    (docs / 'js' / 'app.js').write_text('console.log("v1");\n')
+    (docs / 'styles.css').write_text('body { color: red; }\n')
+    (docs / 'index.html').write_text(PAGE)
+    (docs / 'js' / 'tests' / 'coverage' / 'index.html').write_text('<script src="../../app.js"></script>\n')
+    return tmp_path
+
+
+def short_hash(path):
+    return hashlib.sha1(path.read_bytes()).hexdigest()[:8]
+
+
+def replace_file(path, text):
+    """写入新文件再替换，断开与旧版本的硬链接（如编辑器保存）"""
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+def versions(directory, stem):
+    return sorted(p.name for p in directory.glob(f'{stem}.*.js'))
+
+
+def test_versioned_copies_are_hardlinks_named_by_hash(site):
+    AssetManager(site).process_assets()
+    app = site / 'docs' / 'js' / 'app.js'
+    versioned = app.with_name(f'app.{short_hash(app)}.js')
+    assert versioned.exists()
+    assert os.path.samefile(versioned, app)
+
+
+def test_references_are_rewritten_outside_excluded_dirs(site):
+    manager = AssetManager(site)
+    manager.process_assets()
+    docs = site / 'docs'
+    app_name = f'app.{short_hash(docs / "js" / "app.js")}.js'
+    css_name = f'styles.{short_hash(docs / "styles.css")}.css'
+
+    page = (docs / 'index.html').read_text()
+    assert f'href="{css_name}"' in page
+    assert f'src="./js/{app_name}?v=1"' in page
+    assert 'src="https://cdn.example.com/lib.js"' in page
+    assert f'data-lazy-scripts="./js/{app_name},./js/missing.js"' in page
+    # 测试报告中的页面不改写
+    coverage = docs / 'js' / 'tests' / 'coverage' / 'index.html'
+    assert coverage.read_text() == '<script src="../../app.js"></script>\n'
+
+    # 已是最新版本时不再写回
+    mtime = (docs / 'index.html').stat().st_mtime_ns
+    AssetManager(site).process_assets()
+    assert (docs / 'index.html').stat().st_mtime_ns == mtime
+
+    # 内容变化后引用更新到新版本
+    replace_file(docs / 'js' / 'app.js', 'console.log("v2");\n')
+    AssetManager(site).process_assets()
+    new_name = f'app.{short_hash(docs / "js" / "app.js")}.js'
+    page = (docs / 'index.html').read_text()
+    assert f'src="./js/{new_name}?v=1"' in page
+    assert app_name not in page
+
+
+def test_old_versions_are_pruned_beyond_kept_generations(site):
+    js = site / 'docs' / 'js'
+    hashes = []
+    for version in range(1, 5):
+        replace_file(js / 'app.js', f'console.log("v{version}");\n')
+        hashes.append(short_hash(js / 'app.js'))
+        AssetManager(site, keep_generations=2).process_assets()
+
+    # 当前版本和上一个版本
+    assert versions(js, 'app') == sorted(f'app.{h}.js' for h in hashes[-2:])
+
+
+def test_in_place_edit_drops_the_stale_hardlinked_version(site):
+    js = site / 'docs' / 'js'
+    AssetManager(site).process_assets()
+    old = f'app.{short_hash(js / "app.js")}.js'
+
+    # 原地修改同时改变了硬链接的旧版本，旧版本不能再以旧哈希提供
+    (js / 'app.js').write_text('console.log("edited");\n')
+    AssetManager(site).process_assets()
+    assert versions(js, 'app') == [f'app.{short_hash(js / "app.js")}.js']
+    assert old not in versions(js, 'app')
+
+
+def test_deleted_source_loses_its_versions_and_manifest_entry(site):
+    js = site / 'docs' / 'js'
+    AssetManager(site).process_assets()
+    (js / 'app.js').unlink()
+
+    manager = AssetManager(site)
+    manager.process_assets()
+    assert versions(js, 'app') == []
+    assert 'js/app.js' not in manager.manifest
+    assert 'js/app.js' not in manager.state.load_assets()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Tests for build_index."""
+from pathlib import Path
+
+from PIL import Image
+
+from build_index import NoteEntry, collect_notes, plan_note_images, process_image_jobs, reconcile_images
+
+
+def test_failed_image_is_dropped_from_index(tmp_path, caplog):
+    image_dir = tmp_path / 'notes' / 'cigars' / 'images'
+    image_dir.mkdir(parents=True)
+    Image.new('RGB', (32, 32), (200, 10, 10)).save(image_dir / 'good.jpg')
+    (image_dir / 'bad.jpg').write_bytes(b'not a jpeg')
+    (tmp_path / 'notes' / 'cigars' / '2024-01-01-test.md').write_text(
+        '---\n'
+        'title: Test\n'
+        'images:\n'
+        '  - path: notes/cigars/images/good.jpg\n'
+        '  - path: notes/cigars/images/bad.jpg\n'
+        '---\n'
+    )
+
+    image_jobs = []
+    entries = collect_notes(tmp_path, image_jobs)
+    # 预测阶段两张图片都在条目中
+    assert len(entries[0].images) == 2
+
+    results = process_image_jobs(tmp_path, image_jobs)
+    assert reconcile_images(tmp_path, entries, results)
+    assert 'Failed to process image notes/cigars/images/bad.jpg' in caplog.text
+
+    images = entries[0].images
+    assert [image['path'] for image in images] == ['notes/cigars/images/good.jpg']
+    output_dir = tmp_path / 'docs' / 'images'
+    for key in ('url', 'webp', 'thumb'):
+        assert (output_dir / images[0][key]).exists()
+
+
+def test_plan_note_images_predicts_outputs_without_encoding(tmp_path):
+    image_dir = tmp_path / 'notes' / 'cigars' / 'images'
+    image_dir.mkdir(parents=True)
+    Image.new('RGB', (16, 16)).save(image_dir / 'p1.jpg')
+    meta = {'images': [
+        {'path': 'notes/cigars/images/p1.jpg', 'caption': 'Foot'},
+        {'path': 'notes/cigars/images/missing.jpg'},
+        'not a mapping',
+    ]}
+
+    image_jobs = []
+    planned = plan_note_images(tmp_path, meta, image_jobs)
+
+    assert planned == [{
+        'path': 'notes/cigars/images/p1.jpg',
+        'thumb': 'p1_thumb.jpg',
+        'caption': 'Foot',
+        'url': 'p1.jpg',
+        'webp': 'p1.webp',
+    }]
+    assert image_jobs == [image_dir / 'p1.jpg']
+    assert not (tmp_path / 'docs' / 'images' / 'p1.jpg').exists()
+    assert plan_note_images(tmp_path, {}, image_jobs) == []
+
+
+def test_reconcile_images_only_reports_real_changes(tmp_path):
+    image = tmp_path / 'notes' / 'cigars' / 'images' / 'p2.jpg'
+    planned = {'path': 'notes/cigars/images/p2.jpg', 'thumb': 'p2_thumb.jpg',
+               'caption': '', 'url': 'p2.jpg', 'webp': 'p2.webp'}
+    entry = NoteEntry('cigars', '2024-01-01', Path('notes/cigars/2024-01-01-test.md'),
+                      'Test', [dict(planned)])
+
+    predicted = {str(image): {'optimized': 'p2.jpg', 'webp': 'p2.webp', 'thumbnail': 'p2_thumb.jpg'}}
+    assert not reconcile_images(tmp_path, [entry], predicted)
+    assert entry.images == [planned]
+
+    # 近似重复的图片复用了另一张图片的输出
+    deduplicated = {str(image): {'optimized': 'p1.jpg', 'webp': 'p1.webp', 'thumbnail': 'p1_thumb.jpg'}}
+    assert reconcile_images(tmp_path, [entry], deduplicated)
+    assert entry.images[0]['url'] == 'p1.jpg'
+    assert entry.images[0]['thumb'] == 'p1_thumb.jpg'
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""Tests for build_logger."""
+import logging
+
+from build_logger import setup_logging
+
+
+def test_repeated_setup_does_not_duplicate_handlers(tmp_path):
+    for _ in range(3):
+        logger = setup_logging('test_build_logger', tmp_path)
+    logger.info('once')
+
+    assert len(logging.getLogger('test_build_logger').handlers) == 2
+    log_file = next(tmp_path.glob('build-*.log'))
+    assert log_file.read_text().count('once') == 1
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""Tests for build_state: persistence across connections and the database location."""
+from build_state import STATE_FILE_NAME, BuildState, get_build_state
+
+
+def test_reopened_database_keeps_committed_data(tmp_path):
+    db_path = tmp_path / STATE_FILE_NAME
+    state = BuildState(db_path)
+    assert state.conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+    state.replace_files({'notes/a.md': (5, 123, 'abc')}, {'commit': 'deadbeef'})
+    state.replace_compression({'index.html': {'hash': 'h', 'encodings': ['.gz']}})
+    state.put_image_phash('00ff-102030', {'optimized': 'a.jpg'})
+    state.close()
+
+    reopened = BuildState(db_path)
+    assert reopened.load_files() == {'notes/a.md': (5, 123, 'abc')}
+    assert reopened.get_meta('commit') == 'deadbeef'
+    assert reopened.load_compression() == {'index.html': {'hash': 'h', 'encodings': ['.gz']}}
+    assert reopened.load_image_phashes() == {'00ff-102030': {'optimized': 'a.jpg'}}
+    reopened.close()
+
+
+def test_database_lives_outside_published_docs(tmp_path):
+    (tmp_path / 'docs').mkdir()
+
+    state = get_build_state(tmp_path)
+    state.set_meta({'commit': 'deadbeef'})
+    assert state.db_path == (tmp_path / STATE_FILE_NAME).resolve()
+    assert not list((tmp_path / 'docs').iterdir())
+    state.close()
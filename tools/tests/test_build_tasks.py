@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""Tests for build_tasks worker setup."""
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+from build_tasks import init_worker
+from parallel_processor import create_process_pool
+
+
+def test_worker_processes_ignore_sigint():
+    with create_process_pool(1, init_worker) as pool:
+        assert pool.submit(signal.getsignal, signal.SIGINT).result() == signal.SIG_IGN
+
+
+def test_thread_workers_leave_the_parent_handler_alone():
+    before = signal.getsignal(signal.SIGINT)
+    with ThreadPoolExecutor(max_workers=1, initializer=init_worker) as pool:
+        pool.submit(lambda: None).result()
+    assert signal.getsignal(signal.SIGINT) is before
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Tests for bundle_assets: page rewriting and regenerating bundles from the page alone."""
+import pytest
+
+from asset_manager import AssetManager
+from build_state import STATE_FILE_NAME
+from bundle_assets import ScriptBundler
+
+PAGE = (
+    '<link rel="preload" href="./js/a.js" as="script">\n'
+    '<script defer src="./js/a.js"></script>\n'
+    '<script defer src="./js/b.js"></script>\n'
+    '<section id="charts" data-lazy-scripts="./js/lazy.js"></section>\n'
+)
+
+
+@pytest.fixture
+def site(tmp_path):
+    js = tmp_path / 'docs' / 'js'
+    js.mkdir(parents=True)
+    for name in ('a', 'b', 'lazy'):
+        (js / f'{name}.js').write_text(f'console.log("{name}");\n')
+    (tmp_path / 'docs' / 'index.html').write_text(PAGE)
+    return tmp_path
+
+
+def test_page_records_the_sources_of_each_bundle(site):
+    docs = site / 'docs'
+    manifest = ScriptBundler(docs).bundle()
+
+    assert manifest['index.html']['critical']['sources'] == ['js/a.js', 'js/b.js']
+    assert manifest['index.html']['chunks']['charts']['sources'] == ['js/lazy.js']
+    page = (docs / 'index.html').read_text()
+    assert page == (
+        '<script defer src="./js/bundles/index.js" data-bundle-sources="./js/a.js,./js/b.js"></script>\n'
+        '<section id="charts" data-lazy-scripts="./js/bundles/index.charts.js" '
+        'data-lazy-sources="./js/lazy.js"></section>\n'
+    )
+    bundle = (docs / 'js' / 'bundles' / 'index.js').read_text()
+    assert bundle == '/* js/a.js */\nconsole.log("a");\n;\n/* js/b.js */\nconsole.log("b");\n;\n'
+    assert 'console.log("lazy")' in (docs / 'js' / 'bundles' / 'index.charts.js').read_text()
+
+
+def test_bundles_regenerate_without_build_state(site):
+    docs = site / 'docs'
+    ScriptBundler(docs).bundle()
+    # 资源版本化之后页面引用的是带哈希的分块
+    AssetManager(site, bundle=False).process_assets()
+    for path in site.glob(STATE_FILE_NAME + '*'):
+        path.unlink()
+    versioned_page = (docs / 'index.html').read_text()
+    assert 'src="./js/bundles/index.' in versioned_page
+
+    (docs / 'js' / 'b.js').write_text('console.log("b2");\n')
+    (docs / 'js' / 'lazy.js').write_text('console.log("lazy2");\n')
+    ScriptBundler(docs).bundle()
+
+    assert 'console.log("b2")' in (docs / 'js' / 'bundles' / 'index.js').read_text()
+    assert 'console.log("lazy2")' in (docs / 'js' / 'bundles' / 'index.charts.js').read_text()
+    # 页面的版本化引用和源脚本记录保持不变
+    assert (docs / 'index.html').read_text() == versioned_page
+
+
+def test_new_script_joins_the_existing_critical_bundle(site):
+    docs = site / 'docs'
+    ScriptBundler(docs).bundle()
+    (docs / 'js' / 'c.js').write_text('console.log("c");\n')
+    page = docs / 'index.html'
+    page.write_text(page.read_text() + '<script defer src="./js/c.js"></script>\n')
+
+    ScriptBundler(docs).bundle()
+
+    assert page.read_text().count('<script defer') == 1
+    assert 'data-bundle-sources="./js/a.js,./js/b.js,./js/c.js"' in page.read_text()
+    assert 'console.log("c")' in (docs / 'js' / 'bundles' / 'index.js').read_text()
+
+
+def test_single_script_page_is_left_alone(site):
+    docs = site / 'docs'
+    single = '<script defer src="./js/a.js"></script>\n'
+    (docs / 'index.html').write_text(single)
+
+    assert ScriptBundler(docs).bundle() == {}
+    assert (docs / 'index.html').read_text() == single
+    assert not (docs / 'js' / 'bundles').exists()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Tests for change_detector: changes reported from the snapshot and from git."""
+import shutil
+import subprocess
+
+import pytest
+
+from build_state import BuildState
+from change_detector import ChangeDetector
+
+
+def make_detector(root):
+    return ChangeDetector(root, [root / 'notes'], BuildState(root / 'state.db'))
+
+
+def write_notes(root):
+    notes = root / 'notes'
+    notes.mkdir()
+    (notes / 'a.md').write_text('alpha\n')
+    (notes / 'b.md').write_text('beta\n')
+    (notes / 'c.md').write_text('gamma\n')
+
+
+def git(root, *args):
+    subprocess.run(['git', *args], cwd=root, check=True, capture_output=True)
+
+
+def test_first_detect_reports_everything_added(tmp_path):
+    write_notes(tmp_path)
+    changes = make_detector(tmp_path).detect()
+    assert sorted(p.name for p in changes.added) == ['a.md', 'b.md', 'c.md']
+    assert not (changes.modified or changes.deleted or changes.renamed)
+
+
+def test_snapshot_reports_rename_delete_and_modify(tmp_path):
+    write_notes(tmp_path)
+    detector = make_detector(tmp_path)
+    detector.detect()
+    detector.commit()
+
+    notes = tmp_path / 'notes'
+    (notes / 'a.md').rename(notes / 'renamed.md')
+    (notes / 'b.md').unlink()
+    (notes / 'c.md').write_text('gamma, edited\n')
+
+    detector = make_detector(tmp_path)
+    changes = detector.detect()
+    assert detector.source == 'snapshot'
+    assert changes.renamed == {notes / 'a.md': notes / 'renamed.md'}
+    assert changes.deleted == [notes / 'b.md']
+    assert changes.modified == [notes / 'c.md']
+    assert changes.added == []
+
+    detector.commit()
+    assert not make_detector(tmp_path).detect()
+
+
+@pytest.mark.skipif(shutil.which('git') is None, reason='git is not installed')
+def test_git_reports_rename_and_delete(tmp_path):
+    write_notes(tmp_path)
+    git(tmp_path, 'init', '-q')
+    git(tmp_path, 'config', 'user.email', 'builder@example.com')
+    git(tmp_path, 'config', 'user.name', 'builder')
+    git(tmp_path, 'add', 'notes')
+    git(tmp_path, 'commit', '-q', '-m', 'notes')
+
+    detector = make_detector(tmp_path)
+    detector.detect()
+    detector.commit()
+
+    notes = tmp_path / 'notes'
+    git(tmp_path, 'mv', 'notes/a.md', 'notes/renamed.md')
+    git(tmp_path, 'rm', '-q', 'notes/b.md')
+    git(tmp_path, 'commit', '-q', '-m', 'rename and delete')
+    # 未提交的新文件也要报告
+    (notes / 'd.md').write_text('delta\n')
+
+    detector = make_detector(tmp_path)
+    changes = detector.detect()
+    assert detector.source == 'git'
+    assert changes.renamed == {notes / 'a.md': notes / 'renamed.md'}
+    assert changes.deleted == [notes / 'b.md']
+    assert changes.added == [notes / 'd.md']
+    assert changes.modified == []
+
+    detector.commit()
+    assert not make_detector(tmp_path).detect()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Tests for compress_assets: sidecar regeneration, skipping and removal."""
+import gzip
+import os
+
+import pytest
+
+from compress_assets import AssetCompressor
+
+
+def script(text):
+    # 足够长且可压缩，保证生成压缩文件
+    return f'console.log("{text}");\n' * 50
+
+
+@pytest.fixture
+def site(tmp_path):
+    js = tmp_path / 'docs' / 'js'
+    js.mkdir(parents=True)
+    (js / 'app.js').write_text(script('v1'))
+    # 压缩后不会变小的文件
+    (js / 'tiny.js').write_text('x')
+    return tmp_path
+
+
+def test_sidecar_follows_source_changes_and_deletion(site):
+    source = site / 'docs' / 'js' / 'app.js'
+    sidecar = source.with_name('app.js.gz')
+
+    stats = AssetCompressor(site).compress()
+    assert stats['compressed'] == 2
+    assert gzip.decompress(sidecar.read_bytes()).decode() == script('v1')
+    assert not (site / 'docs' / 'js' / 'tiny.js.gz').exists()
+
+    # 未变化的文件按大小和修改时间跳过
+    stats = AssetCompressor(site).compress()
+    assert stats == {'compressed': 0, 'skipped': 2, 'bytes_in': 0, 'bytes_out': 0}
+
+    # 只是重新写出相同内容时按哈希跳过，压缩文件不重写
+    sidecar_mtime = sidecar.stat().st_mtime_ns
+    source.write_text(script('v1'))
+    os.utime(source, ns=(source.stat().st_atime_ns, source.stat().st_mtime_ns + 10**9))
+    assert AssetCompressor(site).compress()['skipped'] == 2
+    assert sidecar.stat().st_mtime_ns == sidecar_mtime
+
+    # 修改源文件后重新生成
+    source.write_text(script('v2'))
+    os.utime(source, ns=(source.stat().st_atime_ns, source.stat().st_mtime_ns + 2 * 10**9))
+    stats = AssetCompressor(site).compress()
+    assert stats['compressed'] == 1
+    assert gzip.decompress(sidecar.read_bytes()).decode() == script('v2')
+
+    # 删除源文件后压缩文件和状态条目一并删除
+    source.unlink()
+    compressor = AssetCompressor(site)
+    compressor.compress()
+    assert not list(source.parent.glob('app.js.*'))
+    assert 'js/app.js' not in compressor.build_state.load_compression()
+
+
+def test_missing_sidecar_is_regenerated(site):
+    AssetCompressor(site).compress()
+    sidecar = site / 'docs' / 'js' / 'app.js.gz'
+    sidecar.unlink()
+
+    assert AssetCompressor(site).compress()['compressed'] == 1
+    assert sidecar.exists()
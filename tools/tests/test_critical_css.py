@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Tests for critical_css."""
+from critical_css import CriticalCssExtractor, _parse_blocks
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>t</title></head>
+<body>
+  <header class="site-header" id="top"><h1 class="title">Notes</h1></header>
+  <section class="hero"><p class="lead">Hello</p></section>
+  <section class="below"><p class="footer-note">Later</p></section>
+</body></html>
+"""
+
+CSS = """
+@charset "utf-8";
+body { margin: 0 }
+.site-header, .sidebar { color: red }
+#top .title:hover { color: blue }
+.footer-note { color: green }
+@media (max-width: 600px) { .lead { font-size: 14px } .footer-note { display: none } }
+@keyframes fade { from { opacity: 0 } to { opacity: 1 } }
+@keyframes unused { from { opacity: 0 } to { opacity: 1 } }
+.hero { animation: fade 1s }
+"""
+
+
+def test_selects_rules_for_elements_above_the_fold():
+    critical = CriticalCssExtractor(PAGE).extract(CSS)
+
+    assert critical.startswith('@charset "utf-8";')
+    assert 'body{margin:0}' in critical
+    # 只保留首屏中出现的选择器
+    assert '.site-header{color:red}' in critical
+    assert '.sidebar' not in critical
+    assert '#top .title:hover{color:blue}' in critical
+    assert '.footer-note' not in critical
+    assert '@media (max-width:600px){.lead{font-size:14px}}' in critical
+    # 只保留被引用的动画
+    assert '@keyframes fade' in critical
+    assert 'unused' not in critical
+
+
+def test_stray_closing_brace_is_not_rendered():
+    css = CSS + '.hero{padding:0}}\n.lead{color:black}}'
+    critical = CriticalCssExtractor(PAGE).extract(css)
+
+    assert 'None' not in critical
+    assert '.hero{padding:0}' in critical
+    assert '.lead{color:black}' in critical
+    assert all(body is not None or prelude.startswith('@')
+               for prelude, body in _parse_blocks('a{b:c}}d{e:f}}'))
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Tests for image_gc."""
+from pathlib import Path
+
+from PIL import Image
+
+from image_gc import ImageGarbageCollector
+from image_processor import ImageProcessor
+
+
+def write_note(root: Path, images):
+    note = root / 'notes' / 'cigars' / '2024-01-01-test.md'
+    note.parent.mkdir(parents=True, exist_ok=True)
+    lines = ['---', 'title: Test', 'images:']
+    for image in images:
+        lines.append(f'  - path: {image}')
+    lines += ['---', '', 'Body']
+    note.write_text('\n'.join(lines) + '\n')
+
+
+def test_relative_root_keeps_outputs_of_deduplicated_image(tmp_path, monkeypatch):
+    image_dir = tmp_path / 'notes' / 'cigars' / 'images'
+    image_dir.mkdir(parents=True)
+    for name in ('p1.jpg', 'p2.jpg'):
+        Image.new('RGB', (64, 48), (120, 60, 30)).save(image_dir / name)
+
+    output_dir = tmp_path / 'docs' / 'images'
+    processor = ImageProcessor(output_dir, root_dir=tmp_path)
+    processor.process_image(image_dir / 'p1.jpg')
+    info = processor.process_image(image_dir / 'p2.jpg')
+    assert info['duplicate_of'] == str(image_dir / 'p1.jpg')
+
+    # 只有 p2 仍被引用，但它复用的是 p1 的输出
+    write_note(tmp_path, ['notes/cigars/images/p2.jpg'])
+
+    monkeypatch.chdir(tmp_path)
+    report = ImageGarbageCollector(Path('.')).collect(dry_run=True)
+
+    assert report['live_sources'] == 1
+    assert report['orphaned_outputs'] == []
+    assert {'p1.jpg', 'p1.webp', 'p1_thumb.jpg'} <= {p.name for p in output_dir.iterdir()}
+
+
+def test_cache_key_does_not_depend_on_invocation_path(tmp_path, monkeypatch):
+    image = tmp_path / 'notes' / 'cigars' / 'images' / 'p1.jpg'
+    image.parent.mkdir(parents=True)
+    Image.new('RGB', (8, 8)).save(image)
+
+    processor = ImageProcessor(tmp_path / 'docs' / 'images', root_dir=tmp_path)
+    monkeypatch.chdir(tmp_path)
+    assert processor._compute_cache_key(image) == processor._compute_cache_key(
+        Path('notes/cigars/images/p1.jpg'))
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Tests for image_processor: perceptual-hash deduplication."""
+import pytest
+from PIL import Image
+
+from build_logger import BuildError
+from build_state import BuildState
+from image_processor import ImageProcessor
+
+
+def gradient(path, mirrored=False, tweak=False):
+    """水平渐变；mirrored 时方向相反（平均颜色相同，dHash 完全不同）"""
+    img = Image.linear_gradient('L').transpose(Image.Transpose.ROTATE_90).resize((96, 64))
+    if mirrored:
+        img = img.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+    img = Image.merge('RGB', (img, img, img))
+    if tweak:
+        # 近似而不完全相同：改动几个像素并换一种编码
+        for x in range(4):
+            img.putpixel((x, 0), (255, 0, 0))
+    img.save(path, quality=90 if path.suffix == '.jpg' else None)
+    return path
+
+
+@pytest.fixture
+def processor(tmp_path):
+    return ImageProcessor(tmp_path / 'docs' / 'images', state=BuildState(tmp_path / 'state.db'),
+                          root_dir=tmp_path)
+
+
+def test_near_identical_images_share_one_output(tmp_path, processor):
+    (tmp_path / 'docs' / 'images').mkdir(parents=True, exist_ok=True)
+    first = gradient(tmp_path / 'a.png')
+    second = gradient(tmp_path / 'b.jpg', tweak=True)
+
+    results = processor.process_batch([first, second], max_workers=2)
+
+    infos = [results[str(first)], results[str(second)]]
+    assert infos[0]['optimized'] == infos[1]['optimized']
+    assert sum('duplicate_of' in info for info in infos) == 1
+    assert len(list((tmp_path / 'docs' / 'images').glob('*_thumb.jpg'))) == 1
+    assert processor._pending_phashes == {}
+
+
+def test_different_images_are_encoded_separately(tmp_path, processor):
+    (tmp_path / 'docs' / 'images').mkdir(parents=True, exist_ok=True)
+    forward = processor.process_image(gradient(tmp_path / 'f.png'))
+    mirrored = processor.process_image(gradient(tmp_path / 'm.png', mirrored=True))
+    assert 'duplicate_of' not in mirrored
+    assert forward['optimized'] != mirrored['optimized']
+
+
+def test_failed_encode_releases_its_claim(tmp_path, processor, monkeypatch):
+    (tmp_path / 'docs' / 'images').mkdir(parents=True, exist_ok=True)
+    first = gradient(tmp_path / 'a.png')
+    second = gradient(tmp_path / 'b.jpg', tweak=True)
+    optimize = processor._optimize_image
+    calls = []
+
+    def failing_once(img, name):
+        calls.append(name)
+        if len(calls) == 1:
+            raise OSError('disk full')
+        return optimize(img, name)
+
+    monkeypatch.setattr(processor, '_optimize_image', failing_once)
+    with pytest.raises(BuildError):
+        processor.process_image(first)
+    assert processor._pending_phashes == {}
+
+    # 第一张没有成功编码，近似图片不能复用它，只能自己编码
+    info = processor.process_image(second)
+    assert 'duplicate_of' not in info
+    assert info['optimized'] == 'b.jpg'
+    assert processor.state.load_image_phashes()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Tests for minify."""
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from minify import minify_css, minify_js
+
+DOCS_JS = Path(__file__).resolve().parents[2] / 'docs' / 'js'
+
+needs_node = pytest.mark.skipif(shutil.which('node') is None, reason='node is not installed')
+
+# 正则字面量、模板字符串、自动分号插入和注释
+TRICKY_JS = r"""
+/*! licence header */
+const re = /\/\*not a comment*\//g;   // trailing comment
+let a = 1
+let b = a
+++a
+const s = `x ${ a + /}/.source.length } y // not a comment`;
+function f(x) { return x / 2 / 1 }
+const g = (y) => y
+  - 1
+if (!re.test('/*a*/')) { console.log('regex failed') }
+console.log(a, b, s, f(8), g(3), typeof re, 'a' + +'1', 1 - -1)
+"""
+
+
+def node(*args: str, **kwargs) -> subprocess.CompletedProcess:
+    return subprocess.run(['node', *args], capture_output=True, text=True, **kwargs)
+
+
+@needs_node
+@pytest.mark.parametrize('script', sorted(DOCS_JS.glob('*.js')), ids=lambda path: path.name)
+def test_minified_site_scripts_parse(script, tmp_path):
+    minified = tmp_path / script.name
+    minified.write_text(minify_js(script.read_text(encoding='utf-8')), encoding='utf-8')
+    result = node('--check', str(minified))
+    assert result.returncode == 0, result.stderr
+
+
+@needs_node
+def test_minified_js_behaves_like_source(tmp_path):
+    source = tmp_path / 'source.js'
+    minified = tmp_path / 'minified.js'
+    source.write_text(TRICKY_JS)
+    minified.write_text(minify_js(TRICKY_JS))
+
+    assert node('--check', str(minified)).returncode == 0
+    expected = node(str(source))
+    assert expected.returncode == 0, expected.stderr
+    assert node(str(minified)).stdout == expected.stdout
+    assert '/*! licence header */' in minified.read_text()
+    assert '// trailing comment' not in minified.read_text()
+
+
+def test_minify_css_keeps_strings_and_removes_comments():
+    css = '/* c */ a > b , .x { content: "  /* keep */  " ; margin: 0 1px }\n\n/*! keep */'
+    assert minify_css(css) == 'a>b,.x{content:"  /* keep */  ";margin:0 1px}/*! keep */'
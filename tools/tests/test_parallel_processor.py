@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Tests for ParallelProcessor.process_files: window, retries, timeouts and progress."""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from parallel_processor import ParallelProcessor
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """记录每次提交时尚未完成的任务数"""
+
+    def __init__(self, max_workers):
+        super().__init__(max_workers=max_workers)
+        self.futures = []
+        self.outstanding = []
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        with self.lock:
+            self.outstanding.append(sum(not f.done() for f in self.futures) + 1)
+            future = super().submit(fn, *args, **kwargs)
+            self.futures.append(future)
+            return future
+
+
+def flaky(failures):
+    """前 failures[item] 次调用失败的处理函数"""
+    calls = {}
+    lock = threading.Lock()
+
+    def process(item):
+        with lock:
+            calls[item] = calls.get(item, 0) + 1
+            attempt = calls[item]
+        time.sleep(0.01)
+        if attempt <= failures.get(item, 0):
+            raise ValueError(f"{item} failed on attempt {attempt}")
+        return item * 10
+    return process
+
+
+def test_results_keep_input_order():
+    results = ParallelProcessor(max_workers=4).process_files(list(range(8)), flaky({}))
+    assert [r.value for r in results] == [i * 10 for i in range(8)]
+    assert all(r.ok and r.attempts == 1 for r in results)
+
+
+def test_retries_respect_the_in_flight_window():
+    executor = CountingExecutor(max_workers=4)
+    try:
+        processor = ParallelProcessor(max_workers=4, executor=executor)
+        results = processor.process_files(
+            list(range(10)), flaky({i: 1 for i in range(10)}), max_in_flight=2, retries=1
+        )
+    finally:
+        executor.shutdown()
+    assert all(r.ok and r.attempts == 2 for r in results)
+    assert len(executor.outstanding) == 20
+    assert max(executor.outstanding) <= 2
+
+
+def test_errors_after_the_last_retry_are_reported():
+    results = ParallelProcessor(max_workers=2).process_files([1, 2], flaky({1: 5}), retries=2)
+    assert results[0].attempts == 3
+    assert isinstance(results[0].error, ValueError)
+    assert results[1].ok and results[1].value == 20
+
+
+def test_timeout_abandons_the_slow_item():
+    def process(item):
+        time.sleep(0.5 if item == 'slow' else 0.01)
+        return item
+
+    started = time.monotonic()
+    results = ParallelProcessor(max_workers=2).process_files(['slow', 'fast'], process, timeout=0.1)
+    assert time.monotonic() - started < 0.4
+    assert isinstance(results[0].error, TimeoutError)
+    assert results[1].ok and results[1].value == 'fast'
+
+
+def test_progress_is_reported_once_per_item():
+    calls = []
+    ParallelProcessor(max_workers=3).process_files(
+        list(range(5)), flaky({0: 1, 3: 1}), retries=1,
+        progress=lambda done, total, result: calls.append((done, total, result.ok))
+    )
+    assert [(done, total) for done, total, _ in calls] == [(i, 5) for i in range(1, 6)]
+    assert all(ok for _, _, ok in calls)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""Tests for performance_monitor: ring buffers, streaming stats, trace export and reports."""
+import json
+import os
+import statistics
+import threading
+
+import pytest
+
+from performance_monitor import (MetricSeries, PerformanceMonitor, RingBuffer, StreamingStats,
+                                 TaskTimer, TraceSpan)
+
+
+def test_ring_buffer_keeps_the_latest_values_in_order():
+    buffer = RingBuffer(4)
+    assert buffer.values() == []
+    for value in range(3):
+        buffer.append(value)
+    assert len(buffer) == 3
+    assert buffer.values() == [0.0, 1.0, 2.0]
+
+    # 写满后覆盖最旧的值，起点绕回数组开头
+    for value in range(3, 11):
+        buffer.append(value)
+        assert len(buffer) == 4
+        assert buffer.values() == [float(v) for v in range(value - 3, value + 1)]
+
+    single = RingBuffer(0)
+    single.append(1.0)
+    single.append(2.0)
+    assert single.capacity == 1
+    assert single.values() == [2.0]
+
+
+def test_streaming_stats_match_the_full_sample():
+    values = [3.5, -1.0, 12.25, 0.0, 7.0, 7.0]
+    stats = StreamingStats()
+    assert stats.mean == 0.0
+    for value in values:
+        stats.add(value)
+
+    assert stats.count == len(values)
+    assert stats.min == min(values)
+    assert stats.max == max(values)
+    assert stats.mean == pytest.approx(statistics.fmean(values))
+
+
+def test_metric_series_stats_cover_values_dropped_from_the_window():
+    series = MetricSeries(capacity=3)
+    for second, value in enumerate([10.0, 50.0, 20.0, 30.0, 40.0]):
+        series.add(1000.0 + second, value)
+
+    assert series.values.values() == [20.0, 30.0, 40.0]
+    assert series.timestamps.values() == [1002.0, 1003.0, 1004.0]
+    assert series.stats.max == 50.0
+    assert series.stats.mean == pytest.approx(30.0)
+    assert (series.first, series.last) == (10.0, 40.0)
+
+
+def test_trace_events_use_microseconds_and_name_processes_and_threads(tmp_path):
+    monitor = PerformanceMonitor(tmp_path)
+    start = monitor.start_time
+    pid, tid = os.getpid(), threading.get_native_id()
+    monitor.record_span(TraceSpan('build', start + 0.5, start + 2.0, pid, tid, 'stage',
+                                  thread_name='MainThread'))
+    monitor.record_span(TraceSpan('resize', start + 1.0, start + 1.25, pid + 1, 7,
+                                  args={'file': 'a.jpg'}, thread_name='worker'))
+
+    events = monitor.trace_events()
+    complete = [event for event in events if event['ph'] == 'X']
+    assert complete[0] == {
+        'name': 'build', 'cat': 'stage', 'ph': 'X', 'ts': 500000.0, 'dur': 1500000.0,
+        'pid': pid, 'tid': tid, 'args': {}
+    }
+    assert complete[1]['ts'] == 1000000.0
+    assert complete[1]['dur'] == 250000.0
+    assert complete[1]['args'] == {'file': 'a.jpg'}
+
+    metadata = [event for event in events if event['ph'] == 'M']
+    assert metadata == [
+        {'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': 'build'}},
+        {'name': 'process_name', 'ph': 'M', 'pid': pid + 1, 'tid': 0, 'args': {'name': f'worker {pid + 1}'}},
+        {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': 'MainThread'}},
+        {'name': 'thread_name', 'ph': 'M', 'pid': pid + 1, 'tid': 7, 'args': {'name': 'worker'}},
+    ]
+    # 只有 task 类别的区间计入任务汇总
+    assert list(monitor.task_stats) == ['resize']
+
+    trace_file = tmp_path / 'trace.json'
+    monitor.export_trace(trace_file)
+    assert json.loads(trace_file.read_text()) == {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def test_reports_in_the_same_second_do_not_collide(tmp_path):
+    for _ in range(3):
+        monitor = PerformanceMonitor(tmp_path)
+        with TaskTimer(monitor, 'task'):
+            pass
+        monitor.generate_report()
+
+    reports = sorted((tmp_path / 'metrics').glob('report_*.json'))
+    traces = sorted((tmp_path / 'metrics').glob('trace_*.json'))
+    assert len(reports) == 3
+    assert len(traces) == 3
+    assert json.loads(reports[0].read_text())['task_summary']['task']['count'] == 1
+
+
+def test_only_the_latest_reports_are_kept(tmp_path):
+    metrics = tmp_path / 'metrics'
+    metrics.mkdir()
+    # 旧版本以秒为后缀写出的报告
+    for name in ('report_1700000000.json', 'trace_1700000000.json'):
+        (metrics / name).write_text('{}')
+
+    seen = set()
+    for _ in range(3):
+        monitor = PerformanceMonitor(tmp_path, keep_reports=2)
+        monitor.generate_report()
+        seen.update(p.name for p in metrics.glob('report_*.json'))
+
+    # 新的文件名按时间排序，保留的是最近两次构建的报告
+    reports = sorted(p.name for p in metrics.glob('report_*.json'))
+    assert reports == sorted(seen)[-2:]
+    assert len(list(metrics.glob('trace_*.json'))) == 2
+    assert not (metrics / 'report_1700000000.json').exists()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Tests for serve: ETags, precompressed sidecars, on-demand builds and live reload."""
+import gzip
+import http.client
+import json
+import os
+import threading
+
+import pytest
+
+from serve import RELOAD_PATH, RELOAD_SCRIPT, PreviewServer
+
+
+@pytest.fixture
+def server(tmp_path):
+    notes = tmp_path / 'notes' / 'cigars'
+    notes.mkdir(parents=True)
+    (notes / '2024-01-01-test.md').write_text('---\ntitle: Test\n---\n')
+    docs = tmp_path / 'docs'
+    (docs / 'js').mkdir(parents=True)
+    (docs / 'index.html').write_text('<html><body><h1>Notes</h1></body></html>\n')
+    (docs / 'js' / 'app.js').write_text('console.log("app");\n' * 50)
+
+    server = PreviewServer(tmp_path, ('127.0.0.1', 0), watch=False)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def request(server, path, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=5)
+    conn.request('GET', path, headers=headers or {})
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    return response, body
+
+
+def test_etag_revalidation_returns_not_modified(server):
+    response, body = request(server, '/js/app.js')
+    assert response.status == 200
+    assert body == b'console.log("app");\n' * 50
+    etag = response.getheader('ETag')
+
+    response, body = request(server, '/js/app.js', {'If-None-Match': etag})
+    assert response.status == 304
+    assert body == b''
+
+    # 内容变化后旧的 ETag 不再匹配
+    app = server.docs_dir / 'js' / 'app.js'
+    app.write_text('console.log("v2");\n')
+    os.utime(app, ns=(app.stat().st_atime_ns, app.stat().st_mtime_ns + 10**9))
+    response, body = request(server, '/js/app.js', {'If-None-Match': etag})
+    assert response.status == 200
+    assert body == b'console.log("v2");\n'
+
+
+def test_sidecar_is_served_only_when_accepted_and_fresh(server):
+    app = server.docs_dir / 'js' / 'app.js'
+    sidecar = app.with_name('app.js.gz')
+    sidecar.write_bytes(gzip.compress(app.read_bytes()))
+
+    response, body = request(server, '/js/app.js', {'Accept-Encoding': 'br, gzip'})
+    assert response.getheader('Content-Encoding') == 'gzip'
+    assert 'javascript' in response.getheader('Content-Type')
+    assert gzip.decompress(body) == app.read_bytes()
+
+    response, body = request(server, '/js/app.js', {'Accept-Encoding': 'gzip;q=0'})
+    assert response.getheader('Content-Encoding') is None
+    assert body == app.read_bytes()
+
+    # 源文件比压缩文件新时发送源文件
+    os.utime(sidecar, ns=(sidecar.stat().st_atime_ns, app.stat().st_mtime_ns - 10**9))
+    response, body = request(server, '/js/app.js', {'Accept-Encoding': 'gzip'})
+    assert response.getheader('Content-Encoding') is None
+    assert body == app.read_bytes()
+
+
+def test_data_files_are_built_on_first_request(server):
+    index = server.docs_dir / 'data' / 'index.json'
+    assert not index.exists()
+    builder = server.builders['data/index.json']
+    assert builder.stale
+
+    response, body = request(server, '/data/index.json')
+    assert response.status == 200
+    assert index.exists()
+    assert not builder.stale
+    assert 'Test' in json.dumps(json.loads(body), ensure_ascii=False)
+
+    # 已构建的文件不再重复构建，标记为过期后重新构建
+    index.unlink()
+    assert request(server, '/data/index.json')[0].status == 404
+    builder.stale = True
+    assert request(server, '/data/index.json')[0].status == 200
+
+
+def test_pages_get_reload_script_and_reload_events(server):
+    response, body = request(server, '/')
+    assert response.status == 200
+    assert body.decode() == f'<html><body><h1>Notes</h1>{RELOAD_SCRIPT}</body></html>\n'
+    assert int(response.getheader('Content-Length')) == len(body)
+
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=5)
+    conn.request('GET', RELOAD_PATH)
+    response = conn.getresponse()
+    assert response.getheader('Content-Type') == 'text/event-stream'
+
+    # 连接建立后才开始计版本，持续通知直到收到事件
+    received = threading.Event()
+
+    def notify():
+        while not received.wait(0.05):
+            server.broadcaster.notify()
+
+    notifier = threading.Thread(target=notify, daemon=True)
+    notifier.start()
+    try:
+        assert response.fp.readline() == b'event: reload\n'
+    finally:
+        received.set()
+        notifier.join()
+        conn.close()
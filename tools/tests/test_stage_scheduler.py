@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Tests for stage_scheduler."""
+import threading
+import time
+
+import pytest
+
+from build_logger import BuildError
+from stage_scheduler import Stage, StageScheduler
+
+
+def recorder():
+    events = []
+    lock = threading.Lock()
+
+    def stage(name, duration=0.0, fail=False):
+        def run(workers):
+            with lock:
+                events.append(('start', name))
+            time.sleep(duration)
+            if fail:
+                raise RuntimeError(f'{name} failed')
+            with lock:
+                events.append(('end', name))
+        return run
+
+    return events, stage
+
+
+def position(events, kind, name):
+    return events.index((kind, name))
+
+
+def test_stages_run_after_the_writers_of_their_inputs():
+    events, stage = recorder()
+    scheduler = StageScheduler([
+        Stage('publish', stage('publish'), inputs=('pages', 'feeds')),
+        Stage('feeds', stage('feeds', 0.02), inputs=('notes',), outputs=('feeds',)),
+        Stage('parse', stage('parse', 0.02), outputs=('notes',)),
+        Stage('pages', stage('pages'), outputs=('pages',), deps=('parse',)),
+    ], max_workers=4)
+
+    assert scheduler.dependencies['publish'] == {'feeds', 'pages'}
+    report = scheduler.run()
+
+    assert position(events, 'end', 'parse') < position(events, 'start', 'feeds')
+    assert position(events, 'end', 'parse') < position(events, 'start', 'pages')
+    assert position(events, 'end', 'feeds') < position(events, 'start', 'publish')
+    assert report.critical_path == ['parse', 'feeds', 'publish']
+    assert set(report.results) == {'parse', 'feeds', 'pages', 'publish'}
+
+
+def test_cycle_is_rejected():
+    noop = lambda workers: None
+    with pytest.raises(ValueError, match='cycle'):
+        StageScheduler([
+            Stage('a', noop, inputs=('y',), outputs=('x',)),
+            Stage('b', noop, inputs=('x',), outputs=('y',)),
+        ], max_workers=2)
+
+
+def test_unknown_dependency_and_unordered_writers_are_rejected():
+    noop = lambda workers: None
+    with pytest.raises(ValueError, match='unknown'):
+        StageScheduler([Stage('a', noop, deps=('missing',))], max_workers=1)
+    with pytest.raises(ValueError, match='both write'):
+        StageScheduler([
+            Stage('a', noop, outputs=('x',)),
+            Stage('b', noop, outputs=('x',)),
+        ], max_workers=1)
+
+
+def test_failure_skips_dependents():
+    events, stage = recorder()
+    scheduler = StageScheduler([
+        Stage('parse', stage('parse', fail=True), outputs=('notes',)),
+        Stage('feeds', stage('feeds'), inputs=('notes',)),
+    ], max_workers=2)
+
+    with pytest.raises(BuildError):
+        scheduler.run()
+    assert ('start', 'feeds') not in events
+
+
+def test_worker_budget_is_shared():
+    granted = {}
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def stage(name):
+        def run(workers):
+            with lock:
+                granted[name] = workers
+                running.append(workers)
+                peak.append(sum(running))
+            time.sleep(0.02)
+            with lock:
+                running.remove(workers)
+        return run
+
+    StageScheduler([
+        Stage('images', stage('images'), workers=4, cost=4.0),
+        Stage('notes', stage('notes'), workers=4),
+        Stage('assets', stage('assets')),
+    ], max_workers=4).run()
+
+    assert max(peak) <= 4
+    # 其余就绪阶段各保留一个工作位
+    assert granted['images'] == 2